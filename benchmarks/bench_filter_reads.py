@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Compares the streaming length filter in gather_filter_reads_by_length with
+the previous SeqIO based filter on the barcodes in piranha/test/pak_run.
+
+python benchmarks/bench_filter_reads.py [--repeats 5] [--readdir <demultiplexed dir>]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+from Bio import SeqIO
+
+from piranha.analysis.preprocessing import gather_filter_reads_by_length,is_fastq_file
+from piranha.utils.config import *
+
+thisdir = os.path.abspath(os.path.dirname(__file__))
+TEST_READDIR = os.path.join(thisdir,"..","piranha","test","pak_run","demultiplexed")
+
+def seqio_filter_reads_by_length(dir_in,barcode,reads_out,manifest_out,config):
+    # the filter as it was before streaming, kept here for comparison
+    fastq_records = []
+    total_reads = 0
+    with open(reads_out,"w") as fw:
+        for r,d,f in os.walk(dir_in):
+            for reads_in in f:
+                if reads_in.endswith(".fastq") or reads_in.endswith(".fq"):
+                    for record in SeqIO.parse(os.path.join(dir_in,reads_in),"fastq"):
+                        total_reads +=1
+                        length = len(record)
+                        if length > int(config[KEY_MIN_READ_LENGTH]) and length < int(config[KEY_MAX_READ_LENGTH]):
+                            fastq_records.append(record)
+        SeqIO.write(fastq_records,fw, "fastq")
+
+def count_reads(readdir):
+    total = 0
+    for r,d,f in os.walk(readdir):
+        for fn in f:
+            if is_fastq_file(fn):
+                with open(os.path.join(r,fn),"rb") as handle:
+                    total += sum(1 for l in handle)//4
+    return total
+
+def run_filter(filter_function,readdir,barcodes,tempdir,config):
+    for barcode in barcodes:
+        reads_out = os.path.join(tempdir,f"{barcode}.fastq")
+        manifest_out = os.path.join(tempdir,f"{barcode}.{READ_MANIFEST}")
+        filter_function(os.path.join(readdir,barcode),barcode,reads_out,manifest_out,config)
+
+def time_filter(filter_function,readdir,barcodes,tempdir,repeats,config):
+    best = None
+    for i in range(repeats):
+        start = time.perf_counter()
+        run_filter(filter_function,readdir,barcodes,tempdir,config)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    # separate traced run, tracemalloc slows allocation heavy code down a lot
+    tracemalloc.start()
+    run_filter(filter_function,readdir,barcodes,tempdir,config)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best,peak
+
+def main(sysargs = sys.argv[1:]):
+    parser = argparse.ArgumentParser(description="Benchmark the read length filter.")
+    parser.add_argument("--readdir",action="store",default=TEST_READDIR)
+    parser.add_argument("--repeats",action="store",type=int,default=5)
+    args = parser.parse_args(sysargs)
+
+    config = {KEY_MIN_READ_LENGTH:READ_LENGTH_DICT[VALUE_ANALYSIS_MODE_VP1][0],
+              KEY_MAX_READ_LENGTH:READ_LENGTH_DICT[VALUE_ANALYSIS_MODE_VP1][1]}
+
+    barcodes = sorted(d for d in os.listdir(args.readdir) if os.path.isdir(os.path.join(args.readdir,d)))
+    total_reads = count_reads(args.readdir)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        sys.stdout = open(os.devnull,"w")
+        results = {}
+        for name,filter_function in [("seqio",seqio_filter_reads_by_length),
+                                     ("streaming",gather_filter_reads_by_length)]:
+            results[name] = time_filter(filter_function,args.readdir,barcodes,tempdir,args.repeats,config)
+        sys.stdout = sys.__stdout__
+
+    print(f"{total_reads} reads across {len(barcodes)} barcodes, best of {args.repeats}")
+    for name in results:
+        elapsed,peak = results[name]
+        print(f"{name:>10}: {elapsed:.3f}s\t{int(total_reads/elapsed)} reads/s\tpeak {peak/1e6:.1f} MB")
+    print(f"speed up: {results['seqio'][0]/results['streaming'][0]:.1f}x")
+
+if __name__ == '__main__':
+    main()
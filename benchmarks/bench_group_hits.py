@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Times group_hits on a synthetic PAF file with millions of lines, against
+the dict based parser it replaced.
+
+python benchmarks/bench_group_hits.py [--lines 2000000] [--repeats 3] [--max-reads N]
+
+--max-reads caps the reads group_hits holds in memory, so the on-disk
+partitioned grouping can be timed too.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import functools
+import tempfile
+import collections
+import tracemalloc
+
+from piranha.analysis.preprocessing import group_hits
+from piranha.utils.config import *
+
+def write_synthetic_paf(paf_out,num_lines,seed=1):
+    # mostly unique hits, with some unmapped and some ambiguous (multi-line) reads
+    random.seed(seed)
+    refs = [(f"Poliovirus{i}-Sabin_AY1842{i:02}",900+i) for i in range(1,40)]
+    written = 0
+    read_count = 0
+    with open(paf_out,"w") as fw:
+        while written < num_lines:
+            read_count +=1
+            read_name = f"read{read_count:09}"
+            read_len = random.randint(1000,1300)
+            kind = random.random()
+            if kind < 0.1:
+                fw.write(f"{read_name}\t{read_len}\t0\t0\t*\t*\t0\t0\t0\t0\t0\t0\trl:i:0\n")
+                written +=1
+                continue
+            for i in range(3 if kind > 0.95 else 1):
+                ref,ref_len = random.choice(refs)
+                start = random.randint(0,60)
+                end = read_len - random.randint(0,60)
+                aln_len = end-start
+                direction = random.choice("+-")
+                mapq = random.choice([0,10,60,60,60])
+                fw.write(f"{read_name}\t{read_len}\t{start}\t{end}\t{direction}\t{ref}\t{ref_len}\t0\t{ref_len}\t{int(aln_len*0.9)}\t{aln_len}\t{mapq}\ttp:A:P\n")
+                written +=1
+    return read_count
+
+def dict_parse_line(line):
+    # the parser as it was before, kept here for comparison
+    values = {}
+    tokens = line.rstrip("\n").split("\t")
+    values["read_name"], values["read_len"] = tokens[:2]
+    values["read_hit_start"] = int(tokens[2])
+    values["read_hit_end"] = int(tokens[3])
+    values["direction"] = tokens[4]
+    values["ref_hit"], values["ref_len"], values["coord_start"], values["coord_end"], values["matches"], values["aln_block_len"],values["map_quality"] = tokens[5:12]
+    values["ref_len"] = int(values["ref_len"])
+    values["aln_block_len"] = int(values["aln_block_len"])
+    return values
+
+def dict_add_to_hit_dict(hits, mapping,min_map_len,min_map_quality,unmapped):
+    if mapping["direction"] in ["+","-"]:
+        if mapping["direction"] == "+":
+            start,end = mapping["read_hit_start"],mapping["read_hit_end"]
+        else:
+            start,end = mapping["read_hit_end"],mapping["read_hit_start"]
+        if int(mapping["aln_block_len"]) > min_map_len and int(mapping["map_quality"]) > min_map_quality:
+            hits[mapping["ref_hit"]].add((mapping["read_name"],start,end,mapping["aln_block_len"]))
+        else:
+            unmapped+=1
+    else:
+        unmapped+=1
+    return unmapped
+
+def dict_group_hits(paf_file,ref_name_map,len_filter,min_map_quality):
+    total_reads= 0
+    ambiguous =0
+    unmapped = 0
+    hits = collections.defaultdict(set)
+    mappings = []
+    last_mapping = None
+    with open(paf_file, "r") as f:
+        for l in f:
+            mapping = dict_parse_line(l)
+            if last_mapping:
+                if mapping["read_name"] == last_mapping["read_name"]:
+                    mappings.append(last_mapping)
+                else:
+                    mappings.append(last_mapping)
+                    if len(mappings) > 1:
+                        ambiguous +=1
+                    else:
+                        unmapped = dict_add_to_hit_dict(hits, last_mapping,len_filter,min_map_quality,unmapped)
+                    total_reads +=1
+                    mappings = []
+                    last_mapping = mapping
+            else:
+                last_mapping = mapping
+        unmapped = dict_add_to_hit_dict(hits, last_mapping,len_filter,min_map_quality,unmapped)
+        total_reads +=1
+    ref_hits = collections.defaultdict(list)
+    for ref in hits:
+        for read in hits[ref]:
+            if read[-1] > 0.6*len_filter:
+                ref_hits[ref].append(read)
+            else:
+                unmapped +=1
+    return ref_hits, unmapped, ambiguous, total_reads
+
+def time_grouping(group_function,paf_file,repeats,len_filter):
+    best = None
+    for i in range(repeats):
+        start = time.perf_counter()
+        result = group_function(paf_file,{},len_filter,VALUE_MIN_MAP_QUALITY)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    # separate traced run, tracemalloc slows allocation heavy code down a lot
+    tracemalloc.start()
+    group_function(paf_file,{},len_filter,VALUE_MIN_MAP_QUALITY)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best,peak,result
+
+def main(sysargs = sys.argv[1:]):
+    parser = argparse.ArgumentParser(description="Benchmark PAF parsing and read grouping.")
+    parser.add_argument("--lines",action="store",type=int,default=2000000)
+    parser.add_argument("--repeats",action="store",type=int,default=3)
+    parser.add_argument("--max-reads",action="store",type=int,dest="max_reads")
+    args = parser.parse_args(sysargs)
+
+    len_filter = 0.4*READ_LENGTH_DICT[VALUE_ANALYSIS_MODE_VP1][0]
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        paf_file = os.path.join(tempdir,"synthetic.paf")
+        num_reads = write_synthetic_paf(paf_file,args.lines)
+
+        results = {}
+        for name,group_function in [("dict",dict_group_hits),
+                                    ("tuple",functools.partial(group_hits,max_reads=args.max_reads))]:
+            results[name] = time_grouping(group_function,paf_file,args.repeats,len_filter)
+
+    print(f"{args.lines} paf lines, {num_reads} reads, best of {args.repeats}")
+    for name in results:
+        elapsed,peak,result = results[name]
+        ref_hits,unmapped,ambiguous,total_reads = result
+        print(f"{name:>6}: {elapsed:.3f}s\t{int(args.lines/elapsed)} lines/s\tpeak {peak/1e6:.1f} MB\t"
+              f"unmapped {unmapped} ambiguous {ambiguous} total {total_reads}")
+    print(f"speed up: {results['dict'][0]/results['tuple'][0]:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Times the analysis steps piranha spends most of its python time in, on synthetic inputs over
+a grid of read counts, reference lengths (VP1 and whole genome) and numbers of variants, and
+compares the results with a stored baseline.
+
+python benchmarks/bench_hot_paths.py [--reads 200 1000] [--modes vp1 wg] [--variants 5 50]
+                                     [--functions pileupper ...] [--repeats 3]
+                                     [--output results.json] [--baseline benchmarks/baseline.json]
+                                     [--save-baseline] [--tolerance 0.25]
+
+Exits 1 if any case is slower or uses more memory than its baseline by more than the tolerance.
+Timings are machine specific, so make the baseline with --save-baseline on the machine the
+comparison runs on.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import itertools
+import contextlib
+import tracemalloc
+from Bio import AlignIO
+
+from piranha import __version__
+from piranha.analysis.preprocessing import gather_filter_reads_by_length,group_hits,write_out_fastqs
+from piranha.analysis.consensus_functions import find_variants,id_reference_cns,ref_dict_maker,pileupper,calculate_coocc_json
+from piranha.analysis.clean_gaps import clean_medaka_cns,trim_trailing_gaps
+from piranha.analysis.get_haplotypes import get_variation_pcent
+from piranha.report.make_report import make_sample_report
+from piranha.input_parsing.initialising import get_defaults
+from piranha.utils.config import *
+
+import synthetic_data
+
+thisdir = os.path.abspath(os.path.dirname(__file__))
+BASELINE = os.path.join(thisdir,"baseline.json")
+# differences smaller than this are timer noise whatever the tolerance
+NOISE_SECONDS = 0.005
+NOISE_MB = 0.5
+
+"""
+Each case makes its inputs in a directory of its own and returns the call to time.
+"""
+
+def case_gather_filter_reads_by_length(workdir,reads,mode):
+    ref_id,display_name,reference = synthetic_data.load_reference(mode)
+    readdir = os.path.join(workdir,"reads")
+    os.mkdir(readdir)
+    synthetic_data.write_fastq(os.path.join(readdir,"reads.fastq"),reference,reads,mode)
+    min_length,max_length = READ_LENGTH_DICT[mode]
+    config = {KEY_MIN_READ_LENGTH:min_length,KEY_MAX_READ_LENGTH:max_length}
+    return lambda: gather_filter_reads_by_length(readdir,"barcode01",os.path.join(workdir,"filtered.fastq"),
+                                                    os.path.join(workdir,"manifest.csv"),config)
+
+def case_group_hits(workdir,reads,mode):
+    ref_id,display_name,reference = synthetic_data.load_reference(mode)
+    read_names = synthetic_data.write_fastq(os.path.join(workdir,"reads.fastq"),reference,reads,mode)
+    paf_file = os.path.join(workdir,"reads.paf")
+    synthetic_data.write_paf(paf_file,read_names,ref_id,len(reference))
+    len_filter = 0.4*READ_LENGTH_DICT[mode][0]
+    return lambda: group_hits(paf_file,{},len_filter,VALUE_MIN_MAP_QUALITY)
+
+def case_write_out_fastqs(workdir,reads,mode):
+    ref_id,display_name,reference = synthetic_data.load_reference(mode)
+    fastq = os.path.join(workdir,"reads.fastq")
+    read_names = synthetic_data.write_fastq(fastq,reference,reads,mode)
+    hits_csv = os.path.join(workdir,"hits.csv")
+    refs_csv = os.path.join(workdir,"refs.csv")
+    synthetic_data.write_hits(hits_csv,refs_csv,read_names,ref_id,display_name)
+    outdir = os.path.join(workdir,"out")
+    os.mkdir(outdir)
+    config = {KEY_MIN_READS:0,KEY_MIN_PCENT:0,KEY_MAX_READS:VALUE_MAX_READS,KEY_COMPRESS_INTERMEDIATES:False}
+    return lambda: write_out_fastqs(refs_csv,hits_csv,fastq,outdir,VALUE_PRIMER_LENGTH,config)
+
+def write_case_alignment(workdir,mode,variants):
+    ref_id,display_name,reference = synthetic_data.load_reference(mode)
+    aln_file = os.path.join(workdir,"aln.fasta")
+    synthetic_data.write_alignment(aln_file,*synthetic_data.make_alignment(reference,variants))
+    return aln_file
+
+def case_find_variants(workdir,mode,variants):
+    ref_seq,cns_seq = id_reference_cns(write_case_alignment(workdir,mode,variants))
+    return lambda: find_variants(ref_seq,cns_seq)
+
+def case_clean_medaka_cns(workdir,mode,variants):
+    aln_file = write_case_alignment(workdir,mode,variants)
+    return lambda: clean_medaka_cns("sample",aln_file,os.path.join(workdir,"cleaned.fasta"))
+
+def case_trim_trailing_gaps(workdir,mode,variants):
+    alignment = AlignIO.read(write_case_alignment(workdir,mode,variants),KEY_FASTA)
+    return lambda: trim_trailing_gaps(alignment)
+
+def write_case_bam(workdir,reads,mode,variants):
+    ref_id,display_name,reference = synthetic_data.load_reference(mode)
+    var_dict = synthetic_data.variant_sites(reference,variants)
+    read_seqs = synthetic_data.sample_reads(synthetic_data.make_consensus(reference,var_dict),var_dict,reads)
+    ref_file = os.path.join(workdir,"reference.fasta")
+    synthetic_data.write_reference(ref_file,ref_id,display_name,reference)
+    bam_file = os.path.join(workdir,"reads.bam")
+    synthetic_data.write_bam(bam_file,ref_id,read_seqs)
+    return bam_file,ref_dict_maker(ref_file),var_dict
+
+def case_pileupper(workdir,reads,mode,variants):
+    bam_file,ref_dict,var_dict = write_case_bam(workdir,reads,mode,variants)
+    return lambda: pileupper(bam_file,ref_dict,var_dict)
+
+def case_calculate_coocc_json(workdir,reads,mode,variants):
+    bam_file,ref_dict,var_dict = write_case_bam(workdir,reads,mode,variants)
+    variation_info,read_vars = pileupper(bam_file,ref_dict,var_dict)
+    return lambda: calculate_coocc_json(var_dict,read_vars)
+
+def case_get_variation_pcent(workdir,reads,mode):
+    ref_id,display_name,reference = synthetic_data.load_reference(mode)
+    ref_file = os.path.join(workdir,"reference.fasta")
+    synthetic_data.write_reference(ref_file,ref_id,display_name,reference)
+    reads_file = os.path.join(workdir,"reads.fasta")
+    synthetic_data.write_read_fasta(reads_file,synthetic_data.sample_reads(reference,{},reads))
+    return lambda: get_variation_pcent(ref_file,reads_file)
+
+def case_make_sample_report(workdir,mode,variants):
+    # the inputs of one barcode with one reference, the variation from 200 reads
+    barcode = "barcode01"
+    ref_id,display_name,reference = synthetic_data.load_reference(mode)
+    bam_file,ref_dict,var_dict = write_case_bam(workdir,200,mode,variants)
+    variation_info,read_vars = pileupper(bam_file,ref_dict,var_dict)
+    variation_file = os.path.join(workdir,"variation.json")
+    with open(variation_file,"w") as fw:
+        json.dump({ref_id:{"variation":variation_info,"coocc":calculate_coocc_json(var_dict,read_vars)}},fw)
+
+    var_string = ";".join(f"{site}:{var_dict[site][0]}{var_dict[site][1]}" for site in var_dict)
+    consensus_file = os.path.join(workdir,"consensus.fasta")
+    with open(consensus_file,"w") as fw:
+        fw.write(f">sample|{barcode}|{display_name}|{ref_id}|{len(var_dict)}|{var_string}\n"
+                 f"{synthetic_data.make_consensus(reference,var_dict)}\n")
+
+    masked_file = os.path.join(workdir,"masked_variants.csv")
+    with open(masked_file,"w") as fw:
+        fw.write(f"{KEY_REFERENCE},{KEY_SITE},variant\n")
+        site = list(var_dict)[0]
+        fw.write(f"{ref_id},{site},{site}:{var_dict[site][0]}{var_dict[site][1]}\n")
+
+    snipit_dir = os.path.join(workdir,barcode,"snipit")
+    os.makedirs(snipit_dir)
+    with open(os.path.join(snipit_dir,f"{ref_id}.svg"),"w") as fw:
+        fw.write('<svg xmlns="http://www.w3.org/2000/svg" width="100" height="10"></svg>\n')
+
+    config = get_defaults()
+    config.update({barcode:[ref_id],KEY_TEMPDIR:workdir,KEY_ANALYSIS_MODE:mode,
+                   KEY_BARCODE_REPORT_TEMPLATE:os.path.join(synthetic_data.DATA_DIR,"english_barcode_report.mako")})
+    return lambda: make_sample_report(os.path.join(workdir,"report.html"),variation_file,consensus_file,masked_file,barcode,config)
+
+# function name to (case, the grid parameters its inputs depend on)
+CASES = {
+    "gather_filter_reads_by_length":(case_gather_filter_reads_by_length,["reads","mode"]),
+    "group_hits":(case_group_hits,["reads","mode"]),
+    "write_out_fastqs":(case_write_out_fastqs,["reads","mode"]),
+    "find_variants":(case_find_variants,["mode","variants"]),
+    "clean_medaka_cns":(case_clean_medaka_cns,["mode","variants"]),
+    "trim_trailing_gaps":(case_trim_trailing_gaps,["mode","variants"]),
+    "pileupper":(case_pileupper,["reads","mode","variants"]),
+    "calculate_coocc_json":(case_calculate_coocc_json,["reads","mode","variants"]),
+    "get_variation_pcent":(case_get_variation_pcent,["reads","mode"]),
+    "make_sample_report":(case_make_sample_report,["mode","variants"])
+}
+
+def case_id(function,params):
+    return f"{function}[" + ",".join(f"{key}={params[key]}" for key in params) + "]"
+
+def make_grid(function,grid):
+    # only the parameters the function depends on, so no case is timed twice
+    keys = CASES[function][1]
+    for values in itertools.product(*[grid[key] for key in keys]):
+        yield dict(zip(keys,values))
+
+def time_case(call,repeats):
+    best = None
+    for i in range(repeats):
+        start = time.perf_counter()
+        call()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    # separate traced run, tracemalloc slows allocation heavy code down a lot
+    tracemalloc.start()
+    call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best,peak
+
+def run_cases(functions,grid,repeats):
+    results = {}
+    for function in functions:
+        case,keys = CASES[function]
+        for params in make_grid(function,grid):
+            with tempfile.TemporaryDirectory() as workdir:
+                with open(os.devnull,"w") as devnull, contextlib.redirect_stdout(devnull):
+                    call = case(workdir,**params)
+                    seconds,peak = time_case(call,repeats)
+            results[case_id(function,params)] = {"function":function,"params":params,
+                                                 "seconds":round(seconds,5),"peak_mb":round(peak/1e6,3)}
+            print(f"{case_id(function,params)}: {seconds:.4f}s\tpeak {peak/1e6:.1f} MB")
+    return results
+
+def compare_to_baseline(results,baseline,tolerance):
+    # returns the cases that got slower or bigger than the tolerance allows
+    regressions = []
+    for case in results:
+        if case not in baseline:
+            continue
+        for key,noise in [("seconds",NOISE_SECONDS),("peak_mb",NOISE_MB)]:
+            new = results[case][key]
+            old = baseline[case][key]
+            if new > old*(1+tolerance) and new - old > noise:
+                regressions.append(f"{case} {key}: {old} -> {new} ({100*(new-old)/old:+.0f}%)")
+    return regressions
+
+def main(sysargs = sys.argv[1:]):
+    parser = argparse.ArgumentParser(description="Benchmark the analysis hot paths against a stored baseline.")
+    parser.add_argument("--reads",action="store",type=int,nargs="+",default=[200,1000])
+    parser.add_argument("--modes",action="store",nargs="+",default=[VALUE_ANALYSIS_MODE_VP1,VALUE_ANALYSIS_MODE_WG],
+                        choices=[VALUE_ANALYSIS_MODE_VP1,VALUE_ANALYSIS_MODE_WG])
+    parser.add_argument("--variants",action="store",type=int,nargs="+",default=[5,50])
+    parser.add_argument("--functions",action="store",nargs="+",default=list(CASES),choices=list(CASES))
+    parser.add_argument("--repeats",action="store",type=int,default=3)
+    parser.add_argument("--output",action="store",help="Write the results to this JSON file")
+    parser.add_argument("--baseline",action="store",default=BASELINE)
+    parser.add_argument("--save-baseline",action="store_true",dest="save_baseline",
+                        help="Write the results as the new baseline instead of comparing with it")
+    parser.add_argument("--tolerance",action="store",type=float,default=0.25,
+                        help="Fraction slower or bigger than the baseline allowed. Default: 0.25")
+    args = parser.parse_args(sysargs)
+
+    grid = {"reads":args.reads,"mode":args.modes,"variants":args.variants}
+    run = {"version":__version__,
+           "python":platform.python_version(),
+           "platform":platform.platform(),
+           "date":time.strftime("%Y-%m-%d %H:%M:%S"),
+           "repeats":args.repeats,
+           "results":run_cases(args.functions,grid,args.repeats)}
+
+    if args.output:
+        with open(args.output,"w") as fw:
+            json.dump(run,fw,indent=1)
+
+    if args.save_baseline:
+        with open(args.baseline,"w") as fw:
+            json.dump(run,fw,indent=1)
+        print(f"baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}, run with --save-baseline to make one")
+        return
+    with open(args.baseline,"r") as f:
+        baseline = json.load(f)
+    missing = [case for case in run["results"] if case not in baseline["results"]]
+    regressions = compare_to_baseline(run["results"],baseline["results"],args.tolerance)
+    print(f"compared with the baseline from {baseline['date']} (piranha {baseline['version']}), "
+          f"{len(run['results'])-len(missing)} cases, {len(missing)} not in the baseline")
+    if regressions:
+        print(f"{len(regressions)} regressions over {int(args.tolerance*100)}%:")
+        for regression in regressions:
+            print(f"\t{regression}")
+        sys.exit(1)
+    print("no regressions")
+
+if __name__ == '__main__':
+    main()
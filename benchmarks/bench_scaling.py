@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Runs piranha end to end on simulated runs of increasing size and reports the wall time, read
+throughput and peak memory of the run and of each of its steps, for sizing hardware.
+
+python benchmarks/bench_scaling.py [--scales 8x1000 24x10000 96x100000] [-m vp1] [-t 8]
+                                   [--piranha-args "--single-dag"] [--workdir DIR]
+                                   [--output scaling.json]
+
+A scale is <barcodes>x<reads per barcode>, simulated with simulate_reads.py. The steps are
+taken from the run's run_timeline.json: a step's wall time is the time any of its jobs was
+running, its throughput is reads per second of job time, so per thread, and its peak memory
+is the largest of its jobs, as snakemake measured it. The peak memory of the run is that of
+the largest piranha process.
+
+Needs minimap2, medaka and the other dependencies on the PATH, as for a real run. Keeps the
+simulated runs and piranha output only when given --workdir.
+"""
+import os
+import sys
+import json
+import time
+import shlex
+import argparse
+import tempfile
+import platform
+import subprocess
+
+from piranha import __version__
+from piranha.utils.config import *
+
+import simulate_reads
+
+thisdir = os.path.abspath(os.path.dirname(__file__))
+
+def parse_scale(scale):
+    try:
+        barcodes,reads = scale.lower().split("x")
+        return int(barcodes),int(reads)
+    except ValueError:
+        sys.stderr.write(f"Error: scale `{scale}` should be <barcodes>x<reads per barcode>, e.g. 96x100000.\n")
+        sys.exit(-1)
+
+def simulate(rundir,barcodes,reads,args):
+    sim_args = ["-o",rundir,"-m",args.analysis_mode,"--barcodes",str(barcodes),"--reads",str(reads),
+                "--error-rate",str(args.error_rate),"--threads",str(args.threads),"--seed",str(args.seed)]
+    return simulate_reads.simulate_run(simulate_reads.set_up_args(simulate_reads.make_parser().parse_args(sim_args)))
+
+def run_piranha(rundir,args):
+    # wall time, exit code and the peak RSS of the largest process piranha ran
+    outdir = os.path.join(rundir,"piranha_output")
+    command = [sys.executable,"-m","piranha.command","-i",os.path.join(rundir,"demultiplexed"),
+               "-b",os.path.join(rundir,"barcodes.csv"),"-o",outdir,"--overwrite",
+               "-t",str(args.threads),"-m",args.analysis_mode] + shlex.split(args.piranha_args)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([os.path.join(thisdir,".."),env.get("PYTHONPATH","")])
+    with open(os.path.join(rundir,"piranha.log"),"w") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command,stdout=log,stderr=subprocess.STDOUT,env=env)
+        # wait4 rather than wait, for the resource use of this run's processes alone
+        pid,status,rusage = os.wait4(process.pid,0)
+        elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in KB on linux
+    return outdir,process.returncode,elapsed,rusage.ru_maxrss/1e3
+
+def busy_time(intervals):
+    # time at least one of the jobs was running, overlapping jobs counted once
+    busy = 0
+    running_until = None
+    for start,end in sorted(intervals):
+        if running_until is None or start > running_until:
+            busy += end - start
+            running_until = end
+        elif end > running_until:
+            busy += end - running_until
+            running_until = end
+    return busy
+
+def summarise_steps(timeline_file,total_reads):
+    with open(timeline_file,"r") as f:
+        jobs = json.load(f)["jobs"]
+    steps = {}
+    for job in jobs:
+        step = steps.setdefault(job[KEY_RULE],{"intervals":[],"job_seconds":0,"cpu_time":0,"max_rss_mb":0})
+        step["intervals"].append((job["start"],job["end"]))
+        step["job_seconds"] += job["seconds"] or 0
+        step["cpu_time"] += job["cpu_time"] or 0
+        step["max_rss_mb"] = max(step["max_rss_mb"],job["max_rss_mb"] or 0)
+
+    summary = []
+    for rule in steps:
+        step = steps[rule]
+        summary.append({KEY_RULE:rule,
+                        "jobs":len(step["intervals"]),
+                        "wall_time":round(busy_time(step["intervals"]),2),
+                        "job_seconds":round(step["job_seconds"],2),
+                        "cpu_time":round(step["cpu_time"],2),
+                        "max_rss_mb":round(step["max_rss_mb"],2),
+                        # per job slot, so it scales with -t
+                        "reads_per_second":round(total_reads/step["job_seconds"],1) if step["job_seconds"] else None})
+    return sorted(summary,key=lambda row: row["job_seconds"],reverse=True)
+
+def run_scale(workdir,scale,args):
+    barcodes,reads = parse_scale(scale)
+    rundir = os.path.join(workdir,f"{barcodes}x{reads}")
+    start = time.perf_counter()
+    total_reads = simulate(rundir,barcodes,reads,args)
+    simulate_seconds = time.perf_counter() - start
+
+    outdir,returncode,wall_time,peak_rss = run_piranha(rundir,args)
+    result = {"barcodes":barcodes,
+              "reads_per_barcode":reads,
+              "total_reads":total_reads,
+              "simulate_seconds":round(simulate_seconds,2),
+              "returncode":returncode,
+              "wall_time":round(wall_time,2),
+              "reads_per_second":round(total_reads/wall_time,1),
+              "peak_rss_mb":round(peak_rss,1),
+              "steps":[]}
+    timeline_file = os.path.join(outdir,RUN_TIMELINE)
+    if returncode != 0 or not os.path.exists(timeline_file):
+        sys.stderr.write(f"piranha failed at {scale}, see {os.path.join(rundir,'piranha.log')}\n")
+        return result
+    result["steps"] = summarise_steps(timeline_file,total_reads)
+    return result
+
+def print_result(scale,result):
+    print(f"{scale}: {result['total_reads']} reads in {result['wall_time']:.1f}s, "
+          f"{result['reads_per_second']:.0f} reads/s, peak {result['peak_rss_mb']:.0f} MB")
+    for step in result["steps"]:
+        throughput = f"{step['reads_per_second']:.0f} reads/s" if step["reads_per_second"] else "-"
+        print(f"\t{step[KEY_RULE]:<32}{step['jobs']:>6} jobs\t{step['wall_time']:>8.1f}s wall\t{step['job_seconds']:>8.1f}s jobs\t"
+              f"{step['cpu_time']:>8.1f}s cpu\t{step['max_rss_mb']:>8.0f} MB\t{throughput}")
+
+def main(sysargs = sys.argv[1:]):
+    parser = argparse.ArgumentParser(description="Benchmark piranha end to end on simulated runs of increasing size.")
+    parser.add_argument("--scales",action="store",nargs="+",default=["8x1000","24x10000","96x100000"])
+    parser.add_argument("-m","--analysis-mode",action="store",dest="analysis_mode",default=VALUE_ANALYSIS_MODE_VP1,
+                        choices=list(simulate_reads.synthetic_data.REFERENCE_FILES))
+    parser.add_argument("-t","--threads",action="store",type=int,default=os.cpu_count())
+    parser.add_argument("--error-rate",action="store",type=float,default=0.06,dest="error_rate")
+    parser.add_argument("--piranha-args",action="store",default="",dest="piranha_args",
+                        help="Options to add to every piranha run, in quotes")
+    parser.add_argument("--workdir",action="store",help="Keep the simulated runs and piranha output here")
+    parser.add_argument("--output",action="store",help="Write the results to this JSON file")
+    parser.add_argument("--seed",action="store",type=int,default=1)
+    args = parser.parse_args(sysargs)
+
+    for scale in args.scales:
+        parse_scale(scale)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tempdir:
+        workdir = os.path.abspath(args.workdir) if args.workdir else tempdir
+        for scale in args.scales:
+            results[scale] = run_scale(workdir,scale,args)
+            print_result(scale,results[scale])
+
+    if args.output:
+        with open(args.output,"w") as fw:
+            json.dump({"version":__version__,
+                       "platform":platform.platform(),
+                       "cpus":os.cpu_count(),
+                       "date":time.strftime("%Y-%m-%d %H:%M:%S"),
+                       "analysis_mode":args.analysis_mode,
+                       "threads":args.threads,
+                       "piranha_args":args.piranha_args,
+                       "scales":results},fw,indent=1)
+
+if __name__ == '__main__':
+    main()
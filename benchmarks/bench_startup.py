@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Times how long piranha takes to start: `piranha --help`, and a run on piranha/test/pak_run
+up to the moment snakemake starts its first job, with an empty tool cache and then with
+the tool cache from the run before.
+
+python benchmarks/bench_startup.py [--repeats 5]
+
+Needs minimap2, medaka and the other dependencies on the PATH, as for a real run.
+"""
+import os
+import re
+import sys
+import time
+import signal
+import argparse
+import tempfile
+import subprocess
+
+thisdir = os.path.abspath(os.path.dirname(__file__))
+TEST_RUN = os.path.join(thisdir,"..","piranha","test","pak_run")
+FIRST_JOB = re.compile(r"^(local)?rule \w+:")
+
+def piranha_command(args):
+    return [sys.executable,"-m","piranha.command"] + args
+
+def time_help(repeats,env):
+    best = None
+    for i in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(piranha_command(["--help"]),stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL,env=env,check=True)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def time_to_first_job(outdir,env):
+    # --verbose so snakemake prints each job as it starts, the run is stopped at the first one
+    args = ["-i",os.path.join(TEST_RUN,"demultiplexed"),"-b",os.path.join(TEST_RUN,"barcodes.csv"),
+            "-o",outdir,"--overwrite","-t","1","--verbose"]
+    start = time.perf_counter()
+    process = subprocess.Popen(piranha_command(args),stdout=subprocess.PIPE,stderr=subprocess.STDOUT,
+                                env=env,start_new_session=True,text=True)
+    elapsed = None
+    for line in process.stdout:
+        if FIRST_JOB.match(line):
+            elapsed = time.perf_counter() - start
+            break
+    os.killpg(process.pid,signal.SIGTERM)
+    process.wait()
+    if elapsed is None:
+        sys.stderr.write("piranha exited before starting a job, check it runs on the test data.\n")
+        sys.exit(-1)
+    return elapsed
+
+def main(sysargs = sys.argv[1:]):
+    parser = argparse.ArgumentParser(description="Benchmark piranha start up.")
+    parser.add_argument("--repeats",action="store",type=int,default=5)
+    args = parser.parse_args(sysargs)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        # a tool cache of its own, so the first run starts from nothing
+        env = dict(os.environ,XDG_CACHE_HOME=os.path.join(tempdir,"cache"))
+        env["PYTHONPATH"] = os.pathsep.join([os.path.join(thisdir,".."),env.get("PYTHONPATH","")])
+        outdir = os.path.join(tempdir,"output")
+
+        help_time = time_help(args.repeats,env)
+        cold = time_to_first_job(outdir,env)
+        warm = min(time_to_first_job(outdir,env) for i in range(args.repeats))
+
+    print(f"piranha --help: {help_time:.2f}s (best of {args.repeats})")
+    print(f"to first snakemake job, empty tool cache: {cold:.2f}s")
+    print(f"to first snakemake job, with tool cache: {warm:.2f}s (best of {args.repeats})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Simulates a demultiplexed nanopore run from the piranha reference files, laid out as MinKNOW
+writes it (<outdir>/demultiplexed/barcodeNN/fastq_runid_<runid>_N.fastq) with a matching
+<outdir>/barcodes.csv, for trying piranha at plate sizes and read depths beyond the test data.
+
+python benchmarks/simulate_reads.py -o simulated_run [-m vp1] [--barcodes 96] [--reads 100000]
+                                    [--error-rate 0.06] [--length-mean N] [--length-sd N]
+                                    [--mixtures Sabin1-related Sabin2-related:0.8,NonPolioEV:0.2 ...]
+                                    [--threads 4] [--gzip] [--seed 1]
+
+Each sample is one of --mixtures in turn, reference groups from the reference file with the
+fraction of reads from each. For each sample a reference is picked from every group in its
+mixture and given --snps substitutions, and reads are windows of it, flanked up to the read
+length for VP1, on either strand, with substitutions, deletions and homopolymer insertions at
+--error-rate. --fragment-fraction of reads are short fragments the length filter removes and
+--background of them random sequence that maps to nothing. The last two barcodes are a
+positive control (NonPolioEV) and a negative control with --negative-reads reads of
+background, named `positive` and `negative` so piranha finds them.
+simulated_samples.csv records what went into each barcode.
+"""
+import os
+import sys
+import csv
+import gzip
+import uuid
+import argparse
+import collections
+import multiprocessing
+import numpy as np
+from Bio import SeqIO
+
+from piranha.utils.config import *
+
+import synthetic_data
+
+DEFAULT_MIXTURES = ["Sabin1-related","Sabin2-related","Sabin3-related",
+                    "Sabin1-related:0.5,Sabin3-related:0.5",
+                    "Sabin2-related:0.8,NonPolioEV:0.2",
+                    "WPV1","WPV1:0.6,NonPolioEV:0.4","NonPolioEV"]
+# share of the errors that are substitutions, deletions and insertions
+ERROR_PROFILE = [0.4,0.35,0.25]
+MIN_FRAGMENT = 100
+
+BASES = np.frombuffer(b"ACGT",dtype=np.uint8)
+BASE_INDEX = np.zeros(256,dtype=np.uint8)
+COMPLEMENT = np.frombuffer(bytes(range(256)),dtype=np.uint8).copy()
+for i,base in enumerate(b"ACGT"):
+    BASE_INDEX[base] = i
+    COMPLEMENT[base] = b"TGCA"[i]
+
+def load_reference_groups(analysis_mode):
+    # display name to the sequences of that reference group, as (id, sequence)
+    groups = collections.defaultdict(list)
+    for record in SeqIO.parse(os.path.join(synthetic_data.DATA_DIR,synthetic_data.REFERENCE_FILES[analysis_mode]),KEY_FASTA):
+        for field in record.description.split(" "):
+            if field.startswith("display_name="):
+                groups[field.split("=")[1]].append((record.id,str(record.seq).upper()))
+    return groups
+
+def parse_mixture(mixture,groups):
+    # "Sabin2-related:0.8,NonPolioEV:0.2" -> [("Sabin2-related",0.8),("NonPolioEV",0.2)]
+    components = []
+    for component in mixture.split(","):
+        group,_,fraction = component.partition(":")
+        if group not in groups:
+            sys.stderr.write(f"Error: no reference group `{group}` in the reference file, options are {', '.join(sorted(groups))}.\n")
+            sys.exit(-1)
+        components.append((group,float(fraction) if fraction else 1.0))
+    return components
+
+def random_bases(length,rng):
+    return BASES[rng.integers(0,4,length)]
+
+def mutate(seq,snps,rng):
+    seq = np.frombuffer(seq.encode(),dtype=np.uint8).copy()
+    sites = rng.choice(len(seq),size=min(snps,len(seq)),replace=False)
+    seq[sites] = BASES[(BASE_INDEX[seq[sites]] + rng.integers(1,4,len(sites))) % 4]
+    return seq
+
+def add_errors(seq,error_rate,rng):
+    draw = rng.random(len(seq))
+    sub_end = error_rate*ERROR_PROFILE[0]
+    del_end = sub_end + error_rate*ERROR_PROFILE[1]
+    subs = draw < sub_end
+    seq = seq.copy()
+    seq[subs] = BASES[(BASE_INDEX[seq[subs]] + rng.integers(1,4,subs.sum())) % 4]
+    # deleted bases are written 0 times, inserted ones twice, as homopolymer errors are
+    counts = np.ones(len(seq),dtype=np.int64)
+    counts[(draw >= sub_end) & (draw < del_end)] = 0
+    counts[(draw >= del_end) & (draw < error_rate)] = 2
+    return np.repeat(seq,counts)
+
+def read_length(args,rng):
+    if rng.random() < args.fragment_fraction:
+        return int(rng.integers(MIN_FRAGMENT,args.min_length))
+    return max(MIN_FRAGMENT,int(rng.normal(args.length_mean,args.length_sd)))
+
+def simulate_read(template,args,rng):
+    length = min(read_length(args,rng),len(template))
+    start = rng.integers(0,len(template)-length+1)
+    seq = template[start:start+length]
+    if rng.random() < 0.5:
+        seq = COMPLEMENT[seq[::-1]]
+    read = add_errors(seq,args.error_rate,rng)
+    qual = np.clip(rng.normal(args.mean_quality,4,len(read)),3,40).astype(np.uint8) + 33
+    return read.tobytes(),qual.tobytes()
+
+def sample_templates(components,groups,flank_left,flank_right,args,rng):
+    # one strain per group in the sample, flanked out to the amplicon the reads come from
+    templates = []
+    for group,fraction in components:
+        ref_id,seq = groups[group][rng.integers(0,len(groups[group]))]
+        template = np.concatenate([flank_left,mutate(seq,args.snps,rng),flank_right])
+        templates.append((group,ref_id,fraction,template))
+    return templates
+
+def write_barcode(task):
+    barcode,sample,mixture,num_reads,args = task
+    rng = np.random.default_rng([args.seed,int(barcode[len("barcode"):])])
+    groups = load_reference_groups(args.analysis_mode)
+    flank_rng = np.random.default_rng(args.seed)
+    flank_length = max(0,int(args.length_mean + 3*args.length_sd - max(len(groups[g][0][1]) for g in groups))//2)
+    flank_left,flank_right = random_bases(flank_length,flank_rng),random_bases(flank_length,flank_rng)
+
+    templates = sample_templates(parse_mixture(mixture,groups),groups,flank_left,flank_right,args,rng) if mixture else []
+    background = args.background if templates else 1.0
+    total = sum(template[2] for template in templates)
+    fractions = [(1-background)*template[2]/total for template in templates]
+    counts = rng.multinomial(num_reads,fractions + [background])
+    sources = np.repeat(np.arange(len(counts)),counts)
+    rng.shuffle(sources)
+
+    barcode_dir = os.path.join(args.outdir,"demultiplexed",barcode)
+    os.makedirs(barcode_dir,exist_ok=True)
+    ext = ".fastq.gz" if args.gzip else ".fastq"
+    handle = None
+    for i,source in enumerate(sources):
+        if i % args.reads_per_file == 0:
+            if handle:
+                handle.close()
+            reads_out = os.path.join(barcode_dir,f"fastq_runid_{args.runid}_{i//args.reads_per_file}{ext}")
+            handle = gzip.open(reads_out,"wb",compresslevel=1) if args.gzip else open(reads_out,"wb")
+        if source < len(templates):
+            template = templates[source][3]
+        else:
+            template = random_bases(int(args.length_mean),rng)
+        seq,qual = simulate_read(template,args,rng)
+        name = uuid.UUID(bytes=rng.bytes(16))
+        handle.write(f"@{name} runid={args.runid} read={i} ch={rng.integers(1,513)} barcode={barcode}\n".encode()
+                     + seq + b"\n+\n" + qual + b"\n")
+    if handle:
+        handle.close()
+
+    rows = []
+    for i,(group,ref_id,fraction,template) in enumerate(templates):
+        rows.append({KEY_BARCODE:barcode,KEY_SAMPLE:sample,KEY_REFERENCE_GROUP:group,KEY_REFERENCE:ref_id,
+                     "reads":counts[i],"snps":args.snps})
+    rows.append({KEY_BARCODE:barcode,KEY_SAMPLE:sample,KEY_REFERENCE_GROUP:"background",KEY_REFERENCE:"",
+                 "reads":counts[-1],"snps":""})
+    return rows
+
+def make_samples(args):
+    # (barcode, sample, mixture, reads), the controls last
+    rng = np.random.default_rng(args.seed)
+    samples = []
+    num_samples = args.barcodes - (0 if args.no_controls else 2)
+    for i in range(num_samples):
+        num_reads = int(args.reads*rng.uniform(1-args.read_spread,1+args.read_spread))
+        samples.append([f"sample{i+1:03}",args.mixtures[i % len(args.mixtures)],num_reads])
+    if not args.no_controls:
+        samples.append([VALUE_POSITIVE,"NonPolioEV",args.reads])
+        samples.append([VALUE_NEGATIVE,None,args.negative_reads])
+    return [(f"barcode{i+1:02}",*sample) for i,sample in enumerate(samples)]
+
+def simulate_run(args):
+    samples = make_samples(args)
+    with open(os.path.join(args.outdir,"barcodes.csv"),"w") as fw:
+        fw.write("barcode,sample\n")
+        for barcode,sample,mixture,num_reads in samples:
+            fw.write(f"{barcode},{sample}\n")
+
+    tasks = [(barcode,sample,mixture,num_reads,args) for barcode,sample,mixture,num_reads in samples]
+    with multiprocessing.Pool(args.threads) as pool:
+        rows = [row for barcode_rows in pool.imap(write_barcode,tasks) for row in barcode_rows]
+
+    with open(os.path.join(args.outdir,"simulated_samples.csv"),"w") as fw:
+        writer = csv.DictWriter(fw,fieldnames=list(rows[0]),lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+    return sum(sample[3] for sample in samples)
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Simulate a demultiplexed nanopore run from the piranha references.")
+    parser.add_argument("-o","--outdir",action="store",required=True)
+    parser.add_argument("-m","--analysis-mode",action="store",dest="analysis_mode",default=VALUE_ANALYSIS_MODE_VP1,
+                        choices=list(synthetic_data.REFERENCE_FILES))
+    parser.add_argument("--barcodes",action="store",type=int,default=96,help="Barcodes, controls included. Default: 96")
+    parser.add_argument("--reads",action="store",type=int,default=100000,help="Reads per barcode. Default: 100000")
+    parser.add_argument("--read-spread",action="store",type=float,default=0.2,dest="read_spread",
+                        help="Barcodes get up to this fraction more or fewer reads. Default: 0.2")
+    parser.add_argument("--error-rate",action="store",type=float,default=0.06,dest="error_rate")
+    parser.add_argument("--length-mean",action="store",type=float,dest="length_mean",
+                        help="Default: the middle of the read length filter of the analysis mode")
+    parser.add_argument("--length-sd",action="store",type=float,dest="length_sd",
+                        help="Default: a sixth of the read length filter of the analysis mode")
+    parser.add_argument("--fragment-fraction",action="store",type=float,default=0.05,dest="fragment_fraction")
+    parser.add_argument("--background",action="store",type=float,default=0.02)
+    parser.add_argument("--snps",action="store",type=int,default=10,help="Substitutions from the reference in each sample. Default: 10")
+    parser.add_argument("--mixtures",action="store",nargs="+",default=DEFAULT_MIXTURES)
+    parser.add_argument("--no-controls",action="store_true",dest="no_controls")
+    parser.add_argument("--negative-reads",action="store",type=int,default=5,dest="negative_reads")
+    parser.add_argument("--reads-per-file",action="store",type=int,default=4000,dest="reads_per_file")
+    parser.add_argument("--gzip",action="store_true")
+    parser.add_argument("--threads",action="store",type=int,default=1)
+    parser.add_argument("--seed",action="store",type=int,default=1)
+    return parser
+
+def set_up_args(args):
+    min_length,max_length = READ_LENGTH_DICT[args.analysis_mode]
+    args.min_length = min_length
+    if args.length_mean is None:
+        args.length_mean = (min_length + max_length)/2
+    if args.length_sd is None:
+        args.length_sd = (max_length - min_length)/6
+    args.mean_quality = max(3,-10*np.log10(args.error_rate)) if args.error_rate else 40
+    args.runid = uuid.UUID(bytes=np.random.default_rng(args.seed).bytes(16)).hex
+    os.makedirs(args.outdir,exist_ok=True)
+    return args
+
+def main(sysargs = sys.argv[1:]):
+    args = set_up_args(make_parser().parse_args(sysargs))
+    total_reads = simulate_run(args)
+    print(f"{args.barcodes} barcodes, {total_reads} reads written to {args.outdir}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Synthetic inputs for the benchmarks, made from the piranha reference files so sequence
+composition and lengths are those of real VP1 and whole genome runs. Everything is seeded,
+so the same arguments always give the same files.
+"""
+import os
+import random
+import pysam
+from Bio import SeqIO
+
+from piranha.utils.config import *
+
+thisdir = os.path.abspath(os.path.dirname(__file__))
+DATA_DIR = os.path.join(thisdir,"..","piranha","data")
+REFERENCE_FILES = {VALUE_ANALYSIS_MODE_VP1:REFERENCE_SEQUENCES_FILE_VP1,
+                   VALUE_ANALYSIS_MODE_WG:REFERENCE_SEQUENCES_FILE_WG}
+BASES = "ACGT"
+QUALITY = 20
+
+def load_reference(analysis_mode,display_name="Sabin1-related"):
+    # the first reference of the group, as (id, display name, sequence)
+    for record in SeqIO.parse(os.path.join(DATA_DIR,REFERENCE_FILES[analysis_mode]),KEY_FASTA):
+        if f"display_name={display_name}" in record.description:
+            return record.id,display_name,str(record.seq).upper()
+    raise ValueError(f"No {display_name} reference in {REFERENCE_FILES[analysis_mode]}")
+
+def substitute(base,rng):
+    return rng.choice([b for b in BASES if b != base])
+
+def variant_sites(reference,num_variants,seed=1):
+    # 1-based positions, kept away from the ends so trimming never removes them
+    rng = random.Random(seed)
+    sites = rng.sample(range(50,len(reference)-50),num_variants)
+    return {site:[reference[site-1],substitute(reference[site-1],rng)] for site in sorted(sites)}
+
+def make_consensus(reference,variants):
+    consensus = list(reference)
+    for site in variants:
+        consensus[site-1] = variants[site][1]
+    return "".join(consensus)
+
+def make_alignment(reference,num_variants,seed=1):
+    # reference and consensus as an aligned pair, with the SNPs of variant_sites, an indel
+    # for every ten variants and gaps at both ends of the consensus as medaka leaves them
+    rng = random.Random(seed)
+    variants = variant_sites(reference,num_variants,seed)
+    ref_aln = list(reference)
+    cns_aln = list(make_consensus(reference,variants))
+    for i in range(max(1,num_variants//10)):
+        site = rng.randrange(60,len(reference)-60)
+        length = rng.choice([1,2,3])
+        if i % 2:
+            cns_aln[site:site+length] = ["-"]*length
+        else:
+            ref_aln[site:site+length] = ["-"]*length
+    for i in range(rng.randint(5,20)):
+        cns_aln[i] = "-"
+    for i in range(rng.randint(5,20)):
+        cns_aln[-(i+1)] = "-"
+    return "".join(ref_aln),"".join(cns_aln)
+
+def write_alignment(aln_out,ref_aln,cns_aln,sample="sample"):
+    with open(aln_out,"w") as fw:
+        fw.write(f">reference\n{ref_aln}\n>{sample}\n{cns_aln}\n")
+
+def write_reference(ref_out,ref_id,display_name,reference):
+    with open(ref_out,"w") as fw:
+        fw.write(f">{ref_id} display_name={display_name}\n{reference}\n")
+
+def add_errors(seq,error_rate,rng):
+    # substitutions only, so reads stay aligned to the reference base for base
+    return "".join(substitute(base,rng) if rng.random() < error_rate else base for base in seq)
+
+def sample_reads(consensus,variants,num_reads,alt_fraction=0.7,error_rate=0.05,seed=1):
+    # full length reads, each carrying the alt allele at a variant site with alt_fraction
+    rng = random.Random(seed)
+    reads = []
+    for i in range(num_reads):
+        read = list(add_errors(consensus,error_rate,rng))
+        for site in variants:
+            if rng.random() > alt_fraction:
+                read[site-1] = variants[site][0]
+        reads.append("".join(read))
+    return reads
+
+def read_length(min_length,max_length,rng):
+    # most reads inside the length filter, some on either side of it
+    if rng.random() < 0.15:
+        return rng.choice([rng.randint(200,min_length-1),rng.randint(max_length+1,max_length+500)])
+    return rng.randint(min_length,max_length)
+
+def write_fastq(fastq_out,reference,num_reads,analysis_mode,error_rate=0.05,seed=1):
+    # reads of the length distribution of the analysis mode, tiled from the reference
+    rng = random.Random(seed)
+    min_length,max_length = READ_LENGTH_DICT[analysis_mode]
+    amplicon = reference
+    while len(amplicon) < max_length + 500:
+        amplicon += reference
+    names = []
+    with open(fastq_out,"w") as fw:
+        for i in range(num_reads):
+            length = read_length(min_length,max_length,rng)
+            start = rng.randint(0,len(amplicon)-length)
+            seq = add_errors(amplicon[start:start+length],error_rate,rng)
+            qual = "".join(chr(33 + rng.randint(8,30)) for j in range(length))
+            name = f"read{i:08}"
+            names.append((name,length))
+            fw.write(f"@{name} runid=synthetic\n{seq}\n+\n{qual}\n")
+    return names
+
+def write_paf(paf_out,reads,ref_id,ref_length,seed=1):
+    # one line per read in fastq order: a few unmapped, most mapped with full length blocks
+    rng = random.Random(seed)
+    with open(paf_out,"w") as fw:
+        for name,length in reads:
+            if rng.random() < 0.05:
+                fw.write(f"{name}\t{length}\t0\t0\t*\t*\t0\t0\t0\t0\t0\t0\trl:i:0\n")
+                continue
+            start = rng.randint(0,30)
+            end = length - rng.randint(0,30)
+            aln_len = end - start
+            fw.write(f"{name}\t{length}\t{start}\t{end}\t{rng.choice('+-')}\t{ref_id}\t{ref_length}\t0\t{ref_length}\t{int(aln_len*0.9)}\t{aln_len}\t60\ttp:A:P\n")
+
+def write_hits(hits_out,refs_out,reads,ref_id,display_name,barcode="barcode01"):
+    # what assess_broad_diversity hands write_out_fastqs: every read a hit to the one reference
+    with open(hits_out,"w") as fw:
+        fw.write("read_name,hit,start,end,aln_block_len\n")
+        for name,length in reads:
+            fw.write(f"{name},{ref_id},0,{length},{length}\n")
+    with open(refs_out,"w") as fw:
+        fw.write(",".join(SAMPLE_HIT_HEADER_FIELDS) + "\n")
+        fw.write(f"{barcode},{ref_id},{display_name},{len(reads)},100.0\n")
+
+def write_bam(bam_out,ref_id,reads):
+    # reads aligned end to end against the reference, sorted and indexed for pysam pileups
+    header = {"HD":{"VN":"1.0","SO":"coordinate"},"SQ":[{"SN":ref_id,"LN":len(reads[0])}]}
+    with pysam.AlignmentFile(bam_out,"wb",header=header) as fw:
+        for i,read in enumerate(reads):
+            segment = pysam.AlignedSegment()
+            segment.query_name = f"read{i:08}"
+            segment.query_sequence = read
+            segment.flag = 0
+            segment.reference_id = 0
+            segment.reference_start = 0
+            segment.mapping_quality = 60
+            segment.cigartuples = [(0,len(read))]
+            segment.query_qualities = pysam.qualitystring_to_array(chr(33 + QUALITY)*len(read))
+            fw.write(segment)
+    pysam.index(bam_out)
+
+def write_read_fasta(fasta_out,reads):
+    with open(fasta_out,"w") as fw:
+        for i,read in enumerate(reads):
+            fw.write(f">read{i:08}\n{read}\n")
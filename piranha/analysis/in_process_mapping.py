@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import sys
+import threading
+import itertools
+import collections
+import concurrent.futures
+
+from piranha.analysis.preprocessing import open_fastq_bytes,iter_fastq_records,add_to_hit_dict,make_ref_display_name_map,report_barcode_hits
+from piranha.utils.log_colours import cyan
+from piranha.utils.config import *
+
+def iter_read_batches(reads_in,batch_size):
+    with open_fastq_bytes(reads_in) as handle:
+        # read name as minimap2 reports it, the header up to the first whitespace
+        records = ((header[1:].split(None,1)[0].decode(),seq.rstrip().decode()) for header,seq,plus,qual in iter_fastq_records(handle))
+        while True:
+            batch = list(itertools.islice(records,batch_size))
+            if not batch:
+                return
+            yield batch
+
+class BatchMapper():
+    # the index is loaded once and shared, each thread maps with its own buffer
+    # (mappy releases the GIL while mapping)
+    def __init__(self,index):
+        import mappy
+        self.mappy = mappy
+        self.aligner = mappy.Aligner(fn_idx_in=index,preset=VALUE_MINIMAP2_PRESET)
+        if not self.aligner:
+            sys.stderr.write(cyan(f"Error: mappy could not load the reference index {index}.\n"))
+            sys.exit(-1)
+        self.local = threading.local()
+
+    def map_batch(self,batch):
+        if not hasattr(self.local,"buffer"):
+            self.local.buffer = self.mappy.ThreadBuffer()
+        mapped = []
+        for read_name,seq in batch:
+            # primary and supplementary alignments, as minimap2 --secondary=no
+            hits = [hit for hit in self.aligner.map(seq,buf=self.local.buffer) if hit.is_primary]
+            mapped.append((read_name,len(seq),hits))
+        return mapped
+
+def map_batches(mapper,batches,threads):
+    # results come back in input order, with at most two batches per thread in flight
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        pending = collections.deque()
+        for batch in batches:
+            pending.append(executor.submit(mapper.map_batch,batch))
+            if len(pending) >= 2*threads:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def hit_to_mapping(read_name,hit):
+    # same fields as preprocessing.parse_line takes from a paf line
+    direction = "+" if hit.strand == 1 else "-"
+    return (read_name,hit.q_st,hit.q_en,direction,hit.ctg,hit.blen,hit.mapq)
+
+def write_paf_lines(fw,read_name,read_len,hits):
+    if not hits:
+        fw.write(f"{read_name}\t{read_len}\t0\t0\t*\t*\t0\t0\t0\t0\t0\t0\n")
+    for hit in hits:
+        fw.write(f"{read_name}\t{read_len}\t{hit}\n")
+
+def map_and_group_reads(reads_in,index,len_filter,min_map_quality,threads,paf_out=None):
+    # the in-process equivalent of mapping to a paf file and running group_hits on it
+    total_reads= 0
+    ambiguous =0
+    unmapped = 0
+    hits = collections.defaultdict(set)
+
+    mapper = BatchMapper(index)
+    paf = open(paf_out,"w") if paf_out else None
+    try:
+        for mapped in map_batches(mapper,iter_read_batches(reads_in,VALUE_MAPPY_BATCH_SIZE),threads):
+            for read_name,read_len,read_hits in mapped:
+                if paf:
+                    write_paf_lines(paf,read_name,read_len,read_hits)
+                if not read_hits:
+                    unmapped = add_to_hit_dict(hits,(read_name,0,0,"*","*",0,0),len_filter,min_map_quality,unmapped)
+                elif len(read_hits) == 1:
+                    unmapped = add_to_hit_dict(hits,hit_to_mapping(read_name,read_hits[0]),len_filter,min_map_quality,unmapped)
+                else:
+                    ambiguous +=1
+                total_reads +=1
+    finally:
+        if paf:
+            paf.close()
+
+    ref_hits = collections.defaultdict(list)
+    for ref in hits:
+        ref_hits[ref] = list(hits[ref])
+
+    return ref_hits, unmapped, ambiguous, total_reads
+
+def map_reads_in_process(reads_in,
+                        csv_out,
+                        hits_out,
+                        reference_catalogue,
+                        barcode,
+                        index,
+                        min_map_quality,
+                        config,
+                        threads=1,
+                        paf_out=None):
+
+    ref_name_map = make_ref_display_name_map(reference_catalogue)
+    len_filter = 0.4*config[KEY_MIN_READ_LENGTH]
+
+    ref_hits, unmapped,ambiguous, total_reads = map_and_group_reads(reads_in,index,len_filter,min_map_quality,threads,paf_out)
+
+    report_barcode_hits(ref_name_map,csv_out,hits_out,ref_hits,unmapped,ambiguous,total_reads,barcode)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+import os
+import sys
+import copy
+import time
+import yaml
+import shutil
+import subprocess
+import collections
+
+from piranha.analysis.preprocessing import *
+from piranha.analysis.stool_functions import gather_fasta_files,get_sample
+from piranha.report.make_report import make_output_report
+from piranha.utils.log_colours import green,cyan,yellow
+from piranha.utils.resources import barcode_share
+from piranha.utils.config import *
+
+class BarcodeHits():
+    # running totals over the chunks seen so far, as parse_paf_file would count them for the whole barcode
+    def __init__(self):
+        self.hits = collections.defaultdict(list)
+        self.unmapped = 0
+        self.ambiguous = 0
+        self.total_reads = 0
+
+    def add(self,ref_hits,unmapped,ambiguous,total_reads):
+        for ref in ref_hits:
+            self.hits[ref].extend(ref_hits[ref])
+        self.unmapped += unmapped
+        self.ambiguous += ambiguous
+        self.total_reads += total_reads
+
+def find_new_chunks(readdir,barcodes,seen,processed):
+    # a chunk is only picked up once its size and mtime are unchanged between two scans,
+    # so files still being written by MinKNOW are left for the next scan
+    ready = []
+    for barcode in barcodes:
+        barcode_dir = os.path.join(readdir,barcode)
+        if not os.path.isdir(barcode_dir):
+            continue
+        for reads_in in sorted(os.listdir(barcode_dir)):
+            path = os.path.join(barcode_dir,reads_in)
+            if not is_fastq_file(reads_in) or path in processed:
+                continue
+            stat = os.stat(path)
+            if seen.get(path) == (stat.st_size,stat.st_mtime):
+                ready.append((barcode,path))
+            else:
+                seen[path] = (stat.st_size,stat.st_mtime)
+    return ready
+
+def is_run_finished(readdir):
+    # MinKNOW writes final_summary_*.txt to the run directory once sequencing stops
+    for run_dir in [readdir,os.path.dirname(readdir)]:
+        for fn in os.listdir(run_dir):
+            if fn.startswith("final_summary"):
+                return True
+    return False
+
+def map_chunk(reads_in,paf_out,log,config):
+    command = ["minimap2","-t",str(config[KEY_THREADS]),"-x",VALUE_MINIMAP2_PRESET,"--secondary=no","--paf-no-hit",
+                config[KEY_REFERENCE_INDEX],reads_in,"-o",paf_out]
+    with open(log,"a") as log_handle:
+        result = subprocess.run(command,stdout=log_handle,stderr=log_handle)
+    if result.returncode != 0:
+        sys.stderr.write(cyan(f"Error: minimap2 failed on {reads_in}, see {log}.\n"))
+        sys.exit(-1)
+
+def process_chunk(barcode,reads_in,live_dir,barcode_hits,ref_name_map,config):
+    # filter and map one new chunk, then add its hits to the barcode's running totals
+    barcode_dir = os.path.join(live_dir,barcode)
+    chunk_fastq = os.path.join(barcode_dir,"chunk.fastq")
+    chunk_paf = os.path.join(barcode_dir,"chunk.paf")
+
+    with open(chunk_fastq,"wb") as fw:
+        total,passed,length_hist,quality_hist = filter_fastq_file(reads_in,fw,int(config[KEY_MIN_READ_LENGTH]),int(config[KEY_MAX_READ_LENGTH]))
+
+    if passed:
+        map_chunk(chunk_fastq,chunk_paf,os.path.join(live_dir,"logs",f"{barcode}.minimap2.log"),config)
+        len_filter = 0.4*config[KEY_MIN_READ_LENGTH]
+        barcode_hits[barcode].add(*group_hits(chunk_paf,ref_name_map,len_filter,config[KEY_MIN_MAP_QUALITY]))
+
+        with open(os.path.join(barcode_dir,"filtered_reads.fastq"),"ab") as fw:
+            with open(chunk_fastq,"rb") as f:
+                shutil.copyfileobj(f,fw)
+
+    print(green(f"{barcode}:") + f" {passed} of {total} reads passed in {os.path.basename(reads_in)}")
+
+def start_consensus(barcode,live_dir,barcode_config,consensus_snakefile,cores,config):
+    # consensus on the reads so far, run in the background while watching carries on
+    barcode_dir = os.path.join(live_dir,barcode)
+    groups_dir = os.path.join(barcode_dir,"reference_groups")
+    if not os.path.exists(groups_dir):
+        os.mkdir(groups_dir)
+
+    to_write = write_out_fastqs(os.path.join(barcode_dir,"refs_present.csv"),
+                                os.path.join(barcode_dir,"hits_reads.csv"),
+                                os.path.join(barcode_dir,"filtered_reads.fastq"),
+                                groups_dir,config[KEY_PRIMER_LENGTH],barcode_config)
+    write_out_ref_fasta(to_write,config[KEY_REFERENCE_CATALOGUE],groups_dir)
+
+    barcode_yaml = os.path.join(barcode_dir,PREPROCESSING_CONFIG)
+    with open(barcode_yaml,"w") as fw:
+        yaml.dump(barcode_config,fw)
+
+    sample = get_sample(config[KEY_BARCODES_CSV],barcode)
+    print(green(f"Starting consensus for {sample} ({barcode})"))
+    command = ["snakemake","--nolock","--snakefile",consensus_snakefile,
+                "--forceall","--rerun-incomplete",
+                "--configfile",barcode_yaml,
+                "--config",f"barcode={barcode}",f"outdir={barcode_dir}",f"tempdir={barcode_dir}",f"sample={sample}",
+                "--cores",str(cores)]
+    with open(os.path.join(live_dir,"logs",f"{barcode}_consensus.smk.log"),"w") as log_handle:
+        return subprocess.Popen(command,stdout=log_handle,stderr=subprocess.STDOUT,cwd=barcode_dir)
+
+def refresh_live_report(live_dir,barcode_hits,ref_name_map,finished,config):
+    report_files = []
+    for barcode in config[KEY_BARCODES]:
+        csv_out = os.path.join(live_dir,barcode,"refs_present.csv")
+        hits = barcode_hits[barcode]
+        write_out_barcode_hits(ref_name_map,csv_out,os.path.join(live_dir,barcode,"hits_reads.csv"),
+                                hits.hits,hits.unmapped,hits.total_reads,barcode)
+        report_files.append(csv_out)
+
+    # diversity_report and make_output_report both change the config they're given
+    live_config = copy.deepcopy(config)
+    composition = os.path.join(config[KEY_TEMPDIR],SAMPLE_COMPOSITION)
+    summary = os.path.join(config[KEY_TEMPDIR],PREPROCESSING_SUMMARY)
+    barcode_config = diversity_report(report_files,composition,summary,config[KEY_REFERENCE_SEQUENCES],live_config)
+
+    consensus_seqs = os.path.join(live_dir,SAMPLE_SEQS)
+    cns_files = [os.path.join(live_dir,barcode,"consensus_sequences.fasta") for barcode in finished]
+    gather_fasta_files(composition,config[KEY_BARCODES_CSV],cns_files,config[KEY_ALL_METADATA],consensus_seqs,os.path.join(live_dir,"published_data"))
+
+    make_output_report(os.path.join(config[KEY_OUTDIR],OUTPUT_REPORT),config[KEY_BARCODES_CSV],summary,composition,consensus_seqs,
+                        os.path.join(config[KEY_OUTDIR],"detailed_run_report.csv"),copy.deepcopy(barcode_config))
+    return barcode_config
+
+def watch_run(consensus_snakefile,config):
+    # follows the read directory until the run finishes (or nothing new arrives for the timeout),
+    # the full analysis is then run as normal on everything that was written
+    live_dir = os.path.join(config[KEY_TEMPDIR],"live")
+    for barcode in config[KEY_BARCODES] + ["logs"]:
+        os.makedirs(os.path.join(live_dir,barcode),exist_ok=True)
+
+    ref_name_map = make_ref_display_name_map(config[KEY_REFERENCE_CATALOGUE])
+    barcode_hits = {barcode:BarcodeHits() for barcode in config[KEY_BARCODES]}
+    seen = {}
+    processed = set()
+    consensus_runs = {}
+    waiting = []
+    done = set()
+    # each live consensus gets a share of the threads, and only as many run at once as the threads allow
+    consensus_cores = barcode_share(config[KEY_THREADS],config[KEY_BARCODES])
+    max_running = max(1,config[KEY_THREADS]//consensus_cores)
+    barcode_config = None
+    finished = []
+
+    print(green("Watching for new reads in:") + f" {config[KEY_READDIR]}")
+    print(yellow("-----------------------"))
+    last_new_reads = time.time()
+    last_refresh = 0
+    updated = False
+    try:
+        while True:
+            for barcode,reads_in in find_new_chunks(config[KEY_READDIR],config[KEY_BARCODES],seen,processed):
+                process_chunk(barcode,reads_in,live_dir,barcode_hits,ref_name_map,config)
+                processed.add(reads_in)
+                last_new_reads = time.time()
+                updated = True
+
+            for barcode in consensus_runs:
+                if barcode not in done and consensus_runs[barcode].poll() is not None:
+                    done.add(barcode)
+                    if consensus_runs[barcode].returncode == 0:
+                        finished.append(barcode)
+                        updated = True
+                    else:
+                        print(cyan(f"Warning: live consensus failed for {barcode}, it will be run again at the end of the run."))
+
+            if updated and time.time() - last_refresh > config[KEY_WATCH_INTERVAL]:
+                barcode_config = refresh_live_report(live_dir,barcode_hits,ref_name_map,finished,config)
+                last_refresh = time.time()
+                updated = False
+
+                # consensus starts once for each barcode, as soon as it has a reference passing the read thresholds
+                for barcode in barcode_config[KEY_BARCODES]:
+                    if barcode not in consensus_runs and barcode not in waiting:
+                        waiting.append(barcode)
+
+            while waiting and len(consensus_runs) - len(done) < max_running:
+                barcode = waiting.pop(0)
+                consensus_runs[barcode] = start_consensus(barcode,live_dir,barcode_config,consensus_snakefile,consensus_cores,config)
+
+            if is_run_finished(config[KEY_READDIR]):
+                print(green("Sequencing run finished."))
+                break
+            if time.time() - last_new_reads > config[KEY_WATCH_TIMEOUT]*60:
+                print(cyan(f"No new reads for {config[KEY_WATCH_TIMEOUT]} minutes, stopping watching."))
+                break
+            time.sleep(VALUE_WATCH_POLL)
+    except KeyboardInterrupt:
+        print(cyan("\nStopped watching."))
+
+    for barcode in consensus_runs:
+        if consensus_runs[barcode].poll() is None:
+            consensus_runs[barcode].terminate()
+            consensus_runs[barcode].wait()
+
+    print(green("Running the full analysis on all reads."))
+    print(yellow("-----------------------"))
@@ -1,145 +1,322 @@
 #!/usr/bin/env python3
 import csv
-from Bio import SeqIO
 import collections
 from piranha.utils.config import *
 import os
+import sys
 import gzip
 import io
+import shutil
+import tempfile
+import subprocess
+import threading
+import math
+import heapq
+import multiprocessing
+from piranha.analysis.read_manifest import write_read_manifest,mean_quality,ReadStats
+from piranha.utils.reference_cache import load_reference_catalogue
+from piranha.utils.compressed_io import open_output,open_text,intermediate_ext
 from piranha.utils.log_colours import green,cyan,red
 
-def gather_filter_reads_by_length(dir_in,barcode,reads_out,config):
+def open_fastq_bytes(reads_in):
+    if reads_in.endswith(".gz") or reads_in.endswith(".gzip"):
+        return io.BufferedReader(gzip.open(reads_in, "rb"))
+    return open(reads_in, "rb")
+
+def iter_fastq_records(handle):
+    # raw four-line fastq reader, yields the original bytes of each record
+    for header,seq,plus,qual in zip(handle,handle,handle,handle):
+        if not qual.endswith(b"\n"):
+            qual += b"\n"
+        yield header,seq,plus,qual
+
+def filter_fastq_file(reads_in,fw,min_length,max_length):
+    # also summarises the length and mean quality of every read for the read manifest
+    total_reads = 0
+    passed_reads = 0
+    read_stats = ReadStats()
+    with open_fastq_bytes(reads_in) as handle:
+        for header,seq,plus,qual in iter_fastq_records(handle):
+            length = len(seq.rstrip())
+            total_reads +=1
+            read_stats.add(length,qual)
+            if length > min_length and length < max_length:
+                passed_reads +=1
+                fw.write(header+seq+plus+qual)
+    return (total_reads,passed_reads) + read_stats.histograms()
+
+def is_fastq_file(reads_in):
+    for ending in [".gz",".gzip",".fastq",".fq"]:
+        if reads_in.endswith(ending):
+            return True
+    return False
+
+def filter_fastq_file_to_part(part_args):
+    reads_in,part_out,min_length,max_length = part_args
+    with open(part_out,"wb") as fw:
+        return filter_fastq_file(reads_in,fw,min_length,max_length)
+
+def parallel_filter_fastq_files(read_files,fw,min_length,max_length,threads,tempdir):
+    # each worker filters (and decompresses) its own chunk files to a part file,
+    # parts are then copied to fw in input order so output matches the serial filter
+    # the part files go even if a worker fails
+    with tempfile.TemporaryDirectory(dir=tempdir) as part_dir:
+        part_files = [os.path.join(part_dir,f"{i}.part") for i in range(len(read_files))]
+        part_args = [(reads_in,part_out,min_length,max_length) for reads_in,part_out in zip(read_files,part_files)]
+
+        # forkserver workers don't inherit the caller's threads or pipes (e.g. minimap2's stdin)
+        with multiprocessing.get_context("forkserver").Pool(min(threads,len(read_files))) as pool:
+            file_stats = pool.map(filter_fastq_file_to_part,part_args)
+
+        for part_out in part_files:
+            with open(part_out,"rb") as f:
+                shutil.copyfileobj(f,fw)
+
+    return file_stats
+
+def get_read_files(dir_in):
+    read_files = []
+    for r,d,f in os.walk(dir_in):
+        for reads_in in f:
+            if is_fastq_file(reads_in):
+                read_files.append(os.path.join(dir_in,reads_in))
+    return read_files
+
+def filter_reads_to_handle(read_files,fw,min_length,max_length,threads,tempdir):
+    # returns the filter stats of each read file, in order
+    if threads > 1 and len(read_files) > 1:
+        return parallel_filter_fastq_files(read_files,fw,min_length,max_length,threads,tempdir)
+    file_stats = []
+    for reads_in in read_files:
+        file_stats.append(filter_fastq_file(reads_in,fw,min_length,max_length))
+    return file_stats
+
+def report_filtered_reads(barcode,read_files,file_stats,manifest_out):
+    write_read_manifest(manifest_out,read_files,file_stats)
+
+    print(green(f"Total reads {barcode}:"),sum([i[0] for i in file_stats]))
+    print(green(f"Total passed reads {barcode}:"),sum([i[1] for i in file_stats]))
+
+def gather_filter_reads_by_length(dir_in,barcode,reads_out,manifest_out,config,threads=1):
 
     if not os.path.exists(dir_in):
         os.mkdir(dir_in)
 
-    fastq_records = []
+    read_files = get_read_files(dir_in)
 
-    total_reads = 0
-    with open(reads_out,"w") as fw:
-        for r,d,f in os.walk(dir_in):
-            for reads_in in f:
-                if reads_in.endswith(".gz") or reads_in.endswith(".gzip"):
-                    with gzip.open(os.path.join(dir_in,reads_in), "rt") as handle:
-                        for record in SeqIO.parse(handle, "fastq"):
-                            total_reads +=1
-                            length = len(record)
-                            if length > int(config[KEY_MIN_READ_LENGTH]) and length < int(config[KEY_MAX_READ_LENGTH]):
-                                fastq_records.append(record)
-                                
-
-                elif reads_in.endswith(".fastq") or reads_in.endswith(".fq"):
-                    for record in SeqIO.parse(os.path.join(dir_in,reads_in),"fastq"):
-                        total_reads +=1
-                        length = len(record)
-                        if length > int(config[KEY_MIN_READ_LENGTH]) and length < int(config[KEY_MAX_READ_LENGTH]):
-                            fastq_records.append(record)
-
-        print(green(f"Total reads {barcode}:"),total_reads)
-        print(green(f"Total passed reads {barcode}:"),len(fastq_records))
-        SeqIO.write(fastq_records,fw, "fastq")
-
-def make_ref_display_name_map(references):
-    ref_map = {}
-    for record in SeqIO.parse(references,KEY_FASTA):
-        display_name = ""
-        for item in str(record.description).split(" "):
-            if item.startswith("display_name"):
-                display_name = item.split("=")[1]
-        ref_map[record.id] = display_name
-    
-    return ref_map
+    with open_output(reads_out) as fw:
+        file_stats = filter_reads_to_handle(read_files,fw,int(config[KEY_MIN_READ_LENGTH]),int(config[KEY_MAX_READ_LENGTH]),threads,os.path.dirname(reads_out))
 
+    report_filtered_reads(barcode,read_files,file_stats,manifest_out)
 
-def parse_line(line):
-    values = {}
-    tokens = line.rstrip("\n").split("\t")
-    values["read_name"], values["read_len"] = tokens[:2]
-
-    values["read_hit_start"] = int(tokens[2])
-    values["read_hit_end"] = int(tokens[3])
-    values["direction"] = tokens[4]
-    values["ref_hit"], values["ref_len"], values["coord_start"], values["coord_end"], values["matches"], values["aln_block_len"],values["map_quality"] = tokens[5:12]
-    
-    values["ref_len"] = int(values["ref_len"])
-    values["aln_block_len"] = int(values["aln_block_len"])
+class TeeWriter():
+    def __init__(self,*handles):
+        self.handles = handles
 
-    return values
+    def write(self,data):
+        for handle in self.handles:
+            handle.write(data)
 
-def add_to_hit_dict(hits, mapping,min_map_len,min_map_quality,unmapped):
-    if mapping["direction"] == "+":
-        start = mapping["read_hit_start"]
-        end = mapping["read_hit_end"]
-        if int(mapping["aln_block_len"]) > min_map_len and int(mapping["map_quality"]) > min_map_quality:
-            hits[mapping["ref_hit"]].add((mapping["read_name"],start,end,mapping["aln_block_len"]))
-        else:
-            unmapped+=1
-    elif mapping["direction"] == "-":
-        start = mapping["read_hit_end"]
-        end = mapping["read_hit_start"]
-        if int(mapping["aln_block_len"]) > min_map_len and int(mapping["map_quality"]) > min_map_quality:
-            hits[mapping["ref_hit"]].add((mapping["read_name"],start,end,mapping["aln_block_len"]))
-        else:
-            unmapped+=1
-    else:
-        unmapped+=1
-    return unmapped
+def gather_filter_map_reads(dir_in,barcode,reads_out,manifest_out,paf_out,reference,log,config,threads=1):
+    # filtered reads go straight into minimap2's stdin, with a bgzipped copy
+    # kept for write_out_fastqs
+    if not os.path.exists(dir_in):
+        os.mkdir(dir_in)
 
+    read_files = get_read_files(dir_in)
+
+    command = ["minimap2","-t",str(threads),"-x",VALUE_MINIMAP2_PRESET,"--secondary=no","--paf-no-hit",
+                reference,"-"]
+    compress_paf = paf_out.endswith(".gz")
+    if not compress_paf:
+        command += ["-o",paf_out]
+    with open(log,"w") as log_handle:
+        minimap2 = subprocess.Popen(command,stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE if compress_paf else log_handle,stderr=log_handle)
+        if compress_paf:
+            paf_handle = open_output(paf_out)
+            paf_writer = threading.Thread(target=shutil.copyfileobj,args=(minimap2.stdout,paf_handle))
+            paf_writer.start()
+        try:
+            with open_output(reads_out) as fq:
+                file_stats = filter_reads_to_handle(read_files,TeeWriter(minimap2.stdin,fq),
+                                                                    int(config[KEY_MIN_READ_LENGTH]),int(config[KEY_MAX_READ_LENGTH]),threads,os.path.dirname(reads_out))
+        finally:
+            minimap2.stdin.close()
+            if compress_paf:
+                paf_writer.join()
+                paf_handle.close()
+        if minimap2.wait() != 0:
+            raise subprocess.CalledProcessError(minimap2.returncode," ".join(command))
+
+    report_filtered_reads(barcode,read_files,file_stats,manifest_out)
+
+def feed_tagged_reads(fastqs,barcodes,handle,errors):
+    # prefix each read name with its barcode, `|` can't appear in barcode names (input_qc);
+    # stdin is always closed so minimap2 finishes, errors are handed back to the caller
+    try:
+        for reads_in,barcode in zip(fastqs,barcodes):
+            tag = f"@{barcode}|".encode()
+            with open_fastq_bytes(reads_in) as f:
+                for header,seq,plus,qual in iter_fastq_records(f):
+                    handle.write(tag+header[1:]+seq+plus+qual)
+    except BrokenPipeError:
+        # minimap2 exited early, its return code is checked by the caller
+        pass
+    except Exception as e:
+        errors.append(e)
+    finally:
+        try:
+            handle.close()
+        except BrokenPipeError:
+            pass
+
+def batch_map_reads(fastqs,barcodes,pafs,reference,log,threads=1):
+    # one minimap2 process (and one index load) for every barcode,
+    # the paf stream is split back out into per-barcode files on the read name tag
+    command = ["minimap2","-t",str(threads),"-x",VALUE_MINIMAP2_PRESET,"--secondary=no","--paf-no-hit",
+                reference,"-"]
+    handle_dict = {}
+    try:
+        for barcode,paf_out in zip(barcodes,pafs):
+            handle_dict[barcode.encode()] = open_output(paf_out)
+
+        with open(log,"w") as log_handle:
+            minimap2 = subprocess.Popen(command,stdin=subprocess.PIPE,stdout=subprocess.PIPE,stderr=log_handle)
+            errors = []
+            feeder = threading.Thread(target=feed_tagged_reads,args=(fastqs,barcodes,minimap2.stdin,errors))
+            feeder.start()
+            try:
+                for line in minimap2.stdout:
+                    barcode,paf_line = line.split(b"|",1)
+                    handle_dict[barcode].write(paf_line)
+            finally:
+                feeder.join()
+                returncode = minimap2.wait()
+            if errors:
+                raise errors[0]
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode," ".join(command))
+    finally:
+        for barcode in handle_dict:
+            handle_dict[barcode].close()
+
+def make_ref_display_name_map(reference_catalogue):
+    return dict(load_reference_catalogue(reference_catalogue)[KEY_DISPLAY_NAMES])
 
 
-def group_hits(paf_file,ref_name_map,len_filter,min_map_quality):
+def parse_line(line):
+    # only the columns group_hits uses, integers converted once:
+    # read_name, read_hit_start, read_hit_end, direction, ref_hit, aln_block_len, map_quality
+    tokens = line.split("\t",12)
+    if tokens[4] == "*":
+        return (tokens[0],0,0,"*",tokens[5],0,0)
+    # the reference names repeat across reads, so they're shared rather than one string per read
+    return (tokens[0],int(tokens[2]),int(tokens[3]),tokens[4],sys.intern(tokens[5]),int(tokens[10]),int(tokens[11]))
+
+def add_to_hit_dict(hits, mapping,min_map_len,min_map_quality,unmapped):
+    read_name,read_hit_start,read_hit_end,direction,ref_hit,aln_block_len,map_quality = mapping
+
+    if aln_block_len > min_map_len and map_quality > min_map_quality:
+        if direction == "+":
+            hits[ref_hit].add((read_name,read_hit_start,read_hit_end,aln_block_len))
+            return unmapped
+        elif direction == "-":
+            hits[ref_hit].add((read_name,read_hit_end,read_hit_start,aln_block_len))
+            return unmapped
+    return unmapped + 1
+
+def group_read_name(group):
+    return group if isinstance(group,str) else group[0]
+
+def add_to_read_groups(read_groups,collisions,read_name,line):
+    # keyed on a 64 bit hash of the read name: the parsed first paf line of a read is kept,
+    # and replaced by the bare read name once a second line marks the read ambiguous
+    key = hash(read_name)
+    group = read_groups.get(key)
+    if group is None:
+        read_groups[key] = parse_line(line)
+    elif group_read_name(group) == read_name:
+        read_groups[key] = read_name
+    else:
+        # two different reads share a hash, fall back to the full name for this one
+        group = collisions.get(read_name)
+        collisions[read_name] = parse_line(line) if group is None else read_name
+
+def group_paf_lines(lines,max_reads=None):
+    read_groups = {}
+    collisions = {}
+    consumed = 0
+    for line in lines:
+        consumed += len(line)
+        add_to_read_groups(read_groups,collisions,line[:line.index("\t")],line)
+        if max_reads and len(read_groups) > max_reads:
+            return None,None,consumed
+    return read_groups,collisions,consumed
+
+def partition_paf_file(paf_file,num_partitions,tempdir):
+    # all lines of a read land in the same partition
+    partition_files = [os.path.join(tempdir,f"{i}.paf") for i in range(num_partitions)]
+    handles = [open(partition,"w") for partition in partition_files]
+    with open_text(paf_file) as f:
+        for line in f:
+            handles[hash(line[:line.index("\t")]) % num_partitions].write(line)
+    for handle in handles:
+        handle.close()
+    return partition_files
+
+def iter_read_groups(paf_file,max_reads=None):
+    # yields the parsed paf line of every read, or its name if ambiguous, whatever the input order;
+    # if there are more than max_reads reads the paf is split on disk by read name hash and grouped a partition at a time
+    with open(paf_file,"rb") as raw:
+        if paf_file.endswith(".gz"):
+            f = io.TextIOWrapper(gzip.GzipFile(fileobj=raw))
+        else:
+            f = io.TextIOWrapper(raw)
+        read_groups,collisions,consumed = group_paf_lines(f,max_reads)
+        # bytes of the file on disk read so far, so the partition count also holds for compressed pafs
+        consumed = raw.tell()
+
+    if read_groups is not None:
+        yield from read_groups.values()
+        yield from collisions.values()
+        return
+
+    num_partitions = math.ceil(os.path.getsize(paf_file)/consumed) + 1
+    tempdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(paf_file)))
+    try:
+        for partition in partition_paf_file(paf_file,num_partitions,tempdir):
+            with open(partition,"r") as f:
+                read_groups,collisions,consumed = group_paf_lines(f)
+            os.remove(partition)
+            yield from read_groups.values()
+            yield from collisions.values()
+    finally:
+        shutil.rmtree(tempdir)
+
+def group_hits(paf_file,ref_name_map,len_filter,min_map_quality,max_reads=None):
     total_reads= 0
     ambiguous =0
     unmapped = 0
     hits = collections.defaultdict(set)
-    
-    mappings = []
-
-    last_mapping = None
-    with open(paf_file, "r") as f:
-        for l in f:
-            
-            mapping = parse_line(l)
-            if last_mapping:
-                if mapping["read_name"] == last_mapping["read_name"]:
-                    mappings.append(last_mapping)
-                else:
-                    mappings.append(last_mapping)
-
-                    if len(mappings) > 1:
-                        ambiguous +=1
-                        total_reads +=1
-
-                    else:
-
-                        unmapped = add_to_hit_dict(hits, last_mapping,len_filter,min_map_quality,unmapped)
-                        total_reads +=1
 
-                    mappings = []
-                    last_mapping = mapping
+    for group in iter_read_groups(paf_file,max_reads):
+        if isinstance(group,tuple):
+            unmapped = add_to_hit_dict(hits,group,len_filter,min_map_quality,unmapped)
+        else:
+            ambiguous +=1
+        total_reads +=1
 
-            else:
-                last_mapping = mapping
+    if total_reads == 0:
+        return {}, 0, 0, 0
 
-        unmapped = add_to_hit_dict(hits, last_mapping,len_filter,min_map_quality,unmapped)
-        total_reads +=1
     ref_hits = collections.defaultdict(list)
-    not_mapped = 0
     for ref in hits:
-        hit_info = hits[ref]
-        for read in hit_info:
-
-            if read[-1] > 0.6*len_filter:
-                #aln block len needs to be more than 60% of min read len
-                ref_hits[ref].append(read)
-            else:
-                unmapped +=1
+        ref_hits[ref] = list(hits[ref])
 
-    if total_reads == 0:
-        return {}, 0, 0, 0
     return ref_hits, unmapped, ambiguous, total_reads
 
-def write_out_report(ref_index,ref_map,csv_out,hits,unmapped,total_reads,barcode):
+def write_out_report(ref_map,csv_out,hits,unmapped,total_reads,barcode):
 
     with open(csv_out,"w") as fw:
         writer = csv.DictWriter(fw, fieldnames=SAMPLE_HIT_HEADER_FIELDS,lineterminator="\n")
@@ -187,39 +364,52 @@ def write_out_hits(hits,outfile):
 def is_non_zero_file(fpath):  
     return os.path.isfile(fpath) and os.path.getsize(fpath) > 0
 
+def write_out_barcode_hits(ref_map,csv_out,hits_out,hits,unmapped,total_reads,barcode):
+    if total_reads:
+        write_out_report(ref_map,csv_out,hits,unmapped,total_reads,barcode)
+        write_out_hits(hits,hits_out)
+    else:
+        with open(csv_out,"w") as fw:
+            writer = csv.DictWriter(fw, fieldnames=SAMPLE_HIT_HEADER_FIELDS,lineterminator="\n")
+            writer.writeheader()
+
+        with open(hits_out,"w") as fw:
+            writer = csv.DictWriter(fw, lineterminator="\n",fieldnames=["read_name","hit","start","end","aln_block_len"])
+            writer.writeheader()
+
 def parse_paf_file(paf_file,
                     csv_out,
                     hits_out,
-                    references_sequences,
+                    reference_catalogue,
                     barcode,
                     analysis_mode,
                     min_map_quality,
                     config):
     
+    ref_name_map = {}
+    ref_hits, unmapped,ambiguous, total_reads = {},0,0,0
     if is_non_zero_file(paf_file):
         
-        ref_name_map = make_ref_display_name_map(references_sequences)
+        ref_name_map = make_ref_display_name_map(reference_catalogue)
         
         len_filter = 0.4*config[KEY_MIN_READ_LENGTH]
+        max_reads = int(config[KEY_GROUPING_MEMORY]*1000000/VALUE_GROUPED_READ_BYTES)
+
+        ref_hits, unmapped,ambiguous, total_reads = group_hits(paf_file,ref_name_map,len_filter,min_map_quality,max_reads)
 
-        ref_hits, unmapped,ambiguous, total_reads = group_hits(paf_file,ref_name_map,len_filter,min_map_quality)
+    report_barcode_hits(ref_name_map,csv_out,hits_out,ref_hits,unmapped,ambiguous,total_reads,barcode)
+
+def report_barcode_hits(ref_name_map,csv_out,hits_out,ref_hits,unmapped,ambiguous,total_reads,barcode):
+    # checks the read count, a compressed paf with no reads in it still has a non-zero size
+    if total_reads:
         print(f"Barcode: {barcode}")
         print(green("Unmapped:"),unmapped)
         print(green("Ambiguous mapping:"),ambiguous)
 
-        ref_index =  SeqIO.index(references_sequences,KEY_FASTA)
-        write_out_report(ref_index,ref_name_map,csv_out,ref_hits,unmapped,total_reads,barcode)
-
-        write_out_hits(ref_hits,hits_out)
+        write_out_barcode_hits(ref_name_map,csv_out,hits_out,ref_hits,unmapped,total_reads,barcode)
     else:
         print("No reads for",barcode)
-        with open(csv_out,"w") as fw:
-            writer = csv.DictWriter(fw, fieldnames=SAMPLE_HIT_HEADER_FIELDS,lineterminator="\n")
-            writer.writeheader()
-
-        with open(hits_out,"w") as fw:
-            writer = csv.DictWriter(fw, lineterminator="\n",fieldnames=["read_name","hit","start","end","aln_block_len"])
-            writer.writeheader()
+        write_out_barcode_hits({},csv_out,hits_out,{},0,0,barcode)
 
 
 def diversity_report(input_files,csv_out,summary_out,ref_file,config):
@@ -272,6 +462,8 @@ def diversity_report(input_files,csv_out,summary_out,ref_file,config):
             row = summary_rows[barcode]
             writer.writerow(row)
 
+    # only barcodes with references to build go forward, so the mode workflows never
+    # launch the nested consensus/variation runs for empty wells or negative controls
     config[KEY_BARCODES] = []
     for barcode in refs_out:
         refs = refs_out[barcode]
@@ -294,47 +486,76 @@ def check_which_refs_to_write(input_csv,min_reads,min_pcent):
                     print(f"{row[KEY_REFERENCE_GROUP]}\t{row[KEY_NUM_READS]} reads\t{row[KEY_PERCENT]}% of sample")
     return list(to_write)
 
+def write_out_read_depths(assigned,used,outfile):
+    with open(outfile,"w") as fw:
+        writer = csv.DictWriter(fw, lineterminator="\n",fieldnames=["reference","reads_assigned","reads_used"])
+        writer.writeheader()
+        for ref in assigned:
+            writer.writerow({"reference":ref,
+                            "reads_assigned":assigned[ref],
+                            "reads_used":used[ref]})
+
 def write_out_fastqs(input_csv,input_hits,input_fastq,outdir,primer_length,config):
-    seq_index = SeqIO.index(input_fastq, "fastq")
-    
     to_write = check_which_refs_to_write(input_csv,config[KEY_MIN_READS],config[KEY_MIN_PCENT])
+    max_reads = config[KEY_MAX_READS]
+    reads_ext = intermediate_ext(".fastq",config)
     handle_dict = {}
     for ref in to_write:
-        handle_dict[ref] = open(os.path.join(outdir,f"{ref}.fastq"),"w")
-    
-    not_written = collections.Counter()
+        handle_dict[ref] = open_output(os.path.join(outdir,f"{ref}{reads_ext}"))
 
+    # read name -> (reference, aligned length), only for reads hitting a reference being written out
+    read_refs = {}
     with open(input_hits,"r") as f:
         reader = csv.DictReader(f)
         for row in reader:
-            try:
-                read_name = row["read_name"]
-                record = seq_index[read_name]
-
-                hit = row["hit"]
-                handle = handle_dict[hit]
-
-                trimmed_record = record[primer_length:-primer_length]
-
-                SeqIO.write(trimmed_record,handle,"fastq")
-            except:
-                not_written[hit]+=1
+            if row["hit"] in handle_dict:
+                read_refs[row["read_name"].encode()] = (row["hit"],int(row["aln_block_len"]))
+
+    assigned = collections.Counter()
+    selected = collections.defaultdict(list)
+    # one sequential pass over the filtered reads, primers trimmed off the raw lines
+    with open_fastq_bytes(input_fastq) as f:
+        for i,(header,seq,plus,qual) in enumerate(iter_fastq_records(f)):
+            hit = read_refs.get(header[1:].split(None,1)[0])
+            if hit is None:
+                continue
+            ref,aln_len = hit
+            seq = seq.rstrip()
+            end = len(seq) - primer_length
+            qual = qual.rstrip()[primer_length:end]
+            record = header + seq[primer_length:end] + b"\n+\n" + qual + b"\n"
+            assigned[ref] +=1
+            if not max_reads:
+                handle_dict[ref].write(record)
+                continue
+
+            # min-heap of the best max_reads reads: whole phred units of mean quality,
+            # then aligned length, with ties going to the earlier read
+            score = (mean_quality(qual),aln_len,-i)
+            if len(selected[ref]) < max_reads:
+                heapq.heappush(selected[ref],(score,record))
+            else:
+                heapq.heappushpop(selected[ref],(score,record))
 
-    # if not_written:
-    #     print("Read hits not written because below threshold:")
-    #     for i in not_written:
-    #         print(i, not_written[i])
+    used = collections.Counter(assigned)
+    for ref in selected:
+        # write the kept reads back out in their original order
+        for score,record in sorted(selected[ref],key=lambda x: -x[0][2]):
+            handle_dict[ref].write(record)
+        used[ref] = len(selected[ref])
+        print(f"{ref}\t{used[ref]} of {assigned[ref]} reads used")
 
     for ref in handle_dict:
         handle_dict[ref].close()
 
+    write_out_read_depths(assigned,used,os.path.join(outdir,"read_depth.csv"))
+
     return to_write
 
-def write_out_ref_fasta(to_write,ref_file,outdir):
-    ref_index = SeqIO.index(ref_file, KEY_FASTA)
+def write_out_ref_fasta(to_write,reference_catalogue,outdir):
+    catalogue = load_reference_catalogue(reference_catalogue)
 
     for ref in to_write:
         with open(os.path.join(outdir,f"{ref}.reference.fasta"),"w") as fw:
-            record = ref_index[ref]
-            fw.write(f">{record.description}\n{record.seq}\n")
+            fw.write(f">{catalogue[KEY_DESCRIPTIONS][ref]}\n{catalogue[KEY_SEQUENCES][ref]}\n")
     
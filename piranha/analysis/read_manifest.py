@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import os
+import csv
+import numpy as np
+
+from piranha.utils.config import *
+
+def mean_qualities(quals):
+    # mean phred score of each raw quality line, summed over the joined lines in one go
+    # rather than read by read; a line's newline, if it has one, isn't counted
+    if not quals:
+        return np.zeros(0,dtype=np.uint8)
+    lengths = np.fromiter(map(len,quals),dtype=np.int64,count=len(quals))
+    offsets = np.zeros(len(quals),dtype=np.int64)
+    np.cumsum(lengths[:-1],out=offsets[1:])
+    # one byte of padding so every offset is in range, reduceat gives the byte at the
+    # offset rather than 0 for an empty line
+    joined = np.frombuffer(b"".join(quals) + b"\0",dtype=np.uint8)
+    sums = np.add.reduceat(joined,offsets,dtype=np.int64)
+    sums[lengths == 0] = 0
+    newlines = np.fromiter((qual.endswith(b"\n") for qual in quals),dtype=bool,count=len(quals))
+    lengths -= newlines
+    sums -= ord("\n")*newlines
+    means = np.divide(sums,lengths,out=np.full(len(quals),33.0),where=lengths > 0) - 33
+    return np.clip(means,0,255).astype(np.uint8)
+
+def mean_quality(qual):
+    return int(mean_qualities([qual])[0])
+
+class ReadStats():
+    # length and mean quality histograms of a stream of reads in fixed memory, the reads are
+    # summarised VALUE_READ_STATS_CHUNK bytes of quality scores at a time (mean_qualities
+    # works on 8 bytes for each of them)
+    def __init__(self):
+        self.length_hist = np.zeros(VALUE_LENGTH_HIST_MAX//VALUE_LENGTH_HIST_BIN + 1,dtype=np.int64)
+        self.quality_hist = np.zeros(VALUE_QUALITY_HIST_BINS,dtype=np.int64)
+        self.lengths = []
+        self.quals = []
+        self.chunk_bytes = 0
+
+    def add(self,length,qual):
+        self.lengths.append(length)
+        self.quals.append(qual)
+        self.chunk_bytes += len(qual)
+        if self.chunk_bytes >= VALUE_READ_STATS_CHUNK:
+            self.flush()
+
+    def flush(self):
+        if not self.lengths:
+            return
+        bins = np.minimum(np.array(self.lengths,dtype=np.int64)//VALUE_LENGTH_HIST_BIN,len(self.length_hist)-1)
+        self.length_hist += np.bincount(bins,minlength=len(self.length_hist))
+        self.quality_hist += np.bincount(mean_qualities(self.quals),minlength=len(self.quality_hist))
+        self.lengths = []
+        self.quals = []
+        self.chunk_bytes = 0
+
+    def histograms(self):
+        self.flush()
+        return self.length_hist,self.quality_hist
+
+def histogram_median(hist,bin_size=1):
+    total = hist.sum()
+    if not total:
+        return 0
+    return int(np.searchsorted(np.cumsum(hist),total/2))*bin_size
+
+def write_read_manifest(manifest_out,read_files,file_stats):
+    # file_stats holds (total_reads,passed_reads,length_hist,quality_hist) for each of read_files,
+    # the histograms made by ReadStats
+    file_info = [os.stat(read_file) for read_file in read_files]
+    length_hist,quality_hist = ReadStats().histograms()
+    for stats in file_stats:
+        length_hist = length_hist + stats[2]
+        quality_hist = quality_hist + stats[3]
+
+    with open(manifest_out,"wb") as fw:
+        np.savez_compressed(fw,
+                            files=np.array([os.path.basename(i) for i in read_files],dtype=str),
+                            sizes=np.array([i.st_size for i in file_info],dtype=np.int64),
+                            mtimes=np.array([i.st_mtime for i in file_info],dtype=np.float64),
+                            read_counts=np.array([stats[0] for stats in file_stats],dtype=np.int64),
+                            passed_counts=np.array([stats[1] for stats in file_stats],dtype=np.int64),
+                            length_hist=length_hist,
+                            quality_hist=quality_hist)
+
+def load_read_manifest(manifest_file):
+    with np.load(manifest_file) as manifest:
+        return {key:manifest[key] for key in manifest.files}
+
+def summarise_read_manifest(manifest):
+    return {
+        KEY_TOTAL_READS:int(manifest["read_counts"].sum()),
+        KEY_PASSED_READS:int(manifest["passed_counts"].sum()),
+        KEY_MEDIAN_LENGTH:histogram_median(manifest["length_hist"],VALUE_LENGTH_HIST_BIN),
+        KEY_MEDIAN_QUALITY:histogram_median(manifest["quality_hist"])
+    }
+
+def write_read_summary(manifest_files,barcodes,summary_out,config):
+    samples = dict(zip(config[KEY_BARCODES],config[KEY_SAMPLES]))
+    with open(summary_out,"w") as fw:
+        writer = csv.DictWriter(fw, fieldnames=READ_SUMMARY_HEADER_FIELDS,lineterminator="\n")
+        writer.writeheader()
+        for barcode,manifest_file in zip(barcodes,manifest_files):
+            row = {KEY_BARCODE:barcode,KEY_SAMPLE:samples[barcode]}
+            row.update(summarise_read_manifest(load_read_manifest(manifest_file)))
+            writer.writerow(row)
+
+def load_read_summary(summary_file):
+    if not os.path.exists(summary_file):
+        return []
+    with open(summary_file,"r") as f:
+        return list(csv.DictReader(f))
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import uuid
+import socket
+import threading
+import subprocess
+import concurrent.futures
+
+from piranha.analysis.stool_functions import get_sample
+from piranha.utils.resources import job_memory
+from piranha.utils.resume import resume_key_file
+from piranha.utils.log_colours import green,cyan,yellow
+from piranha.utils.config import *
+
+"""
+With --distributed the coordinator (piranha itself) puts one task per barcode into a queue
+directory in the temp directory, which has to be on a filesystem the worker nodes share.
+A task is a json file that moves pending/ -> claimed/ -> done/. Workers claim a task by
+renaming it into claimed/, which only one of them can do, tag it with a claim id and touch
+it while it runs so the coordinator can put it back in pending/ if a worker dies. A worker
+whose task was put back (and maybe claimed by another) stops it and leaves it to the new
+claim. Once every task is done the coordinator closes the queue, the workers exit and the
+run carries on as normal.
+"""
+
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+CLOSED = "closed"
+
+def queue_path(queue_dir,state,task_id=None):
+    if task_id:
+        return os.path.join(queue_dir,state,f"{task_id}.json")
+    return os.path.join(queue_dir,state)
+
+def read_task(path):
+    with open(path,"r") as f:
+        return json.load(f)
+
+def write_task(path,task):
+    # written to the side and renamed, so a task file is never seen half written
+    tmp = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(tmp,"w") as fw:
+        json.dump(task,fw)
+    os.replace(tmp,path)
+
+def list_tasks(queue_dir,state):
+    return sorted(glob.glob(os.path.join(queue_path(queue_dir,state),"*.json")))
+
+def is_out_of_date(barcode,config):
+    # with --resume only barcodes whose consensus key is newer than their results are run again
+    trigger = resume_key_file(config[KEY_TEMPDIR],barcode,CONSENSUS_KEY)
+    result = os.path.join(config[KEY_TEMPDIR],barcode,"variation_info.json")
+    return not os.path.exists(result) or os.path.getmtime(result) < os.path.getmtime(trigger)
+
+def make_task(barcode,config):
+    references = len(config[barcode])
+    return {
+        "task_id":barcode,
+        KEY_BARCODE:barcode,
+        KEY_SAMPLE:str(get_sample(config[KEY_BARCODES_CSV],barcode)),
+        "yaml":os.path.join(config[KEY_TEMPDIR],PREPROCESSING_CONFIG),
+        "workdir":config[KEY_TEMPDIR],
+        KEY_OUTDIR:os.path.join(config[KEY_OUTDIR],barcode),
+        KEY_TEMPDIR:os.path.join(config[KEY_TEMPDIR],barcode),
+        "variant_dir":os.path.join(config[KEY_TEMPDIR],barcode,"variant_calls"),
+        "publish_dir":os.path.join(config[KEY_OUTDIR],"published_data",barcode),
+        "log_dir":os.path.join(config[KEY_TEMPDIR],"logs"),
+        KEY_RESUME:config[KEY_RESUME],
+        # the same budget the barcode's nested workflow gets when run locally
+        "threads":VALUE_MEDAKA_THREADS*references,
+        "mem_mb":job_memory(VALUE_MEDAKA_MEMORY*references,config)
+    }
+
+def set_up_queue(queue_dir):
+    if os.path.exists(queue_dir):
+        shutil.rmtree(queue_dir)
+    for state in [PENDING,CLAIMED,DONE]:
+        os.makedirs(queue_path(queue_dir,state))
+
+def requeue_stale_tasks(queue_dir,last_touched):
+    # a claimed task that hasn't been touched for a while belongs to a worker that has gone.
+    # the wait is timed by this clock from when the mtime last changed, as the worker nodes'
+    # (or the file server's) clocks may not agree with it
+    now = time.time()
+    for path in list_tasks(queue_dir,CLAIMED):
+        try:
+            mtime = os.path.getmtime(path)
+            if last_touched.get(path,(None,))[0] != mtime:
+                last_touched[path] = (mtime,now)
+            elif now - last_touched[path][1] > VALUE_QUEUE_STALE:
+                os.rename(path,os.path.join(queue_path(queue_dir,PENDING),os.path.basename(path)))
+                del last_touched[path]
+                print(cyan(f"Warning: no word from the worker running {os.path.basename(path)[:-5]}, putting it back in the queue."))
+        except FileNotFoundError:
+            # finished (or requeued) in the meantime
+            continue
+
+def run_distributed(config):
+    queue_dir = os.path.join(config[KEY_TEMPDIR],VALUE_QUEUE_DIR)
+    set_up_queue(queue_dir)
+
+    barcodes = config[KEY_BARCODES]
+    if config[KEY_RESUME]:
+        barcodes = [barcode for barcode in barcodes if is_out_of_date(barcode,config)]
+    for barcode in barcodes:
+        write_task(queue_path(queue_dir,PENDING,barcode),make_task(barcode,config))
+
+    print(green(f"Queued consensus generation for {len(barcodes)} barcodes in:") + f" {queue_dir}")
+    print(green("Start workers on nodes that share this directory with:") + f" piranha worker -q {queue_dir}")
+    print(yellow("-----------------------"))
+
+    finished = set()
+    last_touched = {}
+    status = True
+    try:
+        while len(finished) < len(barcodes):
+            for path in list_tasks(queue_dir,DONE):
+                task = read_task(path)
+                if task["task_id"] in finished:
+                    continue
+                finished.add(task["task_id"])
+                if task["returncode"] != 0:
+                    sys.stderr.write(cyan(f"Error: consensus generation failed for {task[KEY_BARCODE]} on {task['worker']}, see {task['log_dir']}.\n"))
+                    status = False
+                else:
+                    print(green(f"{task[KEY_BARCODE]}:") + f" finished on {task['worker']} ({len(finished)} of {len(barcodes)})")
+            if not status:
+                break
+            requeue_stale_tasks(queue_dir,last_touched)
+            time.sleep(VALUE_QUEUE_POLL)
+    except KeyboardInterrupt:
+        print(cyan("\nStopped waiting for workers."))
+        status = False
+
+    # workers exit once the queue is closed
+    with open(os.path.join(queue_dir,CLOSED),"w") as fw:
+        fw.write("")
+    return status
+
+def barcode_workflow_command(snakefile,task,cores,mem_mb,log_string):
+    command = ["snakemake","--nolock","--snakefile",snakefile,"--rerun-incomplete"]
+    # resumed runs rerun only the references whose keys changed, as the mode snakefiles do
+    if not task[KEY_RESUME]:
+        command.append("--forceall")
+    command += log_string.split() + [
+            "--configfile",task["yaml"],
+            "--config",f"barcode={task[KEY_BARCODE]}",f"outdir={task[KEY_OUTDIR]}",f"tempdir={task[KEY_TEMPDIR]}",f"sample={task[KEY_SAMPLE]}",
+            "--cores",str(cores)]
+    if mem_mb:
+        command += ["--resources",f"mem_mb={mem_mb}"]
+    return command
+
+def run_task(task,scripts_dir,cores,mem_mb,log_string,lost):
+    # the same two workflows the mode snakefiles run for a barcode, stopped if the claim is lost
+    barcode = task[KEY_BARCODE]
+    steps = [("consensus",cores,mem_mb),("variation",1,None)]
+    for step,step_cores,step_mem in steps:
+        command = barcode_workflow_command(os.path.join(scripts_dir,f"{step}.smk"),task,step_cores,step_mem,log_string)
+        with open(os.path.join(task["log_dir"],f"{barcode}_{step}.smk.log"),"w") as log_handle:
+            process = subprocess.Popen(command,stdout=log_handle,stderr=subprocess.STDOUT,cwd=task["workdir"])
+            while process.poll() is None:
+                if lost.wait(VALUE_QUEUE_POLL):
+                    process.terminate()
+                    process.wait()
+                    return -1
+            returncode = process.returncode
+        if returncode != 0:
+            return returncode
+        if step == "consensus":
+            for vcf in glob.glob(os.path.join(task["variant_dir"],"*.vcf")):
+                shutil.copy(vcf,task["publish_dir"])
+    return 0
+
+def claim_task(queue_dir,free_cores,free_memory,running,config):
+    for path in list_tasks(queue_dir,PENDING):
+        try:
+            task = read_task(path)
+        except (FileNotFoundError,ValueError):
+            continue
+        # a task bigger than the whole worker still runs, on its own
+        if running and task["threads"] > free_cores:
+            continue
+        if running and free_memory is not None and job_memory(task["mem_mb"],config) > free_memory:
+            continue
+        claimed = queue_path(queue_dir,CLAIMED,task["task_id"])
+        try:
+            os.rename(path,claimed)
+        except FileNotFoundError:
+            # another worker got there first
+            continue
+        # rewriting it also touches it, so a task that sat in pending/ isn't taken to be stale
+        task["claim"] = uuid.uuid4().hex
+        write_task(claimed,task)
+        return task
+    return None
+
+def holds_claim(queue_dir,task):
+    # false once the coordinator has put the task back, whether or not it has been claimed again
+    try:
+        return read_task(queue_path(queue_dir,CLAIMED,task["task_id"])).get("claim") == task["claim"]
+    except (FileNotFoundError,ValueError):
+        return False
+
+def finish_task(queue_dir,task,returncode,worker_name):
+    if not holds_claim(queue_dir,task):
+        return False
+    task["returncode"] = returncode
+    task["worker"] = worker_name
+    write_task(queue_path(queue_dir,DONE,task["task_id"]),task)
+    try:
+        os.remove(queue_path(queue_dir,CLAIMED,task["task_id"]))
+    except FileNotFoundError:
+        pass
+    return True
+
+def run_worker(queue_dir,scripts_dir,config):
+    worker_name = f"{socket.gethostname()}:{os.getpid()}"
+    cores = config[KEY_THREADS]
+    print(green("Waiting for tasks in:") + f" {queue_dir}")
+
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(cores) as executor:
+        while True:
+            for task_id in list(running):
+                task,future,lost = running[task_id]
+                if future.done():
+                    if lost.is_set():
+                        print(cyan(f"{task[KEY_BARCODE]}: stopped, the task was put back in the queue"))
+                    elif finish_task(queue_dir,task,future.result(),worker_name):
+                        print(green(f"{task[KEY_BARCODE]}:") + (" done" if future.result() == 0 else cyan(" failed")))
+                    else:
+                        print(cyan(f"{task[KEY_BARCODE]}: finished, but the task was put back in the queue in the meantime"))
+                    del running[task_id]
+                elif holds_claim(queue_dir,task):
+                    try:
+                        os.utime(queue_path(queue_dir,CLAIMED,task_id))
+                    except FileNotFoundError:
+                        pass
+                else:
+                    lost.set()
+
+            if os.path.exists(os.path.join(queue_dir,PENDING)):
+                # memory is only held back when it is known, as for the snakemake workflows
+                free_cores = cores - sum(min(task["threads"],cores) for task,future,lost in running.values())
+                free_memory = None
+                if config[KEY_MAX_MEMORY]:
+                    free_memory = config[KEY_MAX_MEMORY] - sum(job_memory(task["mem_mb"],config) for task,future,lost in running.values())
+                task = claim_task(queue_dir,free_cores,free_memory,running,config)
+                while task:
+                    task_cores = min(task["threads"],cores)
+                    mem_mb = job_memory(task["mem_mb"],config)
+                    print(green(f"{task[KEY_BARCODE]}:") + f" running consensus for {task[KEY_SAMPLE]}")
+                    lost = threading.Event()
+                    running[task["task_id"]] = (task,executor.submit(run_task,task,scripts_dir,task_cores,mem_mb,config[KEY_LOG_STRING],lost),lost)
+                    free_cores -= task_cores
+                    if free_memory is not None:
+                        free_memory -= mem_mb
+                    task = claim_task(queue_dir,free_cores,free_memory,running,config)
+
+            if not running and os.path.exists(os.path.join(queue_dir,CLOSED)):
+                print(green("Queue closed, stopping."))
+                return 0
+            time.sleep(VALUE_QUEUE_POLL)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import dataclasses
+from typing import Optional
+
+from piranha import command
+from piranha.utils.log_colours import cyan
+from piranha.utils.config import *
+
+"""
+Runs piranha from python, in this interpreter, for pipelines that would otherwise shell out to
+the command line and read the csv files back.
+
+    from piranha import api
+    result = api.run({"readdir": "/data/run1/demultiplexed",
+                      "barcodes_csv": "/data/run1/barcodes.csv",
+                      "outdir": "/data/run1/piranha",
+                      "threads": 8})
+    if result.ok:
+        for row in result.summary_table:
+            ...
+
+The keys are the command line options, written as in a config file (`barcodes_csv` or
+`barcodes-csv`), and are parsed as a command line would be. Flags take True or False.
+Problems with the options are written to stderr as they are on the command line, and give a
+result with a non-zero returncode rather than exiting.
+"""
+
+@dataclasses.dataclass
+class RunResult:
+    returncode: int
+    outdir: Optional[str] = None
+    report: Optional[str] = None
+    published_dir: Optional[str] = None
+    consensus_sequences: Optional[str] = None
+    detailed_csv: Optional[str] = None
+    run_timeline: Optional[str] = None
+    # barcode to its sample report
+    barcode_reports: dict = dataclasses.field(default_factory=dict)
+    # barcode to the references consensus sequences were made for
+    references: dict = dataclasses.field(default_factory=dict)
+    # one dict per row, as in the tables of the report
+    summary_table: list = dataclasses.field(default_factory=list)
+    composition_table: list = dataclasses.field(default_factory=list)
+    read_summary_table: list = dataclasses.field(default_factory=list)
+    control_status: dict = dataclasses.field(default_factory=dict)
+    # time, cpu time and peak memory of each step, most time first
+    timeline_table: list = dataclasses.field(default_factory=list)
+    config: dict = dataclasses.field(default_factory=dict)
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+def config_to_args(config):
+    # parsed as a command line, so the options get the same type and choice checks
+    parser = command.make_parser()
+    actions = {action.dest:action for action in parser._actions if action.option_strings and action.dest not in ["help","version"]}
+    argv = []
+    invalid_keys = []
+    for key in config:
+        clean_key = key.lstrip("-").replace("-","_").strip().lower()
+        if clean_key not in actions:
+            invalid_keys.append(key)
+            continue
+        action = actions[clean_key]
+        option = action.option_strings[-1]
+        value = config[key]
+        if action.nargs == 0:
+            if value not in [True,False,None]:
+                invalid_keys.append(key)
+            elif value:
+                argv.append(option)
+        elif value is not None:
+            argv.append(f"{option}={value}")
+
+    if invalid_keys:
+        keys = ""
+        for i in invalid_keys:
+            keys += f"\t- {i}\n"
+        sys.stderr.write(cyan(f'Error: invalid keys in run config.\n') + f'{keys}')
+        sys.exit(-1)
+    return parser.parse_args(argv)
+
+def make_result(config,preprocessing_config,data_for_report):
+    published_dir = os.path.join(config[KEY_OUTDIR],"published_data")
+    barcodes = preprocessing_config[KEY_BARCODES]
+    return RunResult(
+        returncode=0,
+        outdir=config[KEY_OUTDIR],
+        report=os.path.join(config[KEY_OUTDIR],OUTPUT_REPORT),
+        published_dir=published_dir,
+        consensus_sequences=os.path.join(published_dir,SAMPLE_SEQS),
+        detailed_csv=os.path.join(config[KEY_OUTDIR],"detailed_run_report.csv"),
+        run_timeline=os.path.join(config[KEY_OUTDIR],RUN_TIMELINE),
+        barcode_reports={barcode:os.path.join(config[KEY_OUTDIR],"barcode_reports",f"{barcode}_report.html") for barcode in barcodes},
+        references={barcode:list(preprocessing_config[barcode]) for barcode in barcodes},
+        summary_table=data_for_report[KEY_SUMMARY_TABLE],
+        composition_table=data_for_report[KEY_COMPOSITION_TABLE],
+        read_summary_table=data_for_report[KEY_READ_SUMMARY_TABLE],
+        control_status=data_for_report[KEY_CONTROL_STATUS],
+        timeline_table=data_for_report[KEY_TIMELINE_TABLE],
+        config=config)
+
+def run(config: dict) -> RunResult:
+    try:
+        args = config_to_args(config)
+        run_config, snakefile = command.set_up_run(args,os.getcwd())
+        started = time.time()
+        preprocessing_config = command.run_workflows(snakefile,args.index_cache,run_config)
+        if preprocessing_config is None:
+            return RunResult(returncode=1,outdir=run_config[KEY_OUTDIR],config=run_config)
+        data_for_report = command.write_run_report(run_config,started)
+    except SystemExit as e:
+        # the option checks exit, as they would on the command line
+        return RunResult(returncode=e.code if isinstance(e.code,int) else 1)
+
+    return make_result(run_config,preprocessing_config,data_for_report)
@@ -6,30 +6,105 @@ from piranha.input_parsing import initialising as init
 from piranha.utils import misc
 from piranha.utils import dependency_checks
 from piranha.utils import data_install_checks
+from piranha.utils import resources
+from piranha.utils import tool_cache
 from piranha.input_parsing import analysis_arg_parsing
 from piranha.input_parsing import directory_setup
 from piranha.input_parsing import input_qc
-from piranha.report.make_report import make_output_report
-import piranha.utils.custom_logger as custom_logger
 from piranha.utils.log_colours import green,cyan,red
 from piranha.utils.config import *
 
 import os
 import sys
+import time
 import yaml
 import argparse
-import snakemake
+import tempfile
+
+# snakemake, biopython, mako and the analysis modules are slow to import, so they're
+# imported where they're needed rather than here, and --help and bad arguments return quickly
 
 cwd = os.getcwd()
 thisdir = os.path.abspath(os.path.dirname(__file__))
 
-def main(sysargs = sys.argv[1:]):
- 
+def worker(sysargs):
+    parser = argparse.ArgumentParser(add_help=False,
+    description=misc.preamble(__version__),
+    usage='''
+\tpiranha worker -q <queue directory> [options]
+''')
+
+    worker_group = parser.add_argument_group('Worker options')
+    worker_group.add_argument('-q','--queue',action="store",dest="queue",help="Queue directory printed by a piranha run started with --distributed. The worker waits for it to appear and exits once the run has finished with it.")
+    worker_group.add_argument('-t', '--threads', action='store',dest="threads",help=f"Number of threads to run tasks with, or `{VALUE_AUTO}` to use the cores available. Default: `{VALUE_AUTO}`")
+    worker_group.add_argument("--max-memory",action="store",dest="max_memory",help=f"Memory in MB that tasks running at the same time may use between them, or `{VALUE_AUTO}`. Default: `{VALUE_AUTO}`")
+    worker_group.add_argument("--verbose",action="store_true",help="Print lots of stuff to the workflow logs")
+    worker_group.add_argument("-h","--help",action="store_true",dest="help")
+
+    args = parser.parse_args(sysargs)
+    if args.help or not args.queue:
+        parser.print_help()
+        sys.exit(0)
+
+    config = {KEY_THREADS:VALUE_AUTO,KEY_MAX_MEMORY:VALUE_AUTO,KEY_VERBOSE:args.verbose}
+    misc.add_arg_to_config(KEY_THREADS,args.threads,config)
+    resources.resources_to_config(args.max_memory,config)
+    init.set_up_verbosity(config)
+
+    from piranha.analysis import work_queue
+    return work_queue.run_worker(os.path.abspath(args.queue),os.path.join(thisdir,"scripts"),config)
+
+def serve(sysargs):
+    parser = argparse.ArgumentParser(add_help=False,
+    description=misc.preamble(__version__),
+    usage='''
+\tpiranha serve [options]
+''')
+
+    serve_group = parser.add_argument_group('Server options')
+    serve_group.add_argument("--host",action="store",default=VALUE_SERVE_HOST,help=f"Address to accept runs on. Default: {VALUE_SERVE_HOST}")
+    serve_group.add_argument("--port",action="store",type=int,default=VALUE_SERVE_PORT,help=f"Port to accept runs on. Default: {VALUE_SERVE_PORT}")
+    serve_group.add_argument("--log-dir",action="store",dest="log_dir",help="Directory to write the log of each run to. Default: a new temporary directory")
+    serve_group.add_argument('-t', '--threads', action='store',dest="threads",help=f"Number of threads each run is given (runs go one at a time), or `{VALUE_AUTO}` to use the cores available. Default: `{VALUE_AUTO}`")
+    serve_group.add_argument("--index-cache",action="store",dest="index_cache",help="Directory to keep minimap2 reference indexes in, as for a normal run. Default: piranha package data directory")
+    serve_group.add_argument("-h","--help",action="store_true",dest="help")
+
+    args = parser.parse_args(sysargs)
+    if args.help:
+        parser.print_help()
+        sys.exit(0)
+
+    config = {KEY_THREADS:VALUE_AUTO,KEY_MAX_MEMORY:VALUE_AUTO}
+    misc.add_arg_to_config(KEY_THREADS,args.threads,config)
+    resources.resources_to_config(None,config)
+
+    # everything a run would otherwise pay for on start up
+    from piranha.utils import run_server
+    import snakemake
+    from piranha.report import make_report
+    dependency_checks.check_dependencies(dependency_list, module_list)
+    analysis_arg_parsing.get_available_medaka_models()
+    for reference_file in [REFERENCE_SEQUENCES_FILE_VP1,REFERENCE_SEQUENCES_FILE_WG]:
+        data_install_checks.package_data_check(reference_file,"data",KEY_REFERENCE_SEQUENCES,config)
+        # the cache it ends up in, which may be the temp dir if the default isn't writable
+        config[KEY_INDEX_CACHE] = run_server.warm_up(config[KEY_REFERENCE_SEQUENCES],args.index_cache)
+
+    if args.log_dir:
+        log_dir = os.path.abspath(args.log_dir)
+        os.makedirs(log_dir,exist_ok=True)
+    else:
+        log_dir = tempfile.mkdtemp(prefix="piranha_serve_")
+
+    return run_server.serve(args.host,args.port,main,log_dir,config)
+
+def make_parser():
     parser = argparse.ArgumentParser(add_help=False,
     description=misc.preamble(__version__),
     usage='''
 \tpiranha -c <config.yaml> [options]
 \tpiranha -i input.csv [options]
+\tpiranha worker -q <queue directory> [options]
+\tpiranha serve [options]
 ''')
 
     i_group = parser.add_argument_group('Input options')
@@ -37,6 +112,7 @@ def main(sysargs = sys.argv[1:]):
     i_group.add_argument('-i','--readdir',help="Path to the directory containing fastq read files",dest="readdir")
     i_group.add_argument('-b','--barcodes-csv',help="CSV file describing which barcodes were used on which sample",dest="barcodes_csv")
     i_group.add_argument("-r","--reference-sequences",action="store",dest="reference_sequences",help="Custom reference sequences file.")
+    i_group.add_argument("--index-cache",action="store",dest="index_cache",help="Directory to keep minimap2 reference indexes in so they are built once and reused across runs. Default: piranha package data directory")
     i_group.add_argument("-pc","--positive-control",action="store",help=f"Sample name of positive control. Default: `{VALUE_POSITIVE}`")
     i_group.add_argument("-nc","--negative-control",action="store",help=f"Sample name of negative control. Default: `{VALUE_NEGATIVE}`")
 
@@ -49,6 +125,7 @@ def main(sysargs = sys.argv[1:]):
     analysis_group.add_argument("-n","--min-read-length",action="store",type=int,help=f"Minimum read length. Default: {READ_LENGTH_DICT[VALUE_ANALYSIS_MODE][0]}")
     analysis_group.add_argument("-x","--max-read-length",action="store",type=int,help=f"Maximum read length. Default: {READ_LENGTH_DICT[VALUE_ANALYSIS_MODE][1]}")
     analysis_group.add_argument("-d","--min-read-depth",action="store",type=int,help=f"Minimum read depth required for consensus generation. Default: {VALUE_MIN_READS}")
+    analysis_group.add_argument("--max-read-depth",action="store",type=int,help="Maximum number of reads per reference group taken forward for consensus generation, keeping the reads with the highest mean base quality and longest alignments. Default: no maximum")
     analysis_group.add_argument("-p","--min-read-pcent",action="store",type=float,help=f"Minimum percentage of sample required for consensus generation. Default: {VALUE_MIN_PCENT}")
     analysis_group.add_argument("--primer-length",action="store",type=int,help=f"Length of primer sequences to trim off start and end of reads. Default: {VALUE_PRIMER_LENGTH}")
 
@@ -58,6 +135,7 @@ def main(sysargs = sys.argv[1:]):
     o_group.add_argument('-pre','--output-prefix',action="store",help=f"Prefix of output directory & report name: Default: `{VALUE_OUTPUT_PREFIX}`",dest="output_prefix")
     o_group.add_argument('--datestamp', action="store",help="Append datestamp to directory name when using <-o/--outdir>. Default: <-o/--outdir> without a datestamp")
     o_group.add_argument('--overwrite', action="store_true",help="Overwrite output directory. Default: append an incrementing number if <-o/--outdir> already exists")
+    o_group.add_argument('--resume', action="store_true",help="Reuse <-o/--outdir> from a previous run and only redo the barcodes whose reads, reference, or analysis settings have changed. Intermediate files are kept in the output directory unless <-temp/--tempdir> is given. Default: rerun everything")
     o_group.add_argument('-temp','--tempdir',action="store",help="Specify where you want the temp stuff to go. Default: `$TMPDIR`")
     o_group.add_argument("--no-temp",action="store_true",help="Output all intermediate files. For development/ debugging purposes",dest="no_temp")
     o_group.add_argument('--all-metadata-to-header',action="store_true",dest=KEY_ALL_METADATA,help="Parse all fields from input barcode.csv file and include in the output fasta headers. Be aware spaces in metadata will disrupt the record id, so avoid these.")
@@ -68,24 +146,28 @@ def main(sysargs = sys.argv[1:]):
     misc_group.add_argument('--username',action="store",help="Username to appear in report. Default: no user name")
     misc_group.add_argument('--institute',action="store",help="Institute name to appear in report. Default: no institute name")
     misc_group.add_argument('--orientation',action="store",help="Orientation of barcodes in wells on a 96-well plate. If `well` is supplied as a column in the barcode.csv, this default orientation will be overwritten. Default: `horizontal`. Options: `horizontal` or `vertical`.")
-    misc_group.add_argument('-t', '--threads', action='store',dest="threads",type=int,help="Number of threads. Default: 1")
+    misc_group.add_argument('-t', '--threads', action='store',dest="threads",help=f"Number of threads, or `{VALUE_AUTO}` to use the cores available (within any container or cgroup limit). Default: `{VALUE_AUTO}`")
+    misc_group.add_argument("--max-memory",action="store",dest="max_memory",help=f"Memory in MB that jobs running at the same time may use between them, or `{VALUE_AUTO}` to use the memory available. Default: `{VALUE_AUTO}`")
+    misc_group.add_argument("--parallel-ingest",action="store_true",dest="parallel_ingest",help="Filter the fastq files within each barcode in parallel across <-t/--threads> processes. Default: one process per barcode")
+    misc_group.add_argument("--fuse-filter-map",action="store_true",dest="fuse_filter_map",help="Stream length-filtered reads straight into minimap2 rather than writing and re-reading an uncompressed fastq. Ignored with --mapping-backend mappy. Default: filter and map as separate steps")
+    misc_group.add_argument("--batch-mapping",action="store_true",dest="batch_mapping",help="Map the filtered reads of all barcodes in a single minimap2 run. Ignored with --fuse-filter-map or --mapping-backend mappy. Default: one minimap2 run per barcode")
+    misc_group.add_argument("--mapping-backend",action="store",dest="mapping_backend",help=f"How reads are mapped for the initial read classification. `mappy` maps in-process with the minimap2 python binding (requires the mappy package) and skips writing and parsing paf files; the paf is still written with --no-temp. Options: `{'`, `'.join(VALID_MAPPING_BACKENDS)}`. Default: `{VALUE_MAPPING_BACKEND}`")
+    misc_group.add_argument("--single-dag",action="store_true",dest="single_dag",help="Run the consensus and variation steps of all barcodes in one snakemake workflow, so their jobs are scheduled together across <-t/--threads>. Default: a separate consensus and variation workflow for each barcode")
+    misc_group.add_argument("--distributed",action="store_true",help="Hand the consensus and variation steps of each barcode to `piranha worker` processes, which can run on other nodes that share the output (or <-temp/--tempdir>) directory. Intermediate files are kept in the output directory unless <-temp/--tempdir> is given. Default: run everything here")
+    misc_group.add_argument("--grouping-memory",action="store",type=int,dest="grouping_memory",help=f"Memory budget in MB for grouping mapped reads per barcode, larger barcodes are grouped in partitions on disk. Default: {VALUE_GROUPING_MEMORY}")
+    misc_group.add_argument("--compress-intermediates",action="store_true",dest="compress_intermediates",help="Write the filtered reads, mapping files and per-reference read files as bgzip compressed files. Default: uncompressed")
+    misc_group.add_argument("--watch",action="store_true",help="Follow <-i/--readdir> while MinKNOW is writing to it, processing new fastq files as they appear and refreshing the report as the run goes. The full analysis runs once sequencing finishes. Default: analyse the reads already written")
+    misc_group.add_argument("--watch-interval",action="store",type=int,dest="watch_interval",help=f"Seconds between report refreshes with --watch. Default: {VALUE_WATCH_INTERVAL}")
+    misc_group.add_argument("--watch-timeout",action="store",type=int,dest="watch_timeout",help=f"Minutes without new reads before --watch stops and runs the full analysis. Default: {VALUE_WATCH_TIMEOUT}")
+    misc_group.add_argument("--refresh-tool-cache",action="store_true",dest="refresh_tool_cache",help="Look for minimap2, medaka and the other tools again, and ask medaka for its models again, rather than using what was found on a previous run in this environment")
     misc_group.add_argument("--verbose",action="store_true",help="Print lots of stuff to screen")
     misc_group.add_argument("-v","--version", action='version', version=f"piranha {__version__}")
     misc_group.add_argument("-h","--help",action="store_true",dest="help")
+    return parser
 
-    """
-    Exit with help menu if no args supplied
-    """
-
-    if len(sysargs)<1: 
-        parser.print_help()
-        sys.exit(0)
-    else:
-        args = parser.parse_args(sysargs)
-        if args.help:
-            parser.print_help()
-            sys.exit(0)
-
+def set_up_run(args,cwd=cwd):
+    if args.refresh_tool_cache:
+        tool_cache.refresh_tool_cache()
     dependency_checks.check_dependencies(dependency_list, module_list)
 
     # Initialise config dict
@@ -106,75 +188,163 @@ def main(sysargs = sys.argv[1:]):
     # Sort out where the query info is coming from, csv or id string, optional fasta seqs.
     # Checks if they're real files, of the right format and that QC args sensible values.
     analysis_arg_parsing.medaka_options_parsing(args.medaka_model,args.medaka_list_models,config)
-    analysis_arg_parsing.analysis_group_parsing(args.min_read_length,args.max_read_length,args.min_read_depth,args.min_read_pcent,args.primer_length,args.min_map_quality,config)
+    analysis_arg_parsing.analysis_group_parsing(args.min_read_length,args.max_read_length,args.min_read_depth,args.max_read_depth,args.min_read_pcent,args.primer_length,args.min_map_quality,config)
     misc.add_arg_to_config(KEY_ALL_METADATA,args.all_metadata_to_header,config)
 
     input_qc.parse_input_group(args.barcodes_csv,args.readdir,args.reference_sequences,config)
     input_qc.control_group_parsing(args.positive_control, args.negative_control, config)
 
+    # before the temp dir is set up, as distributed workers have to be able to see it
+    misc.add_arg_to_config(KEY_DISTRIBUTED,args.distributed,config)
     # sets up the output dir, temp dir, and data output desination
-    directory_setup.output_group_parsing(args.outdir, args.output_prefix, args.overwrite, args.datestamp, args.tempdir, args.no_temp, config)
+    directory_setup.output_group_parsing(args.outdir, args.output_prefix, args.overwrite, args.datestamp, args.tempdir, args.no_temp, args.resume, config)
     # ready to run? either verbose snakemake or quiet mode
     init.misc_args_to_config(args.verbose,args.threads,args.username,args.institute,args.runname,config)
+    resources.resources_to_config(args.max_memory,config)
+    misc.add_arg_to_config(KEY_PARALLEL_INGEST,args.parallel_ingest,config)
+    misc.add_arg_to_config(KEY_FUSE_FILTER_MAP,args.fuse_filter_map,config)
+    misc.add_arg_to_config(KEY_BATCH_MAPPING,args.batch_mapping,config)
+    misc.add_check_valid_arg(KEY_MAPPING_BACKEND,args.mapping_backend,VALID_MAPPING_BACKENDS,config)
+    if config[KEY_MAPPING_BACKEND] == VALUE_MAPPING_BACKEND_MAPPY:
+        dependency_checks.check_dependencies([],["mappy"])
+    misc.add_arg_to_config(KEY_SINGLE_DAG,args.single_dag,config)
+    if config[KEY_DISTRIBUTED] and config[KEY_SINGLE_DAG]:
+        sys.stderr.write(cyan("Error: --single-dag and --distributed can't be used together.\n"))
+        sys.exit(-1)
+    misc.add_arg_to_config(KEY_GROUPING_MEMORY,args.grouping_memory,config)
+    analysis_arg_parsing.check_if_int(KEY_GROUPING_MEMORY,config)
+    misc.add_arg_to_config(KEY_COMPRESS_INTERMEDIATES,args.compress_intermediates,config)
+    if config[KEY_COMPRESS_INTERMEDIATES]:
+        dependency_checks.check_dependencies(["bgzip"],[])
+    misc.add_arg_to_config(KEY_WATCH,args.watch,config)
+    misc.add_arg_to_config(KEY_WATCH_INTERVAL,args.watch_interval,config)
+    analysis_arg_parsing.check_if_int(KEY_WATCH_INTERVAL,config)
+    misc.add_arg_to_config(KEY_WATCH_TIMEOUT,args.watch_timeout,config)
+    analysis_arg_parsing.check_if_int(KEY_WATCH_TIMEOUT,config)
     init.set_up_verbosity(config)
 
+    return config, snakefile
+
+def run_workflows(snakefile,index_cache,config):
+    # the config the analysis workflow ran with (barcodes and the references found in each),
+    # or None if a workflow failed
+    import snakemake
+    import piranha.utils.custom_logger as custom_logger
+    from piranha.utils import reference_cache
+    from piranha.utils import resume
+    from piranha.analysis import live_run
+    from piranha.analysis import work_queue
+
+    # build (or reuse) the reference catalogue and minimap2 index once for all barcodes
+    reference_cache.reference_index_parsing(index_cache,config)
+
+    if config[KEY_WATCH]:
+        live_run.watch_run(os.path.join(thisdir,"scripts","consensus.smk"),config)
+
+    if config[KEY_RESUME]:
+        resume.write_preprocessing_keys(config)
+
     preprocessing_snakefile = data_install_checks.get_snakefile(thisdir,"preprocessing")
 
     if config[KEY_VERBOSE]:
         print(red("\n**** CONFIG ****"))
         for k in sorted(config):
             print(green(f" - {k}: ") + f"{config[k]}")
-        status = snakemake.snakemake(preprocessing_snakefile, printshellcmds=True, forceall=True, force_incomplete=True,
-                                    workdir=config[KEY_TEMPDIR], config=config, cores=config[KEY_THREADS],lock=False
+        status = snakemake.snakemake(preprocessing_snakefile, printshellcmds=True, forceall=not config[KEY_RESUME], force_incomplete=True,
+                                    workdir=config[KEY_TEMPDIR], config=config, cores=config[KEY_THREADS],resources=resources.workflow_resources(config),lock=False
+                                    )
+    else:
+        logger = custom_logger.Logger()
+        status = snakemake.snakemake(preprocessing_snakefile, printshellcmds=False, forceall=not config[KEY_RESUME], force_incomplete=True,
+                                    workdir=config[KEY_TEMPDIR], config=config, cores=config[KEY_THREADS],resources=resources.workflow_resources(config),lock=False,
+                                    quiet=True,log_handler=logger.log_handler
+                                    )
+    if not status:
+        return None
+
+    # written by a job of the preprocessing workflow, so this is read once here and the
+    # analysis workflow (and its report rules) are handed the result
+    with open(os.path.join(config[KEY_TEMPDIR],PREPROCESSING_CONFIG),"r") as f:
+        preprocessing_config = yaml.safe_load(f)
+    if config[KEY_RESUME]:
+        resume.write_consensus_keys(preprocessing_config)
+    if config[KEY_DISTRIBUTED] and not work_queue.run_distributed(preprocessing_config):
+        return None
+
+    if config[KEY_VERBOSE]:
+
+        print(red("\n**** CONFIG ****"))
+        for k in sorted(config):
+            print(green(f" - {k}: ") + f"{config[k]}")
+        status = snakemake.snakemake(snakefile, printshellcmds=True, forceall=not config[KEY_RESUME], force_incomplete=True,
+                                    workdir=config[KEY_TEMPDIR], config=preprocessing_config, cores=config[KEY_THREADS],resources=resources.workflow_resources(config),lock=False
                                     )
     else:
         logger = custom_logger.Logger()
-        status = snakemake.snakemake(preprocessing_snakefile, printshellcmds=False, forceall=True, force_incomplete=True,
-                                    workdir=config[KEY_TEMPDIR], config=config, cores=config[KEY_THREADS],lock=False,
+        status = snakemake.snakemake(snakefile, printshellcmds=False, forceall=not config[KEY_RESUME], force_incomplete=True,
+                                    workdir=config[KEY_TEMPDIR], config=preprocessing_config, cores=config[KEY_THREADS],resources=resources.workflow_resources(config),lock=False,
                                     quiet=True,log_handler=logger.log_handler
                                     )
+    if not status:
+        return None
+    return preprocessing_config
+
+def write_run_report(config,started):
+    # the tables collated for the report
+    from piranha.report.make_report import make_output_report
+    from piranha.utils import run_timeline
+
+    report =os.path.join(config[KEY_OUTDIR],OUTPUT_REPORT)
+    summary_csv=os.path.join(config[KEY_TEMPDIR],PREPROCESSING_SUMMARY)
+    composition_csv=os.path.join(config[KEY_TEMPDIR],SAMPLE_COMPOSITION)
+    read_summary_csv=os.path.join(config[KEY_TEMPDIR],READ_SUMMARY)
+    sample_seqs=os.path.join(config[KEY_OUTDIR],"published_data",SAMPLE_SEQS)
+    
+    detailed_csv = os.path.join(config[KEY_OUTDIR],"detailed_run_report.csv")
+
+    # jobs that finished before this run started were kept from a previous one by --resume
+    timeline = run_timeline.write_run_timeline(config,started)
+
+    data_for_report = make_output_report(report,config[KEY_BARCODES_CSV],summary_csv,composition_csv,sample_seqs,detailed_csv,config,read_summary_csv,timeline)
+
+    for r,d,f in os.walk(os.path.join(config[KEY_OUTDIR],"published_data")):
+        for fn in f:
 
-    if status: # translate "success" into shell exit code of 0
-        with open(os.path.join(config[KEY_TEMPDIR],PREPROCESSING_CONFIG),"r") as f:
-            preprocessing_config = yaml.safe_load(f)
-        
-
-        if config[KEY_VERBOSE]:
-
-            print(red("\n**** CONFIG ****"))
-            for k in sorted(config):
-                print(green(f" - {k}: ") + f"{config[k]}")
-            status = snakemake.snakemake(snakefile, printshellcmds=True, forceall=True, force_incomplete=True,
-                                        workdir=config[KEY_TEMPDIR], config=preprocessing_config, cores=config[KEY_THREADS],lock=False
-                                        )
-        else:
-            logger = custom_logger.Logger()
-            status = snakemake.snakemake(snakefile, printshellcmds=False, forceall=True, force_incomplete=True,
-                                        workdir=config[KEY_TEMPDIR], config=preprocessing_config, cores=config[KEY_THREADS],lock=False,
-                                        quiet=True,log_handler=logger.log_handler
-                                        )
-        if status: 
-            report =os.path.join(config[KEY_OUTDIR],OUTPUT_REPORT)
-            summary_csv=os.path.join(config[KEY_TEMPDIR],PREPROCESSING_SUMMARY)
-            composition_csv=os.path.join(config[KEY_TEMPDIR],SAMPLE_COMPOSITION)
-            sample_seqs=os.path.join(config[KEY_OUTDIR],"published_data",SAMPLE_SEQS)
-            
-            detailed_csv = os.path.join(config[KEY_OUTDIR],"detailed_run_report.csv")
-
-            make_output_report(report,config[KEY_BARCODES_CSV],summary_csv,composition_csv,sample_seqs,detailed_csv,config)
-
-            for r,d,f in os.walk(os.path.join(config[KEY_OUTDIR],"published_data")):
-                for fn in f:
-
-                    if not os.path.getsize(os.path.join(r,fn)):
-                        os.remove(os.path.join(r,fn))
-
-
-            return 0
-        
+            if not os.path.getsize(os.path.join(r,fn)):
+                os.remove(os.path.join(r,fn))
 
+    return data_for_report
+
+def main(sysargs = sys.argv[1:]):
+
+    if sysargs and sysargs[0] == "worker":
+        return worker(sysargs[1:])
+    if sysargs and sysargs[0] == "serve":
+        return serve(sysargs[1:])
+
+    parser = make_parser()
+
+    """
+    Exit with help menu if no args supplied
+    """
+
+    if len(sysargs)<1: 
+        parser.print_help()
+        sys.exit(0)
+    else:
+        args = parser.parse_args(sysargs)
+        if args.help:
+            parser.print_help()
+            sys.exit(0)
+
+    config, snakefile = set_up_run(args)
+
+    started = time.time()
+    if run_workflows(snakefile,args.index_cache,config) is None:
         return 1
-    return 1
+
+    write_run_report(config,started)
+    return 0
 
 
 
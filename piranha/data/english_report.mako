@@ -543,8 +543,56 @@
             } );
         </script>
 
+      % if data_for_report["read_summary_table"]:
+      <div class="pagebreak"> </div>
+      <h3><strong>Table 3</strong> | Read summary </h3>
+      <button class="accordion">Export table</button>
+        <div class="panel">
+          <div class="row">
+            <div class="col-sm-2" ><strong>Export table: </strong></div>
+            <div class="col-sm-8" id="tableExportIDReads"></div>
+          </div>
+        </div>
+        <table class="display nowrap" id="myTableReads">
+          <thead>
+            <tr>
+              <th style="width:15%;">Barcode</th>
+              <th style="width:15%;">Sample</th>
+              <th style="width:15%;">Total reads</th>
+              <th style="width:15%;">Reads passing length filter</th>
+              <th style="width:15%;">Median read length</th>
+              <th style="width:15%;">Median read quality</th>
+            </tr>
+          </thead>
+          <tbody>
+            % for row in data_for_report["read_summary_table"]:
+              <tr>
+                %for col in ["barcode","sample","total_reads","passed_reads","median_read_length","median_read_quality"]:
+                  <td>${row[col]}</td>
+                %endfor
+              </tr>
+            % endfor
+          </tbody>
+        </table>
+        <br>
+        <script type="text/javascript">
+          $(document).ready( function () {
+              var table = $('#myTableReads').DataTable({
+                'iDisplayLength': 100,
+                "paging": false,
+                "border-bottom":false,
+                "bInfo" : false,
+                dom: 'frtip',
+                buttons: ["copy","csv","print"]
+              });
+              table.buttons().container().appendTo( $('#tableExportIDReads') );
+              
+            } );
+        </script>
+      % endif
+
     <div class="pagebreak"> </div>
-    <h3><strong>Table 3</strong> | Flagged samples </h3>
+    <h3><strong>Table 4</strong> | Flagged samples </h3>
     <button class="accordion">Export table</button>
       <div class="panel">
         <div class="row">
@@ -593,7 +641,7 @@
 
       % if show_control_table:
         <div class="pagebreak"> </div>
-        <h3><strong>Table 4</strong> | Controls </h3>
+        <h3><strong>Table 5</strong> | Controls </h3>
           <table class="table">
             <thead class="thead-light">
               <tr>
@@ -702,6 +750,67 @@
      
      <h3><strong>Figure 1</strong> | Barcodes location on 96-well plate </h3>
      <br>
+
+     % if data_for_report["timeline_table"]:
+     <div class="pagebreak"> </div>
+     <div id="timelineViz"></div>
+     <script>
+       var vlSpec_timeline = {
+         "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+         "width": 800,
+         "data": {"values": ${timeline_json}},
+         "transform": [
+           {"calculate": "datum.rule + ' ' + (datum.barcode ? datum.barcode : '') + ' ' + (datum.reference ? datum.reference : '')", "as": "job"}
+         ],
+         "mark": "bar",
+         "encoding": {
+           "y": {"field": "job", "type": "nominal", "sort": {"field": "offset_start"}, "title": "",
+                 "axis": {"labelFont":"Helvetica Neue", "labelLimit": 400}},
+           "x": {"field": "offset_start", "type": "quantitative", "title": "Seconds into the run",
+                 "axis": {"labelFont":"Helvetica Neue", "titleFont":"Helvetica Neue"}},
+           "x2": {"field": "offset_end"},
+           "color": {"field": "rule", "type": "nominal", "title": "Step"},
+           "tooltip": [
+             {"field": "rule", "type": "nominal"},
+             {"field": "barcode", "type": "nominal"},
+             {"field": "reference", "type": "nominal"},
+             {"field": "seconds", "type": "quantitative"},
+             {"field": "cpu_time", "type": "quantitative"},
+             {"field": "max_rss_mb", "type": "quantitative"},
+             {"field": "io_in_mb", "type": "quantitative"},
+             {"field": "io_out_mb", "type": "quantitative"}
+           ]
+         }
+       };
+       vegaEmbed('#timelineViz', vlSpec_timeline, {renderer: "svg"})
+             .then(result => console.log(result))
+             .catch(console.warn);
+     </script>
+     <h3><strong>Figure 2</strong> | Run timeline, one bar per job</h3>
+     <br>
+     <table class="table">
+       <thead class="thead-light">
+         <tr>
+           <th>Step</th>
+           <th>Jobs</th>
+           <th>Time (s)</th>
+           <th>CPU time (s)</th>
+           <th>Peak memory (MB)</th>
+         </tr>
+       </thead>
+       <tbody>
+         % for row in data_for_report["timeline_table"]:
+           <tr>
+             %for col in ["rule","jobs","seconds","cpu_time","max_rss_mb"]:
+               <td>${row[col]}</td>
+             %endfor
+           </tr>
+         % endfor
+       </tbody>
+     </table>
+     <h3><strong>Table 6</strong> | Time spent in each step</h3>
+     <br>
+     % endif
     </div> 
 
 
@@ -552,9 +552,57 @@
             } );
         </script>
 
+      % if data_for_report["read_summary_table"]:
+      <div class="pagebreak"> </div>
+      <h3><strong>Tableau 3</strong> | Résumé des lectures </h3>
+      <button class="accordion">Exporter le tableau</button>
+        <div class="panel">
+          <div class="row">
+            <div class="col-sm-2" ><strong>Exporter le tableau: </strong></div>
+            <div class="col-sm-8" id="tableExportIDReads"></div>
+          </div>
+        </div>
+        <table class="display nowrap" id="myTableReads">
+          <thead>
+            <tr>
+              <th style="width:15%;">Code-barres</th>
+              <th style="width:15%;">Échantillon</th>
+              <th style="width:15%;">Nombre total de lectures</th>
+              <th style="width:15%;">Lectures passant le filtre de longueur</th>
+              <th style="width:15%;">Longueur médiane des lectures</th>
+              <th style="width:15%;">Qualité médiane des lectures</th>
+            </tr>
+          </thead>
+          <tbody>
+            % for row in data_for_report["read_summary_table"]:
+              <tr>
+                %for col in ["barcode","sample","total_reads","passed_reads","median_read_length","median_read_quality"]:
+                  <td>${row[col]}</td>
+                %endfor
+              </tr>
+            % endfor
+          </tbody>
+        </table>
+        <br>
+        <script type="text/javascript">
+          $(document).ready( function () {
+              var table = $('#myTableReads').DataTable({
+                'iDisplayLength': 100,
+                "paging": false,
+                "border-bottom":false,
+                "bInfo" : false,
+                dom: 'frtip',
+                buttons: ["copy","csv","print"]
+              });
+              table.buttons().container().appendTo( $('#tableExportIDReads') );
+              
+            } );
+        </script>
+      % endif
+
       
     <div class="pagebreak"> </div>
-    <h3><strong>Tableau 3</strong> | 
+    <h3><strong>Tableau 4</strong> | 
       Échantillons signalés </h3>
     <button class="accordion">Exporter le tableau:</button>
       <div class="panel">
@@ -604,7 +652,7 @@
       </script>
       % if show_control_table:
         <div class="pagebreak"> </div>
-        <h3><strong>Tableau 4</strong> | Les contrôles </h3>
+        <h3><strong>Tableau 5</strong> | Les contrôles </h3>
           <table class="table">
             <thead class="thead-light">
               <tr>
@@ -713,6 +761,67 @@
      </script>
      <h3><strong>Figure 1</strong> | Emplacement du code à barre sur la plaque 96 puits</h3>
      <br>
+
+     % if data_for_report["timeline_table"]:
+     <div class="pagebreak"> </div>
+     <div id="timelineViz"></div>
+     <script>
+       var vlSpec_timeline = {
+         "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+         "width": 800,
+         "data": {"values": ${timeline_json}},
+         "transform": [
+           {"calculate": "datum.rule + ' ' + (datum.barcode ? datum.barcode : '') + ' ' + (datum.reference ? datum.reference : '')", "as": "job"}
+         ],
+         "mark": "bar",
+         "encoding": {
+           "y": {"field": "job", "type": "nominal", "sort": {"field": "offset_start"}, "title": "",
+                 "axis": {"labelFont":"Helvetica Neue", "labelLimit": 400}},
+           "x": {"field": "offset_start", "type": "quantitative", "title": "Secondes depuis le début de l'analyse",
+                 "axis": {"labelFont":"Helvetica Neue", "titleFont":"Helvetica Neue"}},
+           "x2": {"field": "offset_end"},
+           "color": {"field": "rule", "type": "nominal", "title": "Étape"},
+           "tooltip": [
+             {"field": "rule", "type": "nominal"},
+             {"field": "barcode", "type": "nominal"},
+             {"field": "reference", "type": "nominal"},
+             {"field": "seconds", "type": "quantitative"},
+             {"field": "cpu_time", "type": "quantitative"},
+             {"field": "max_rss_mb", "type": "quantitative"},
+             {"field": "io_in_mb", "type": "quantitative"},
+             {"field": "io_out_mb", "type": "quantitative"}
+           ]
+         }
+       };
+       vegaEmbed('#timelineViz', vlSpec_timeline, {renderer: "svg"})
+             .then(result => console.log(result))
+             .catch(console.warn);
+     </script>
+     <h3><strong>Figure 2</strong> | Chronologie de l'analyse, une barre par tâche</h3>
+     <br>
+     <table class="table">
+       <thead class="thead-light">
+         <tr>
+           <th>Étape</th>
+           <th>Tâches</th>
+           <th>Durée (s)</th>
+           <th>Temps CPU (s)</th>
+           <th>Mémoire maximale (Mo)</th>
+         </tr>
+       </thead>
+       <tbody>
+         % for row in data_for_report["timeline_table"]:
+           <tr>
+             %for col in ["rule","jobs","seconds","cpu_time","max_rss_mb"]:
+               <td>${row[col]}</td>
+             %endfor
+           </tr>
+         % endfor
+       </tbody>
+     </table>
+     <h3><strong>Tableau 6</strong> | Temps passé dans chaque étape</h3>
+     <br>
+     % endif
     </div>
 
     <footer class="page-footer">
@@ -3,13 +3,11 @@
 import os
 import sys
 import yaml
-import subprocess
 from piranha.utils.log_colours import green,cyan
 from piranha.utils.config import *
 
 from piranha.utils import misc
-import piranha.utils.custom_logger as custom_logger
-import piranha.utils.log_handler_handle as lh
+from piranha.utils import tool_cache
 
 def check_if_int(key,config):
     if config[key]:
@@ -28,9 +26,9 @@ def check_if_float(key,config):
             sys.exit(-1)
 
 def get_available_medaka_models():
+    # medaka is slow to start, the list is only asked for again when medaka changes
     models = []
-    result = subprocess.run(["medaka", "tools", "list_models"],stdout=subprocess.PIPE)
-    result_string = result.stdout.decode('utf-8')
+    result_string = tool_cache.tool_output("medaka",["tools","list_models"])
     for line in result_string.split("\n"):
         if line.startswith("Available"):
             models = line.split(": ")[1].split(", ")
@@ -50,17 +48,18 @@ def medaka_options_parsing(medaka_model,medaka_list_models,config):
         sys.stderr.write(cyan(f"Medaka model specified not valid: `{config[KEY_MEDAKA_MODEL]}`.\nPlease use --medaka-list-models to see which models are available.\nIf needed, update medaka version with `pip install --upgrade medaka`.\n"))
         sys.exit(-1)
 
-def analysis_group_parsing(min_read_length,max_read_length,min_read_depth,min_read_pcent,primer_length,min_map_quality,config):
+def analysis_group_parsing(min_read_length,max_read_length,min_read_depth,max_read_depth,min_read_pcent,primer_length,min_map_quality,config):
 
     # if command line arg, overwrite config value
     misc.add_arg_to_config(KEY_MIN_READ_LENGTH,min_read_length,config)
     misc.add_arg_to_config(KEY_MAX_READ_LENGTH,max_read_length,config)
     misc.add_arg_to_config(KEY_MIN_READS,min_read_depth,config)
+    misc.add_arg_to_config(KEY_MAX_READS,max_read_depth,config)
     misc.add_arg_to_config(KEY_MIN_PCENT,min_read_pcent,config)
     misc.add_arg_to_config(KEY_PRIMER_LENGTH,primer_length,config)
     misc.add_arg_to_config(KEY_MIN_MAP_QUALITY,min_map_quality,config)
 
-    for key in [KEY_MIN_READ_LENGTH,KEY_MAX_READ_LENGTH,KEY_MIN_READS]:
+    for key in [KEY_MIN_READ_LENGTH,KEY_MAX_READ_LENGTH,KEY_MIN_READS,KEY_MAX_READS]:
         check_if_int(key,config)
     
     check_if_float(KEY_MIN_PCENT,config)
@@ -18,6 +18,7 @@ Desired behaviour
 Default outdir -> analysis-2021-XX-YY,
 check if that exists, append a number if it already exists -> analysis-2021-XX-YY_2
 --overwrite flag to overwrite the previous output directory
+--resume flag to reuse the previous output directory and any results still up to date
 
 If -o/--outdir then output that as the outdir instead, without a datestamp
 If -p/--output-prefix then output directory as: prefix-2021-XX-YY
@@ -39,7 +40,7 @@ def datestamped_outdir(config):
         else:
             outdir = config[KEY_OUTDIR]
 
-    if not config[KEY_OVERWRITE]:
+    if not config[KEY_OVERWRITE] and not config[KEY_RESUME]:
         counter = 1
         while os.path.exists(outdir):
             if outdir.split("_")[-1].isdigit():
@@ -52,7 +53,7 @@ def datestamped_outdir(config):
     return outdir,d
 
 def clear_old_files(config):
-    if config[KEY_OVERWRITE] and os.path.exists(config[KEY_OUTDIR]):
+    if config[KEY_OVERWRITE] and not config[KEY_RESUME] and os.path.exists(config[KEY_OUTDIR]):
         print(yellow("-----------------------"))
         print(green("Overwriting previous output in ") + config[KEY_OUTDIR] + ".")
         old_files = glob.glob(f'{config[KEY_OUTDIR]}/**/*.*', recursive=True)
@@ -76,6 +77,20 @@ def set_up_tempdir(config):
     if config[KEY_NO_TEMP]:
         tempdir = config[KEY_OUTDIR]
         config[KEY_TEMPDIR] = tempdir
+    elif config[KEY_RESUME] or config[KEY_DISTRIBUTED]:
+        # intermediate files have to stay in the same place between runs to be reused,
+        # and distributed workers need them somewhere they can see (the output directory)
+        if KEY_TEMPDIR in config:
+            tempdir = config[KEY_TEMPDIR]
+        else:
+            tempdir = os.path.join(config[KEY_OUTDIR],VALUE_RESUME_TEMPDIR)
+        try:
+            if not os.path.exists(tempdir):
+                os.makedirs(tempdir)
+        except:
+            sys.stderr.write(cyan(f'Error: cannot create temp directory {tempdir}.\n'))
+            sys.exit(-1)
+        config[KEY_TEMPDIR] = tempdir
     elif KEY_TEMPDIR in config:
         to_be_dir = config[KEY_TEMPDIR]
         try:
@@ -103,7 +118,7 @@ def set_up_tempdir(config):
             sys.stderr.write(cyan(f'Error: cannot write to temp directory {tempdir}.\n'))
             sys.exit(-1)
 
-def output_group_parsing(outdir,output_prefix,overwrite,datestamp,tempdir,no_temp,config):
+def output_group_parsing(outdir,output_prefix,overwrite,datestamp,tempdir,no_temp,resume,config):
     
     misc.add_path_to_config(KEY_OUTDIR,outdir,config)
     misc.add_arg_to_config(KEY_OUTPUT_PREFIX,output_prefix,config)
@@ -111,6 +126,7 @@ def output_group_parsing(outdir,output_prefix,overwrite,datestamp,tempdir,no_tem
     misc.add_arg_to_config(KEY_DATESTAMP,datestamp,config)
     misc.add_path_to_config(KEY_TEMPDIR,tempdir,config)
     misc.add_arg_to_config(KEY_NO_TEMP,no_temp,config)
+    misc.add_arg_to_config(KEY_RESUME,resume,config)
 
     config[KEY_OUTDIR],d = datestamped_outdir(config)
     
@@ -3,14 +3,13 @@
 import os
 import sys
 import yaml
+import importlib.util
 from datetime import date
 
 from piranha.utils.log_colours import green,cyan
 from piranha.utils.config import *
 
 from piranha.utils import misc
-import piranha.utils.custom_logger as custom_logger
-import piranha.utils.log_handler_handle as lh
 
 
 def get_defaults():
@@ -20,6 +19,7 @@ def get_defaults():
                     #input options
                     KEY_READDIR: False,
                     KEY_REFERENCE_SEQUENCES: False,
+                    KEY_INDEX_CACHE: False,
                     KEY_BARCODES_CSV: False,
                     KEY_RUNID: False,
 
@@ -28,12 +28,14 @@ def get_defaults():
                     KEY_DATESTAMP:False,
                     KEY_NO_TEMP:False,
                     KEY_OVERWRITE:False,
+                    KEY_RESUME:False,
                     KEY_REFERENCES_FOR_CNS:VALUE_REFERENCES_FOR_CNS,
                     KEY_SUMMARY_HEADERS: VALUE_SUMMARY_HEADERS,
 
                     # input seq options
                     KEY_SAMPLE_TYPE:VALUE_SAMPLE_TYPE,  #options are stool or environmental
                     KEY_ANALYSIS_MODE:VALUE_ANALYSIS_MODE, #options are vp1 currently
+                    KEY_MAX_READS:VALUE_MAX_READS,
                     KEY_MIN_READS:VALUE_MIN_READS,   # where to pad to using datafunk
                     KEY_MIN_PCENT:VALUE_MIN_PCENT,
 
@@ -53,7 +55,19 @@ def get_defaults():
                     KEY_POSITIVE:VALUE_POSITIVE,
                     KEY_NEGATIVE:VALUE_NEGATIVE,
                     KEY_INSTITUTE:"",
-                    KEY_THREADS:1,
+                    KEY_THREADS:VALUE_AUTO,
+                    KEY_MAX_MEMORY:VALUE_AUTO,
+                    KEY_PARALLEL_INGEST:False,
+                    KEY_FUSE_FILTER_MAP:False,
+                    KEY_BATCH_MAPPING:False,
+                    KEY_MAPPING_BACKEND:VALUE_MAPPING_BACKEND,
+                    KEY_SINGLE_DAG:False,
+                    KEY_DISTRIBUTED:False,
+                    KEY_GROUPING_MEMORY:VALUE_GROUPING_MEMORY,
+                    KEY_COMPRESS_INTERMEDIATES:False,
+                    KEY_WATCH:False,
+                    KEY_WATCH_INTERVAL:VALUE_WATCH_INTERVAL,
+                    KEY_WATCH_TIMEOUT:VALUE_WATCH_TIMEOUT,
                     KEY_VERBOSE:False,
 
                     KEY_COLOUR_MAP: VALUE_COLOUR_MAP,
@@ -70,14 +84,29 @@ def valid_args():
         KEY_OUTPUT_PREFIX,
         KEY_TEMPDIR,
         KEY_NO_TEMP,
+        KEY_RESUME,
         KEY_OVERWRITE,
         KEY_MIN_READ_LENGTH,
         KEY_MAX_READ_LENGTH,
         KEY_MIN_READS,
+        KEY_MAX_READS,
         KEY_MIN_PCENT,
         KEY_THREADS,
+        KEY_MAX_MEMORY,
+        KEY_PARALLEL_INGEST,
+        KEY_FUSE_FILTER_MAP,
+        KEY_BATCH_MAPPING,
+        KEY_MAPPING_BACKEND,
+        KEY_SINGLE_DAG,
+        KEY_DISTRIBUTED,
+        KEY_GROUPING_MEMORY,
+        KEY_COMPRESS_INTERMEDIATES,
+        KEY_WATCH,
+        KEY_WATCH_INTERVAL,
+        KEY_WATCH_TIMEOUT,
         KEY_VERBOSE,
         KEY_REFERENCE_SEQUENCES,
+        KEY_INDEX_CACHE,
         KEY_REFERENCES_FOR_CNS
     ]
 
@@ -106,7 +135,7 @@ def load_yaml(f):
     return input_config
 
 def return_path_keys():
-    return [KEY_READDIR,KEY_OUTDIR,KEY_TEMPDIR]
+    return [KEY_READDIR,KEY_OUTDIR,KEY_TEMPDIR,KEY_INDEX_CACHE]
 
 def setup_absolute_paths(path_to_file,value):
     return os.path.join(path_to_file,value)
@@ -178,5 +207,6 @@ def set_up_verbosity(config):
     else:
         config[KEY_QUIET] = True
         config[KEY_LOG_API] = ""
-        lh_path = os.path.realpath(lh.__file__)
+        # found rather than imported, importing it pulls in snakemake
+        lh_path = os.path.realpath(importlib.util.find_spec("piranha.utils.log_handler_handle").origin)
         config[KEY_LOG_STRING] = f"--quiet --log-handler-script {lh_path} "
\ No newline at end of file
@@ -15,6 +15,7 @@ from Bio import SeqIO
 from piranha import __version__
 from piranha.utils.log_colours import green,cyan
 from piranha.utils.config import *
+from piranha.analysis.read_manifest import load_read_summary
 
 
 def get_snipit(reference,snipit_file):
@@ -353,7 +354,7 @@ def data_for_plate_viz(positives_for_plate_viz,barcode_csv,orientation):
             
     return json.dumps(wells_to_json), all_positive_types
 
-def make_output_report(report_to_generate,barcodes_csv,preprocessing_summary,sample_composition,consensus_seqs,detailed_csv_out,config):
+def make_output_report(report_to_generate,barcodes_csv,preprocessing_summary,sample_composition,consensus_seqs,detailed_csv_out,config,read_summary=None,timeline=None):
     
     # which are the negative controls and positive controls
     negative_control = config[KEY_NEGATIVE]
@@ -368,7 +369,7 @@ def make_output_report(report_to_generate,barcodes_csv,preprocessing_summary,sam
     show_control_table = False
     
     # collate data for tables in the report
-    data_for_report = {KEY_SUMMARY_TABLE:[],KEY_COMPOSITION_TABLE:[]}
+    data_for_report = {KEY_SUMMARY_TABLE:[],KEY_COMPOSITION_TABLE:[],KEY_READ_SUMMARY_TABLE:[],KEY_TIMELINE_TABLE:[]}
     positives_for_plate_viz = collections.defaultdict(dict)
 
     with open(preprocessing_summary,"r") as f:
@@ -415,6 +416,16 @@ def make_output_report(report_to_generate,barcodes_csv,preprocessing_summary,sam
                     if proportion_npev > config[KEY_MIN_PCENT]:
                         flagged_high_npev.append(row[KEY_SAMPLE])
 
+    # read counts and length/ quality summaries from the read manifests
+    if read_summary:
+        data_for_report[KEY_READ_SUMMARY_TABLE] = load_read_summary(read_summary)
+
+    # time spent in each step, and each job on a timeline
+    timeline_json = "[]"
+    if timeline:
+        data_for_report[KEY_TIMELINE_TABLE] = timeline["rules"]
+        timeline_json = json.dumps(timeline["jobs"])
+
     # to check if there are identical seqs in the run
     identical_seq_check = collections.defaultdict(list)
 
@@ -512,6 +523,7 @@ def make_output_report(report_to_generate,barcodes_csv,preprocessing_summary,sam
                     flagged_seqs = flagged_seqs,
                     detailed_csv_out = detailed_csv_out,
                     flagged_high_npev = flagged_high_npev,
+                    timeline_json = timeline_json,
                     config=config)
 
     try:
@@ -526,3 +538,5 @@ def make_output_report(report_to_generate,barcodes_csv,preprocessing_summary,sam
     with open(report_to_generate, 'w') as fw:
         print(green("Generating: ") + f"{report_to_generate}")
         fw.write(buf.getvalue())
+
+    return data_for_report
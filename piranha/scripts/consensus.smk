@@ -9,38 +9,75 @@ from piranha.analysis.clean_gaps import *
 from piranha.analysis.consensus_functions import *
 from piranha.utils.log_colours import green,cyan
 from piranha.utils.config import *
+from piranha.utils.compressed_io import intermediate_ext
+from piranha.analysis.stool_functions import get_sample
+from piranha.utils.resources import job_memory
+from piranha.utils.resume import reference_key_file
+from piranha.utils.run_timeline import benchmark_file
 
+# runs on its own for one barcode (barcode, sample and tempdir given with --config), or as a
+# module of the mode workflows with --single-dag, where the barcode is a wildcard
+NESTED = KEY_BARCODE in config
+if NESTED:
+    BARCODE_DIR = config[KEY_TEMPDIR]
+    BARCODE = config[KEY_BARCODE]
+    SAMPLE = str(config[KEY_SAMPLE])
+    REFERENCES = config[BARCODE]
+else:
+    BARCODE_DIR = os.path.join(config[KEY_TEMPDIR],"{barcode}")
+    BARCODE = lambda wildcards: wildcards.barcode
+    SAMPLE = lambda wildcards: str(get_sample(config[KEY_BARCODES_CSV],wildcards.barcode))
+    REFERENCES = lambda wildcards: config[wildcards.barcode]
 
-BARCODE = config[KEY_BARCODE]
-SAMPLE = str(config[KEY_SAMPLE])
-REFERENCES = config[BARCODE]
+    wildcard_constraints:
+        barcode="[^/]+",
+        reference="[^/]+"
+
+# with --resume a reference is only rerun when its key changes (utils/resume.py), not whenever
+# preprocessing rewrites its reads
+if config[KEY_RESUME]:
+    REFERENCE_KEY = reference_key_file(BARCODE_DIR,"{reference}")
+    reference_input = ancient
+else:
+    REFERENCE_KEY = []
+    reference_input = lambda path: path
+
+def per_reference(path):
+    if NESTED:
+        return expand(path, reference=REFERENCES)
+    return lambda wildcards: expand(path, barcode=wildcards.barcode, reference=REFERENCES(wildcards))
 
 rule all:
     input:
-        os.path.join(config[KEY_TEMPDIR],"consensus_sequences.fasta"),
-        os.path.join(config[KEY_TEMPDIR],"variants.csv"),
-        os.path.join(config[KEY_TEMPDIR],"masked_variants.csv"),
-        expand(os.path.join(config[KEY_TEMPDIR],"variant_calls","{reference}.vcf"), reference=REFERENCES),
-        expand(os.path.join(config[KEY_TEMPDIR],"snipit","{reference}.svg"), reference=REFERENCES),
+        os.path.join(BARCODE_DIR,"consensus_sequences.fasta"),
+        os.path.join(BARCODE_DIR,"variants.csv"),
+        os.path.join(BARCODE_DIR,"masked_variants.csv"),
+        per_reference(os.path.join(BARCODE_DIR,"variant_calls","{reference}.vcf")),
+        per_reference(os.path.join(BARCODE_DIR,"snipit","{reference}.svg")),
 
 rule files:
     params:
-        ref=os.path.join(config[KEY_TEMPDIR],"reference_groups","{reference}.reference.fasta"),
-        reads=os.path.join(config[KEY_TEMPDIR],"reference_groups","{reference}.fastq")
+        ref=os.path.join(BARCODE_DIR,"reference_groups","{reference}.reference.fasta"),
+        reads=os.path.join(BARCODE_DIR,"reference_groups","{reference}"+intermediate_ext(".fastq",config))
 
 rule medaka_haploid_variant:
     input:
-        reads=rules.files.params.reads,
-        ref=rules.files.params.ref
+        reads=reference_input(rules.files.params.reads),
+        ref=reference_input(rules.files.params.ref),
+        key=REFERENCE_KEY
     params:
         model = config[KEY_MEDAKA_MODEL],
-        outdir =  os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","medaka_haploid_variant")
+        outdir =  os.path.join(BARCODE_DIR,"reference_analysis","{reference}","medaka_haploid_variant")
+    benchmark: benchmark_file(BARCODE_DIR,"medaka_haploid_variant","{reference}")
     output:
-        probs = os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","medaka_haploid_variant","consensus_probs.hdf"),
-        vcf = os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","medaka_haploid_variant","medaka.vcf"),
-        cns = os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","medaka_haploid_variant","consensus.fasta"),
-        pub_vcf = os.path.join(config[KEY_TEMPDIR],"variant_calls","{reference}.vcf")
-    log: os.path.join(config[KEY_TEMPDIR],"logs","{reference}.hapoid_variant.log")
+        probs = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","medaka_haploid_variant","consensus_probs.hdf"),
+        vcf = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","medaka_haploid_variant","medaka.vcf"),
+        cns = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","medaka_haploid_variant","consensus.fasta"),
+        bam = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","medaka_haploid_variant","calls_to_ref.bam"),
+        pub_vcf = os.path.join(BARCODE_DIR,"variant_calls","{reference}.vcf")
+    threads: VALUE_MEDAKA_THREADS
+    resources: mem_mb = job_memory(VALUE_MEDAKA_MEMORY,config)
+    log: os.path.join(BARCODE_DIR,"logs","{reference}.hapoid_variant.log")
     shell:
         """
         [ ! -d {params.outdir:q} ] && mkdir {params.outdir:q}
@@ -49,28 +86,34 @@ rule medaka_haploid_variant:
             medaka_haploid_variant -i {input.reads:q} \
                                 -r {input.ref:q} \
                                 -o {params.outdir:q} \
+                                -t {threads} \
                                 -f -x && \
             medaka stitch {output.probs:q} {input.ref:q} {output.cns:q}
         else
             touch {output.cns:q}
             touch {output.probs:q}
             touch {output.vcf:q}
+            touch {output.bam:q}
         fi
         cp {output.vcf:q} {output.pub_vcf:q}
         """
 
 rule medaka_haploid_variant_cns:
     input:
-        reads=rules.files.params.reads,
+        reads=reference_input(rules.files.params.reads),
         ref=rules.medaka_haploid_variant.output.cns
     params:
         model = config[KEY_MEDAKA_MODEL],
-        outdir = os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","medaka_haploid_variant_cns")
+        outdir = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","medaka_haploid_variant_cns")
+    benchmark: benchmark_file(BARCODE_DIR,"medaka_haploid_variant_cns","{reference}")
     output:
-        probs = os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","medaka_haploid_variant_cns","consensus_probs.hdf"),
-        vcf = os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","medaka_haploid_variant_cns","medaka.vcf"),
-        cns = os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","medaka_haploid_variant_cns","consensus.fasta")
-    log: os.path.join(config[KEY_TEMPDIR],"logs","{reference}_cns.hapoid_variant.log")
+        probs = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","medaka_haploid_variant_cns","consensus_probs.hdf"),
+        vcf = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","medaka_haploid_variant_cns","medaka.vcf"),
+        cns = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","medaka_haploid_variant_cns","consensus.fasta"),
+        bam = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","medaka_haploid_variant_cns","calls_to_ref.bam")
+    threads: VALUE_MEDAKA_THREADS
+    resources: mem_mb = job_memory(VALUE_MEDAKA_MEMORY,config)
+    log: os.path.join(BARCODE_DIR,"logs","{reference}_cns.hapoid_variant.log")
     shell:
         """
         [ ! -d {params.outdir:q} ] && mkdir {params.outdir:q}
@@ -79,25 +122,29 @@ rule medaka_haploid_variant_cns:
             medaka_haploid_variant -i {input.reads:q} \
                                 -r {input.ref:q} \
                                 -o {params.outdir} \
+                                -t {threads} \
                                 -f -x && \
             medaka stitch {output.probs} {input.ref} {output.cns}
         else
             touch {output.cns:q}
             touch {output.probs:q}
             touch {output.vcf:q}
+            touch {output.bam:q}
         fi
         """
 
 
 rule join_cns_ref:
     input:
-        ref=rules.files.params.ref,
+        ref=reference_input(rules.files.params.ref),
         medaka_cns=rules.medaka_haploid_variant.output.cns,
         cns_cns=rules.medaka_haploid_variant_cns.output.cns
     params:
-        reference = "{reference}"
+        reference = "{reference}",
+        sample = SAMPLE
+    benchmark: benchmark_file(BARCODE_DIR,"join_cns_ref","{reference}")
     output:
-        fasta = os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","ref_cns.fasta")
+        fasta = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","ref_cns.fasta")
     run:
         with open(output[0],"w") as fw:
             for record in SeqIO.parse(input.ref,KEY_FASTA):
@@ -109,19 +156,20 @@ rule join_cns_ref:
                 fw.write(f">{display_name} {record.description}\n{record.seq}\n")
             if "Sabin" in params.reference:
                 for record in SeqIO.parse(input.medaka_cns,KEY_FASTA):
-                    record_name = str(SAMPLE).replace(" ","_")
+                    record_name = str(params.sample).replace(" ","_")
                     fw.write(f">{record_name}\n{record.seq}\n")
             else:
                 for record in SeqIO.parse(input.cns_cns,KEY_FASTA):
-                    record_name = str(SAMPLE).replace(" ","_")
+                    record_name = str(params.sample).replace(" ","_")
                     fw.write(f">{record_name}\n{record.seq}\n")
 
 
 rule align_cns_ref:
     input:
         rules.join_cns_ref.output.fasta
+    benchmark: benchmark_file(BARCODE_DIR,"align_cns_ref","{reference}")
     output:
-        aln = os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","ref_cns.aln.fasta")
+        aln = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","ref_cns.aln.fasta")
     shell:
         """
         mafft {input:q} > {output:q}
@@ -131,12 +179,14 @@ rule curate_variants:
     input:
         aln = rules.align_cns_ref.output.aln
     params:
-        reference = "{reference}"
+        reference = "{reference}",
+        sample = SAMPLE
+    benchmark: benchmark_file(BARCODE_DIR,"curate_variants","{reference}")
     output:
-        masked = os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","masked.csv"),
-        fasta = os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","medaka_cns_clean.fasta")
+        masked = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","masked.csv"),
+        fasta = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","medaka_cns_clean.fasta")
     run:
-        masked = clean_medaka_cns(SAMPLE, input.aln, output.fasta)
+        masked = clean_medaka_cns(params.sample, input.aln, output.fasta)
         with open(output.masked,"w") as fw:
             for var in masked:
                 site = int(var) + 1
@@ -144,9 +194,10 @@ rule curate_variants:
 
 rule gather_masked_variants:
     input:
-        expand(rules.curate_variants.output.masked, reference=REFERENCES)
+        per_reference(rules.curate_variants.output.masked)
+    benchmark: benchmark_file(BARCODE_DIR,"gather_masked_variants")
     output:
-        masked = os.path.join(config[KEY_TEMPDIR],"masked_variants.csv")
+        masked = os.path.join(BARCODE_DIR,"masked_variants.csv")
     run:
         with open(output.masked,"w") as fw:
             fw.write("reference,site,variant\n")
@@ -159,10 +210,13 @@ rule gather_masked_variants:
 
 rule join_clean_cns_ref:
     input:
-        ref=rules.files.params.ref,
+        ref=reference_input(rules.files.params.ref),
         cns=rules.curate_variants.output.fasta
+    params:
+        sample = SAMPLE
+    benchmark: benchmark_file(BARCODE_DIR,"join_clean_cns_ref","{reference}")
     output:
-        fasta = os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","ref_medaka_cns_clean.fasta")
+        fasta = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","ref_medaka_cns_clean.fasta")
     run:
         with open(output[0],"w") as fw:
             for record in SeqIO.parse(input.ref,KEY_FASTA):
@@ -173,14 +227,15 @@ rule join_clean_cns_ref:
 
                 fw.write(f">{display_name} {record.description}\n{record.seq}\n")
             for record in SeqIO.parse(input.cns,KEY_FASTA):
-                record_name = SAMPLE.replace(" ","_")
+                record_name = params.sample.replace(" ","_")
                 fw.write(f">{record_name}\n{record.seq}\n")
 
 rule align_clean_cns_ref:
     input:
         rules.join_clean_cns_ref.output.fasta
+    benchmark: benchmark_file(BARCODE_DIR,"align_clean_cns_ref","{reference}")
     output:
-        aln = os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","ref_medaka_cns_clean.aln.fasta")
+        aln = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","ref_medaka_cns_clean.aln.fasta")
     shell:
         """
         mafft {input:q} > {output:q}
@@ -190,9 +245,10 @@ rule make_snipit_graph:
     input:
         aln = rules.align_clean_cns_ref.output.aln
     params:
-        out_stem = os.path.join(config[KEY_TEMPDIR],"snipit","{reference}")
+        out_stem = os.path.join(BARCODE_DIR,"snipit","{reference}")
+    benchmark: benchmark_file(BARCODE_DIR,"make_snipit_graph","{reference}")
     output:
-        os.path.join(config[KEY_TEMPDIR],"snipit","{reference}.svg")
+        os.path.join(BARCODE_DIR,"snipit","{reference}.svg")
     run:
         try:
             shell("""snipit {input.aln:q} -o {params.out_stem} -f svg -c wes""")
@@ -203,26 +259,32 @@ rule assess_variants:
     input:
         rules.align_clean_cns_ref.output.aln
     params:
-        reference = "{reference}"
+        reference = "{reference}",
+        barcode = BARCODE
+    benchmark: benchmark_file(BARCODE_DIR,"assess_variants","{reference}")
     output:
-        csv = os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","variants.csv")
+        csv = os.path.join(BARCODE_DIR,"reference_analysis","{reference}","variants.csv")
     run:
-        parse_variants(input[0],output.csv,BARCODE,params.reference)
+        parse_variants(input[0],output.csv,params.barcode,params.reference)
 
 rule gather_variants:
     input:
-        expand(rules.assess_variants.output.csv, reference=REFERENCES)
+        per_reference(rules.assess_variants.output.csv)
+    benchmark: benchmark_file(BARCODE_DIR,"gather_variants")
     output:
-        csv = os.path.join(config[KEY_TEMPDIR],"variants.csv")
+        csv = os.path.join(BARCODE_DIR,"variants.csv")
     run:
         join_variant_files(VARIANT_CALLS_HEADER_FIELDS,input,output.csv)
 
 rule gather_cns:
     input:
         variants = rules.gather_variants.output.csv,
-        seqs = expand(rules.curate_variants.output.fasta, reference=REFERENCES)
+        seqs = per_reference(rules.curate_variants.output.fasta)
+    params:
+        barcode = BARCODE
+    benchmark: benchmark_file(BARCODE_DIR,"gather_cns")
     output:
-        os.path.join(config[KEY_TEMPDIR],"consensus_sequences.fasta")
+        os.path.join(BARCODE_DIR,"consensus_sequences.fasta")
     run:
         var_dict = {}
         with open(input.variants, "r") as f:
@@ -236,4 +298,4 @@ rule gather_cns:
                 for record in SeqIO.parse(in_file,KEY_FASTA):
                     variant_count = var_dict[reference]["variant_count"]
                     variant_string = var_dict[reference]["variants"]
-                    fw.write(f">{reference}|{BARCODE}|{variant_count}|{variant_string}\n{record.seq}\n")
\ No newline at end of file
+                    fw.write(f">{reference}|{params.barcode}|{variant_count}|{variant_string}\n{record.seq}\n")
\ No newline at end of file
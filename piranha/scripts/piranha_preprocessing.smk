@@ -8,6 +8,28 @@ import yaml
 from piranha.utils.log_colours import green,cyan,yellow
 from piranha.utils.config import *
 from piranha.analysis.preprocessing import *
+from piranha.analysis.read_manifest import write_read_summary
+from piranha.utils.compressed_io import intermediate_ext
+from piranha.utils.resume import resume_key_file
+from piranha.analysis.in_process_mapping import map_reads_in_process
+from piranha.utils.resources import barcode_share,job_memory
+from piranha.utils.run_timeline import benchmark_file
+
+READS_EXT = intermediate_ext(".fastq",config)
+PAF_EXT = intermediate_ext(".paf",config)
+
+# with --resume, a barcode's reads are only reprocessed when its content key changes (utils/resume.py)
+if config[KEY_RESUME]:
+    READS_KEY_FILE = resume_key_file(config[KEY_TEMPDIR],"{barcode}",READS_KEY)
+else:
+    READS_KEY_FILE = []
+
+# per barcode jobs split the cores between them rather than each taking them all
+BARCODE_THREADS = barcode_share(workflow.cores,config[KEY_BARCODES])
+
+# mappy maps and groups the filtered reads in-process, without minimap2 or a paf file in between
+MAPPY_BACKEND = config[KEY_MAPPING_BACKEND] == VALUE_MAPPING_BACKEND_MAPPY
+
 ##### Target rules #####
 
 rule all:
@@ -16,88 +38,194 @@ rule all:
         expand(os.path.join(config[KEY_TEMPDIR],"{barcode}","reference_groups","prompt.txt"), barcode=config[KEY_BARCODES]),
         expand(os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","refs_present.csv"), barcode=config[KEY_BARCODES])
 
-rule filter_by_length:
-    input:
-    params:
-        file_path = os.path.join(config[KEY_READDIR], "{barcode}"),
-        barcode = "{barcode}"
-    output:
-        fastq = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","filtered_reads.fastq")
-    run:
-        gather_filter_reads_by_length(params.file_path,params.barcode,output.fastq,config)
+if config[KEY_FUSE_FILTER_MAP] and not MAPPY_BACKEND:
+    rule filter_and_map_reads:
+        input:
+            ref = config[KEY_REFERENCE_INDEX],
+            key = READS_KEY_FILE
+        params:
+            file_path = os.path.join(config[KEY_READDIR], "{barcode}"),
+            barcode = "{barcode}"
+        threads: BARCODE_THREADS
+        resources: mem_mb = job_memory(VALUE_MAPPING_MEMORY,config)
+        log: os.path.join(config[KEY_TEMPDIR],"logs","{barcode}.minimap2_initial.log")
+        benchmark: benchmark_file(os.path.join(config[KEY_TEMPDIR],"{barcode}"),"filter_and_map_reads")
+        output:
+            fastq = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","filtered_reads.fastq.gz"),
+            manifest = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing",READ_MANIFEST),
+            paf = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","filtered_reads"+PAF_EXT)
+        run:
+            gather_filter_map_reads(params.file_path,params.barcode,output.fastq,output.manifest,output.paf,input.ref,log[0],config,threads)
 
-rule map_reads:
-    input:
-        ref = config[KEY_REFERENCE_SEQUENCES],
-        fastq = rules.filter_by_length.output.fastq
-    threads: workflow.cores
-    log: os.path.join(config[KEY_TEMPDIR],"logs","{barcode}.minimap2_initial.log")
-    output:
-        paf = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","filtered_reads.paf")
-    shell:
-        """
-        minimap2 -t {threads} -x map-ont --secondary=no --paf-no-hit \
-        {input.ref:q} \
-        {input.fastq:q} -o {output:q} &> {log:q}
-        """
+    FILTERED_READS = rules.filter_and_map_reads.output.fastq
+    READ_MANIFESTS = rules.filter_and_map_reads.output.manifest
+    MAPPED_READS = rules.filter_and_map_reads.output.paf
 
+else:
+    rule filter_by_length:
+        input:
+            key = READS_KEY_FILE
+        params:
+            file_path = os.path.join(config[KEY_READDIR], "{barcode}"),
+            barcode = "{barcode}"
+        threads: BARCODE_THREADS if config[KEY_PARALLEL_INGEST] else 1
+        benchmark: benchmark_file(os.path.join(config[KEY_TEMPDIR],"{barcode}"),"filter_by_length")
+        output:
+            fastq = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","filtered_reads"+READS_EXT),
+            manifest = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing",READ_MANIFEST)
+        run:
+            gather_filter_reads_by_length(params.file_path,params.barcode,output.fastq,output.manifest,config,threads)
 
-rule assess_broad_diversity:
-    input:
-        map_file = rules.map_reads.output.paf,
-        ref = config[KEY_REFERENCE_SEQUENCES]
-    params:
-        barcode = "{barcode}",
-        min_map_quality = config[KEY_MIN_MAP_QUALITY]
-    output:
-        csv = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","refs_present.csv"),
-        hits = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","hits_reads.csv")
-    run:
-        parse_paf_file(input.map_file,
-                        output.csv,
-                        output.hits,
-                        config[KEY_REFERENCE_SEQUENCES],
-                        params.barcode,
-                        config[KEY_ANALYSIS_MODE],
-                        params.min_map_quality,
-                        config)
+    if MAPPY_BACKEND:
+        MAPPED_READS = None
+
+    elif config[KEY_BATCH_MAPPING]:
+        rule map_reads_batched:
+            input:
+                ref = config[KEY_REFERENCE_INDEX],
+                fastqs = expand(rules.filter_by_length.output.fastq, barcode=config[KEY_BARCODES])
+            params:
+                barcodes = config[KEY_BARCODES]
+            threads: workflow.cores
+            resources: mem_mb = job_memory(VALUE_MAPPING_MEMORY,config)
+            log: os.path.join(config[KEY_TEMPDIR],"logs","minimap2_initial.log")
+            benchmark: benchmark_file(config[KEY_TEMPDIR],"map_reads_batched")
+            output:
+                pafs = expand(os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","filtered_reads"+PAF_EXT), barcode=config[KEY_BARCODES])
+            run:
+                batch_map_reads(input.fastqs,params.barcodes,output.pafs,input.ref,log[0],threads)
+
+        MAPPED_READS = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","filtered_reads"+PAF_EXT)
+
+    else:
+        if config[KEY_COMPRESS_INTERMEDIATES]:
+            MINIMAP2_OUTPUT = "2> {log:q} | bgzip -@ {threads} > {output:q}"
+        else:
+            MINIMAP2_OUTPUT = "-o {output:q} &> {log:q}"
+
+        rule map_reads:
+            input:
+                ref = config[KEY_REFERENCE_INDEX],
+                fastq = rules.filter_by_length.output.fastq
+            params:
+                preset = VALUE_MINIMAP2_PRESET
+            threads: BARCODE_THREADS
+            resources: mem_mb = job_memory(VALUE_MAPPING_MEMORY,config)
+            log: os.path.join(config[KEY_TEMPDIR],"logs","{barcode}.minimap2_initial.log")
+            benchmark: benchmark_file(os.path.join(config[KEY_TEMPDIR],"{barcode}"),"map_reads")
+            output:
+                paf = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","filtered_reads"+PAF_EXT)
+            shell:
+                """
+                minimap2 -t {threads} -x {params.preset} --secondary=no --paf-no-hit \
+                {input.ref:q} \
+                {input.fastq:q} """ + MINIMAP2_OUTPUT
+
+        MAPPED_READS = rules.map_reads.output.paf
+
+    FILTERED_READS = rules.filter_by_length.output.fastq
+    READ_MANIFESTS = rules.filter_by_length.output.manifest
+
+
+if MAPPY_BACKEND:
+    rule assess_broad_diversity:
+        input:
+            fastq = FILTERED_READS,
+            index = config[KEY_REFERENCE_INDEX],
+            catalogue = config[KEY_REFERENCE_CATALOGUE]
+        params:
+            barcode = "{barcode}",
+            min_map_quality = config[KEY_MIN_MAP_QUALITY],
+            # the paf is only written when keeping intermediate files, for debugging
+            paf = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","filtered_reads.paf") if config[KEY_NO_TEMP] else None
+        threads: BARCODE_THREADS
+        resources: mem_mb = job_memory(VALUE_MAPPING_MEMORY + config[KEY_GROUPING_MEMORY],config)
+        benchmark: benchmark_file(os.path.join(config[KEY_TEMPDIR],"{barcode}"),"assess_broad_diversity")
+        output:
+            csv = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","refs_present.csv"),
+            hits = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","hits_reads.csv")
+        run:
+            map_reads_in_process(input.fastq,
+                                output.csv,
+                                output.hits,
+                                input.catalogue,
+                                params.barcode,
+                                input.index,
+                                params.min_map_quality,
+                                config,
+                                threads,
+                                params.paf)
+
+else:
+    rule assess_broad_diversity:
+        input:
+            map_file = MAPPED_READS,
+            catalogue = config[KEY_REFERENCE_CATALOGUE]
+        params:
+            barcode = "{barcode}",
+            min_map_quality = config[KEY_MIN_MAP_QUALITY]
+        resources: mem_mb = job_memory(config[KEY_GROUPING_MEMORY],config)
+        benchmark: benchmark_file(os.path.join(config[KEY_TEMPDIR],"{barcode}"),"assess_broad_diversity")
+        output:
+            csv = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","refs_present.csv"),
+            hits = os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","hits_reads.csv")
+        run:
+            parse_paf_file(input.map_file,
+                            output.csv,
+                            output.hits,
+                            input.catalogue,
+                            params.barcode,
+                            config[KEY_ANALYSIS_MODE],
+                            params.min_map_quality,
+                            config)
 
 rule write_hit_fastq:
     input:
         csv = rules.assess_broad_diversity.output.csv,
         hits = rules.assess_broad_diversity.output.hits,
-        fastq = rules.filter_by_length.output.fastq
+        fastq = FILTERED_READS
     params:
         primer_len = config[KEY_PRIMER_LENGTH],
         barcode = "{barcode}",
         outdir = os.path.join(config[KEY_TEMPDIR],"{barcode}","reference_groups"),
         publish_dir = os.path.join(config[KEY_OUTDIR],"published_data","{barcode}")
+    benchmark: benchmark_file(os.path.join(config[KEY_TEMPDIR],"{barcode}"),"write_hit_fastq")
     output:
         txt = os.path.join(config[KEY_TEMPDIR],"{barcode}","reference_groups","prompt.txt"),
-        pub_txt = os.path.join(config[KEY_OUTDIR],"published_data","{barcode}","prompt.txt")
+        pub_txt = os.path.join(config[KEY_OUTDIR],"published_data","{barcode}","prompt.txt"),
+        depth = os.path.join(config[KEY_TEMPDIR],"{barcode}","reference_groups","read_depth.csv"),
+        pub_depth = os.path.join(config[KEY_OUTDIR],"published_data","{barcode}","read_depth.csv")
     run:
         shell("touch {output.txt:q} && touch {output.pub_txt:q}")
         print(green(params.barcode))
         to_write = write_out_fastqs(input.csv,input.hits,input.fastq,params.outdir,params.primer_len,config)
 
         for ref in to_write:
-            written = os.path.join(params.outdir,f"{ref}.fastq")
-            published = os.path.join(params.publish_dir,f"{ref}.fastq")
+            written = os.path.join(params.outdir,f"{ref}{READS_EXT}")
+            published = os.path.join(params.publish_dir,f"{ref}{READS_EXT}")
             shell(f"cp {written} {published}")
+        shell("cp {output.depth:q} {output.pub_depth:q}")
 
-        write_out_ref_fasta(to_write,config[KEY_REFERENCE_SEQUENCES],params.outdir)
+        write_out_ref_fasta(to_write,config[KEY_REFERENCE_CATALOGUE],params.outdir)
 
 
 rule gather_diversity_report:
     input:
         refs = expand(os.path.join(config[KEY_TEMPDIR],"{barcode}","initial_processing","refs_present.csv"), barcode=config[KEY_BARCODES]),
         txt = expand(os.path.join(config[KEY_TEMPDIR],"{barcode}","reference_groups","prompt.txt"), barcode=config[KEY_BARCODES]),
-        ref = config[KEY_REFERENCE_SEQUENCES]
+        manifests = expand(READ_MANIFESTS, barcode=config[KEY_BARCODES]),
+        ref = config[KEY_REFERENCE_SEQUENCES],
+        barcodes_csv = config[KEY_BARCODES_CSV],
+        # so the config for the mode workflow is remade whenever a barcode's reads change
+        reads_keys = expand(READS_KEY_FILE, barcode=config[KEY_BARCODES])
+    benchmark: benchmark_file(config[KEY_TEMPDIR],"gather_diversity_report")
     output:
         refs= os.path.join(config[KEY_TEMPDIR],SAMPLE_COMPOSITION),
         summary = os.path.join(config[KEY_TEMPDIR],PREPROCESSING_SUMMARY),
+        read_summary = os.path.join(config[KEY_TEMPDIR],READ_SUMMARY),
         yaml = os.path.join(config[KEY_TEMPDIR],PREPROCESSING_CONFIG)
     run:
+        write_read_summary(input.manifests,config[KEY_BARCODES],output.read_summary,config)
         barcode_config = diversity_report(input.refs,output.refs,output.summary,input.ref,config)
         
         with open(output.yaml, 'w') as fw:
@@ -2,12 +2,14 @@
 import os
 import collections
 from Bio import SeqIO
-import yaml
 
 from piranha.analysis.stool_functions import *
 from piranha.report.make_report import make_sample_report
 from piranha.utils.log_colours import green,cyan
 from piranha.utils.config import *
+from piranha.utils.resume import resume_key_file
+from piranha.utils.resources import job_memory
+from piranha.utils.run_timeline import benchmark_file
 ##### Target rules #####
 """
 input files
@@ -21,76 +23,106 @@ rule all:
         expand(os.path.join(config[KEY_OUTDIR],"barcode_reports","{barcode}_report.html"), barcode=config[KEY_BARCODES]),
         expand(os.path.join(config[KEY_TEMPDIR],"{barcode}","consensus_sequences.fasta"), barcode=config[KEY_BARCODES])
 
+# with --resume, a barcode's consensus is only regenerated when its content key changes (utils/resume.py)
+# and its nested workflows run without forceall, so only the references whose keys changed are rerun
+if config[KEY_RESUME]:
+    CONSENSUS_TRIGGER = resume_key_file(config[KEY_TEMPDIR],"{barcode}",CONSENSUS_KEY)
+    NESTED_FORCEALL = ""
+else:
+    CONSENSUS_TRIGGER = os.path.join(config[KEY_TEMPDIR],"{barcode}","reference_groups","prompt.txt")
+    NESTED_FORCEALL = "--forceall "
+
 rule files:
     params:
         composition=os.path.join(config[KEY_TEMPDIR],SAMPLE_COMPOSITION),
         summary=os.path.join(config[KEY_TEMPDIR],PREPROCESSING_SUMMARY)
 
 
-rule generate_consensus_sequences:
-    input:
-        snakefile = os.path.join(workflow.current_basedir,"consensus.smk"),
-        yaml = os.path.join(config[KEY_TEMPDIR],PREPROCESSING_CONFIG),
-        prompt = os.path.join(config[KEY_TEMPDIR],"{barcode}","reference_groups","prompt.txt")
-    params:
-        barcode = "{barcode}",
-        outdir = os.path.join(config[KEY_OUTDIR],"{barcode}"),
-        tempdir = os.path.join(config[KEY_TEMPDIR],"{barcode}"),
-        variant_dir = os.path.join(config[KEY_TEMPDIR],"{barcode}","variant_calls"),
-        publish_dir = os.path.join(config[KEY_OUTDIR],"published_data","{barcode}")
-    threads: workflow.cores
-    log: os.path.join(config[KEY_TEMPDIR],"logs","{barcode}_consensus.smk.log")
-    output:
-        fasta = os.path.join(config[KEY_TEMPDIR],"{barcode}","consensus_sequences.fasta"),
-        csv= os.path.join(config[KEY_TEMPDIR],"{barcode}","variants.csv"),
-        masked =  os.path.join(config[KEY_TEMPDIR],"{barcode}","masked_variants.csv")
-    run:
-        sample = get_sample(config[KEY_BARCODES_CSV],params.barcode)
-        print(green(f"Calculating consensus sequences for {sample} ({params.barcode})"))
-        shell("snakemake --nolock --snakefile {input.snakefile:q} "
-                    "--forceall "
-                    "--rerun-incomplete "
-                    "{config[log_string]} "
-                    "--configfile {input.yaml:q} "
-                    "--config barcode={params.barcode} outdir={params.outdir:q} tempdir={params.tempdir:q} "
-                    f"sample='{sample}' "
-                    "--cores {threads} &> {log:q}")
-        shell(
-            """
-            cp {params.variant_dir}/*.vcf {params.publish_dir}
-            """)
-
-rule generate_variation_info:
-    input:
-        snakefile = os.path.join(workflow.current_basedir,"variation.smk"),
-        fasta = os.path.join(config[KEY_TEMPDIR],"{barcode}","consensus_sequences.fasta"),
-        yaml = os.path.join(config[KEY_TEMPDIR],PREPROCESSING_CONFIG)
-    params:
-        barcode = "{barcode}",
-        outdir = os.path.join(config[KEY_OUTDIR],"{barcode}"),
-        tempdir = os.path.join(config[KEY_TEMPDIR],"{barcode}")
-    threads: workflow.cores
-    log: os.path.join(config[KEY_TEMPDIR],"logs","{barcode}_variation.smk.log")
-    output:
-        json = os.path.join(config[KEY_TEMPDIR],"{barcode}","variation_info.json")
-    run:
-        sample = get_sample(config[KEY_BARCODES_CSV],params.barcode)
-        print(green(f"Gathering variation info for {sample} ({params.barcode})"))
-        shell("snakemake --nolock --snakefile {input.snakefile:q} "
-                    "--forceall "
-                    "--rerun-incomplete "
-                    "{config[log_string]} "
-                    "--configfile {input.yaml:q} "
-                    "--config barcode={params.barcode} outdir={params.outdir:q} tempdir={params.tempdir:q} "
-                    f"sample='{sample}' "
-                    "--cores {threads} &> {log:q}")
+if config[KEY_SINGLE_DAG]:
+    include: "single_dag.smk"
+
+    BARCODE_REFERENCE_OUTPUTS = barcode_reference_outputs
+elif config[KEY_DISTRIBUTED]:
+    # the consensus and variation outputs have already been made by piranha worker processes
+    BARCODE_REFERENCE_OUTPUTS = []
+else:
+    BARCODE_REFERENCE_OUTPUTS = []
+
+    # each barcode's consensus workflow runs medaka for its references side by side, and is
+    # given the cores and memory for that, so barcodes run alongside each other
+    def consensus_threads(wildcards):
+        return VALUE_MEDAKA_THREADS*len(config[wildcards.barcode])
+
+    def consensus_memory(wildcards):
+        return job_memory(VALUE_MEDAKA_MEMORY*len(config[wildcards.barcode]),config)
+
+    rule generate_consensus_sequences:
+        input:
+            snakefile = os.path.join(workflow.current_basedir,"consensus.smk"),
+            prompt = CONSENSUS_TRIGGER
+        params:
+            yaml = os.path.join(config[KEY_TEMPDIR],PREPROCESSING_CONFIG),
+            barcode = "{barcode}",
+            outdir = os.path.join(config[KEY_OUTDIR],"{barcode}"),
+            tempdir = os.path.join(config[KEY_TEMPDIR],"{barcode}"),
+            variant_dir = os.path.join(config[KEY_TEMPDIR],"{barcode}","variant_calls"),
+            publish_dir = os.path.join(config[KEY_OUTDIR],"published_data","{barcode}")
+        threads: consensus_threads
+        resources: mem_mb = consensus_memory
+        log: os.path.join(config[KEY_TEMPDIR],"logs","{barcode}_consensus.smk.log")
+        output:
+            fasta = os.path.join(config[KEY_TEMPDIR],"{barcode}","consensus_sequences.fasta"),
+            csv= os.path.join(config[KEY_TEMPDIR],"{barcode}","variants.csv"),
+            masked =  os.path.join(config[KEY_TEMPDIR],"{barcode}","masked_variants.csv")
+        run:
+            sample = get_sample(config[KEY_BARCODES_CSV],params.barcode)
+            print(green(f"Calculating consensus sequences for {sample} ({params.barcode})"))
+            shell("snakemake --nolock --snakefile {input.snakefile:q} "
+                        f"{NESTED_FORCEALL}"
+                        "--rerun-incomplete "
+                        "{config[log_string]} "
+                        "--configfile {params.yaml:q} "
+                        "--config barcode={params.barcode} outdir={params.outdir:q} tempdir={params.tempdir:q} "
+                        f"sample='{sample}' "
+                        "--cores {threads} "
+                        "--resources mem_mb={resources.mem_mb} &> {log:q}")
+            shell(
+                """
+                cp {params.variant_dir}/*.vcf {params.publish_dir}
+                """)
+
+    rule generate_variation_info:
+        input:
+            snakefile = os.path.join(workflow.current_basedir,"variation.smk"),
+            fasta = os.path.join(config[KEY_TEMPDIR],"{barcode}","consensus_sequences.fasta")
+        params:
+            yaml = os.path.join(config[KEY_TEMPDIR],PREPROCESSING_CONFIG),
+            barcode = "{barcode}",
+            outdir = os.path.join(config[KEY_OUTDIR],"{barcode}"),
+            tempdir = os.path.join(config[KEY_TEMPDIR],"{barcode}")
+        threads: 1
+        log: os.path.join(config[KEY_TEMPDIR],"logs","{barcode}_variation.smk.log")
+        output:
+            json = os.path.join(config[KEY_TEMPDIR],"{barcode}","variation_info.json")
+        run:
+            sample = get_sample(config[KEY_BARCODES_CSV],params.barcode)
+            print(green(f"Gathering variation info for {sample} ({params.barcode})"))
+            shell("snakemake --nolock --snakefile {input.snakefile:q} "
+                        f"{NESTED_FORCEALL}"
+                        "--rerun-incomplete "
+                        "{config[log_string]} "
+                        "--configfile {params.yaml:q} "
+                        "--config barcode={params.barcode} outdir={params.outdir:q} tempdir={params.tempdir:q} "
+                        f"sample='{sample}' "
+                        "--cores {threads} &> {log:q}")
 
 rule gather_consensus_sequences:
     input:
         composition = rules.files.params.composition,
-        fasta = expand(rules.generate_consensus_sequences.output.fasta, barcode=config[KEY_BARCODES])
+        fasta = expand(os.path.join(config[KEY_TEMPDIR],"{barcode}","consensus_sequences.fasta"), barcode=config[KEY_BARCODES])
     params:
         publish_dir = os.path.join(config[KEY_OUTDIR],"published_data")
+    benchmark: benchmark_file(config[KEY_TEMPDIR],"gather_consensus_sequences")
     output:
         fasta = os.path.join(config[KEY_OUTDIR],"published_data",SAMPLE_SEQS)
     run:
@@ -102,24 +134,23 @@ rule gather_consensus_sequences:
 rule generate_report:
     input:
         consensus_seqs = rules.gather_consensus_sequences.output.fasta,
-        variation_info = rules.generate_variation_info.output.json,
-        masked_variants = rules.generate_consensus_sequences.output.masked,
-        variants = rules.generate_consensus_sequences.output.csv,
-        yaml = os.path.join(config[KEY_TEMPDIR],PREPROCESSING_CONFIG)
+        variation_info = os.path.join(config[KEY_TEMPDIR],"{barcode}","variation_info.json"),
+        masked_variants = os.path.join(config[KEY_TEMPDIR],"{barcode}","masked_variants.csv"),
+        variants = os.path.join(config[KEY_TEMPDIR],"{barcode}","variants.csv"),
+        reference_outputs = BARCODE_REFERENCE_OUTPUTS
     params:
         outdir = os.path.join(config[KEY_OUTDIR],"barcode_reports"),
         barcode = "{barcode}",
+    benchmark: benchmark_file(os.path.join(config[KEY_TEMPDIR],"{barcode}"),"generate_report")
     output:
         html = os.path.join(config[KEY_OUTDIR],"barcode_reports","{barcode}_report.html")
     run:
-        with open(input.yaml, 'r') as f:
-            config_loaded = yaml.safe_load(f)
-
+        # this workflow's config is the preprocessing config, no need to read it again
         make_sample_report(output.html,
                             input.variation_info,
                             input.consensus_seqs,
                             input.masked_variants,
                             params.barcode,
-                            config_loaded)
+                            config)
 
 
@@ -0,0 +1,32 @@
+# with --single-dag, the consensus and variation rules of every barcode are part of the mode
+# workflow's own DAG (the barcode is a wildcard), rather than each barcode running consensus.smk
+# and variation.smk as separate snakemake workflows
+
+module consensus:
+    snakefile: "consensus.smk"
+    config: config
+
+use rule * from consensus exclude all as consensus_*
+
+module variation:
+    snakefile: "variation.smk"
+    config: config
+
+use rule * from variation exclude all as variation_*
+
+rule publish_variant_calls:
+    input:
+        os.path.join(config[KEY_TEMPDIR],"{barcode}","variant_calls","{reference}.vcf")
+    benchmark: benchmark_file(os.path.join(config[KEY_TEMPDIR],"{barcode}"),"publish_variant_calls","{reference}")
+    output:
+        os.path.join(config[KEY_OUTDIR],"published_data","{barcode}","{reference}.vcf")
+    shell:
+        "cp {input:q} {output:q}"
+
+def barcode_reference_outputs(wildcards):
+    # per reference outputs of a barcode that nothing else asks for
+    outputs = []
+    for reference in config[wildcards.barcode]:
+        outputs.append(os.path.join(config[KEY_OUTDIR],"published_data",wildcards.barcode,f"{reference}.vcf"))
+        outputs.append(os.path.join(config[KEY_TEMPDIR],wildcards.barcode,"snipit",f"{reference}.svg"))
+    return outputs
@@ -8,44 +8,63 @@ from piranha.analysis.clean_gaps import *
 from piranha.analysis.consensus_functions import *
 from piranha.utils.log_colours import green,cyan
 from piranha.utils.config import *
+from piranha.utils.run_timeline import benchmark_file
+from piranha.utils.compressed_io import intermediate_ext
 
+# runs on its own for one barcode, or as a module of the mode workflows with --single-dag (see consensus.smk)
+NESTED = KEY_BARCODE in config
+if NESTED:
+    BARCODE_DIR = config[KEY_TEMPDIR]
+    REFERENCES = config[config[KEY_BARCODE]]
+else:
+    BARCODE_DIR = os.path.join(config[KEY_TEMPDIR],"{barcode}")
+    REFERENCES = lambda wildcards: config[wildcards.barcode]
 
-BARCODE = config[KEY_BARCODE]
-SAMPLE = str(config[KEY_SAMPLE])
-REFERENCES = config[BARCODE]
+    wildcard_constraints:
+        barcode="[^/]+",
+        reference="[^/]+"
+
+def per_reference(path):
+    if NESTED:
+        return expand(path, reference=REFERENCES)
+    return lambda wildcards: expand(path, barcode=wildcards.barcode, reference=REFERENCES(wildcards))
 
 
 rule all:
     input:
-        os.path.join(config[KEY_TEMPDIR],"variation_info.json")
+        os.path.join(BARCODE_DIR,"variation_info.json")
 
 rule files:
     params:
-        ref=os.path.join(config[KEY_TEMPDIR],"reference_groups","{reference}.reference.fasta"),
-        reads=os.path.join(config[KEY_TEMPDIR],"reference_groups","{reference}.fastq")
+        ref=os.path.join(BARCODE_DIR,"reference_groups","{reference}.reference.fasta"),
+        reads=os.path.join(BARCODE_DIR,"reference_groups","{reference}"+intermediate_ext(".fastq",config))
 
 rule get_variation_info:
     input:
-        variant_file = os.path.join(config[KEY_TEMPDIR],"variants.csv"),
-        ref = expand(rules.files.params.ref, reference=REFERENCES),
-        bams = expand(os.path.join(config[KEY_TEMPDIR],"reference_analysis","{reference}","medaka_haploid_variant","calls_to_ref.bam"), reference=REFERENCES)
+        variant_file = os.path.join(BARCODE_DIR,"variants.csv"),
+        ref = per_reference(rules.files.params.ref),
+        bams = per_reference(os.path.join(BARCODE_DIR,"reference_analysis","{reference}","medaka_haploid_variant","calls_to_ref.bam"))
+    params:
+        barcode_dir = BARCODE_DIR,
+        references = REFERENCES
+    benchmark: benchmark_file(BARCODE_DIR,"get_variation_info")
     output:
-        json = os.path.join(config[KEY_TEMPDIR],"variation_info.json")
+        json = os.path.join(BARCODE_DIR,"variation_info.json")
     run:
         # this is for making a figure
         variation_dict = {}
         all_var_dict = parse_variant_file(input.variant_file)
 
 
-        for reference in REFERENCES:
+        for reference in params.references:
 
             variation_dict[reference] = {"variation":[],"coocc":[]}
             if "Sabin" in reference:
-                ref = os.path.join(config[KEY_TEMPDIR],"reference_groups",f"{reference}.reference.fasta")
-                bamfile = os.path.join(config[KEY_TEMPDIR],"reference_analysis",f"{reference}","medaka_haploid_variant","calls_to_ref.bam")
+                ref = os.path.join(params.barcode_dir,"reference_groups",f"{reference}.reference.fasta")
+                bamfile = os.path.join(params.barcode_dir,"reference_analysis",f"{reference}","medaka_haploid_variant","calls_to_ref.bam")
             else:
-                ref = os.path.join(config[KEY_TEMPDIR],"reference_analysis",f"{reference}","medaka_haploid_variant","consensus.fasta")
-                bamfile = os.path.join(config[KEY_TEMPDIR],"reference_analysis",f"{reference}","medaka_haploid_variant_cns","calls_to_ref.bam")
+                ref = os.path.join(params.barcode_dir,"reference_analysis",f"{reference}","medaka_haploid_variant","consensus.fasta")
+                bamfile = os.path.join(params.barcode_dir,"reference_analysis",f"{reference}","medaka_haploid_variant_cns","calls_to_ref.bam")
             shell(f"samtools faidx {ref}")
 
             ref_dict = ref_dict_maker(ref)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+import gzip
+import queue
+import threading
+from Bio import bgzf
+
+from piranha.utils.config import *
+
+def intermediate_ext(ext,config):
+    if config[KEY_COMPRESS_INTERMEDIATES]:
+        return f"{ext}.gz"
+    return ext
+
+class ThreadedBgzfWriter():
+    # writes are gathered into large chunks and bgzf compressed on a background thread,
+    # zlib releases the GIL so compression overlaps with whatever the caller is doing
+    def __init__(self,filename,chunk_size=1<<22):
+        self.writer = bgzf.BgzfWriter(filename,"wb")
+        self.chunk_size = chunk_size
+        self.chunk = []
+        self.chunk_len = 0
+        self.error = None
+        self.queue = queue.Queue(maxsize=8)
+        self.thread = threading.Thread(target=self.compress,daemon=True)
+        self.thread.start()
+
+    def compress(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            if self.error is None:
+                try:
+                    self.writer.write(data)
+                except Exception as e:
+                    self.error = e
+
+    def write(self,data):
+        self.chunk.append(data)
+        self.chunk_len += len(data)
+        if self.chunk_len >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.chunk:
+            self.queue.put(b"".join(self.chunk))
+            self.chunk = []
+            self.chunk_len = 0
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+def open_output(path):
+    # binary output handle, bgzf compressed if the path asks for it
+    if path.endswith(".gz"):
+        return ThreadedBgzfWriter(path)
+    return open(path,"wb",buffering=1<<20)
+
+def open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path,"rt")
+    return open(path,"r")
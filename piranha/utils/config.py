@@ -26,11 +26,19 @@ KEY_REFERENCES_FOR_CNS = "references_for_cns"
 KEY_MIN_READ_LENGTH = "min_read_length"
 KEY_MAX_READ_LENGTH = "max_read_length"
 KEY_MIN_READS = "min_read_depth"
+KEY_MAX_READS = "max_read_depth"
 KEY_MIN_PCENT = "min_read_pcent"
 KEY_MIN_MAP_QUALITY = "min_map_quality"
 KEY_REFERENCE_SEQUENCES = "reference_sequences"
 KEY_MEDAKA_MODEL = "medaka_model"
 KEY_PRIMER_LENGTH = "primer_length"
+KEY_INDEX_CACHE = "index_cache"
+KEY_REFERENCE_INDEX = "reference_index"
+KEY_REFERENCE_CATALOGUE = "reference_catalogue"
+KEY_DESCRIPTIONS = "descriptions"
+KEY_DISPLAY_NAMES = "display_names"
+KEY_SEQUENCES = "sequences"
+KEY_DUPLICATE_IDS = "duplicate_ids"
 
 KEY_BARCODE = "barcode"
 KEY_SAMPLE = "sample"
@@ -45,6 +53,10 @@ KEY_REFERENCE_GROUP = "reference_group"
 KEY_VIRUS_PRESENT = "virus_present"
 KEY_TAXA_OUTDIR = "taxa_outdir"
 KEY_HITS = "hits"
+KEY_TOTAL_READS = "total_reads"
+KEY_PASSED_READS = "passed_reads"
+KEY_MEDIAN_LENGTH = "median_read_length"
+KEY_MEDIAN_QUALITY = "median_read_quality"
 
 
 # REPORT KEYS
@@ -64,6 +76,9 @@ KEY_COMPOSITION_TABLE_HEADER="composition_table_header"
 KEY_SUMMARY_TABLE_HEADER="summary_table_header"
 KEY_DETAILED_TABLE_HEADER = "detailed_table_header"
 KEY_CONTROL_STATUS="control_status"
+KEY_READ_SUMMARY_TABLE="read_summary_table"
+KEY_TIMELINE_TABLE="timeline_table"
+KEY_RULE="rule"
 KEY_ORIENTATION="orientation"
 
 # MISC KEYS
@@ -72,6 +87,19 @@ KEY_INSTITUTE="institute"
 KEY_RUN_NAME="run_name"
 KEY_VERBOSE="verbose"
 KEY_THREADS="threads"
+KEY_MAX_MEMORY="max_memory"
+KEY_PARALLEL_INGEST="parallel_ingest"
+KEY_FUSE_FILTER_MAP="fuse_filter_map"
+KEY_BATCH_MAPPING="batch_mapping"
+KEY_MAPPING_BACKEND="mapping_backend"
+KEY_SINGLE_DAG="single_dag"
+KEY_DISTRIBUTED="distributed"
+KEY_GROUPING_MEMORY="grouping_memory"
+KEY_COMPRESS_INTERMEDIATES="compress_intermediates"
+KEY_WATCH="watch"
+KEY_WATCH_INTERVAL="watch_interval"
+KEY_WATCH_TIMEOUT="watch_timeout"
+KEY_RESUME="resume"
 KEY_LOG_API="log_api"
 KEY_LOG_STRING="log_string"
 KEY_QUIET="quiet"
@@ -117,10 +145,62 @@ READ_LENGTH_DICT = {
 # READ_LENGTH_DEFAULT_WG = [3400,5200]
 VALUE_PRIMER_LENGTH = 30
 VALUE_MIN_MAP_QUALITY = 50
+VALUE_MINIMAP2_PRESET = "map-ont"
+VALUE_MAPPING_BACKEND = "minimap2"
+VALUE_MAPPING_BACKEND_MAPPY = "mappy"
+VALID_MAPPING_BACKENDS = [VALUE_MAPPING_BACKEND,VALUE_MAPPING_BACKEND_MAPPY]
+# reads handed to each mappy worker thread at a time
+VALUE_MAPPY_BATCH_SIZE = 1000
+VALUE_INDEX_CACHE_DIR = "index_cache"
+# under $XDG_CACHE_HOME (or ~/.cache), where the tools found in each environment are noted
+VALUE_TOOL_CACHE_DIR = "piranha"
+# intermediate files kept in the output directory with --resume (unless -temp/--tempdir is given)
+VALUE_RESUME_TEMPDIR = "intermediate_files"
+
+# -t/--threads and --max-memory detect the cores and memory available (cgroup limits included)
+VALUE_AUTO = "auto"
+# threads and memory (MB) each medaka job is given, and the memory of a minimap2 or mappy job
+VALUE_MEDAKA_THREADS = 2
+VALUE_MEDAKA_MEMORY = 2000
+VALUE_MAPPING_MEMORY = 1000
+
+# distributed runs: the queue directory in the temp directory, seconds between checks of the
+# queue, and seconds without a heartbeat before a claimed task is handed to another worker
+VALUE_QUEUE_DIR = "work_queue"
+VALUE_QUEUE_POLL = 5
+VALUE_QUEUE_STALE = 600
+
+# each rule's snakemake benchmark file, for the run timeline
+VALUE_BENCHMARK_DIR = "benchmarks"
+
+# piranha serve: where it listens by default, and the log lines shown with a run's progress
+VALUE_SERVE_HOST = "127.0.0.1"
+VALUE_SERVE_PORT = 8375
+VALUE_SERVE_LOG_LINES = 20
+
+# memory budget (MB) for grouping paf lines by read, and a rough per-read footprint
+VALUE_GROUPING_MEMORY = 2000
+VALUE_GROUPED_READ_BYTES = 400
+
+# live run: seconds between report refreshes, minutes without new reads before
+# watching stops, and seconds between scans of the read directory
+VALUE_WATCH_INTERVAL = 300
+VALUE_WATCH_TIMEOUT = 60
+VALUE_WATCH_POLL = 10
+
+# read length histogram bin width in the read manifests, the last bin holds every read of
+# VALUE_LENGTH_HIST_MAX bp or longer; reads are summarised VALUE_READ_STATS_CHUNK bytes of
+# quality scores at a time
+VALUE_LENGTH_HIST_BIN = 10
+VALUE_LENGTH_HIST_MAX = 100000
+VALUE_QUALITY_HIST_BINS = 256
+VALUE_READ_STATS_CHUNK = 1<<20
 
 VALUE_DEFAULT_MEDAKA_MODEL="r941_min_hac_variant_g507"
 
 VALUE_MIN_READS = 50
+# no cap on the reads taken forward per reference group
+VALUE_MAX_READS = 0
 VALUE_MIN_PCENT = 10
 
 # vdpv call thresholds
@@ -143,6 +223,7 @@ VALUE_COLOUR_THEME="#e68781"
 VARIANT_CALLS_HEADER_FIELDS = ["barcode","reference","variant_count","variants"]
 SAMPLE_SUMMARY_TABLE_HEADER_FIELDS = ["sample","barcode","Sample classification","reference_group","Number of mutations"]
 SAMPLE_HIT_HEADER_FIELDS = ["barcode","reference","reference_group","num_reads","percent_of_sample"]
+READ_SUMMARY_HEADER_FIELDS = ["barcode","sample","total_reads","passed_reads","median_read_length","median_read_quality"]
 
 SAMPLE_COMPOSITION_TABLE_HEADER_FIELDS_VP1 = ["sample","barcode","Sabin1-related","Sabin2-related","Sabin3-related",
                                 "WPV1","WPV2","WPV3","NonPolioEV","unmapped"]
@@ -170,11 +251,24 @@ DETAILED_SAMPLE_COMPOSITION_TABLE_HEADER_FIELDS_WG = [
                     "WPV3|closest_reference","WPV3|num_reads","WPV3|nt_diff_from_reference","WPV3|pcent_match","WPV3|classification",
                     "NonPolioEV|closest_reference","NonPolioEV|num_reads","NonPolioEV|nt_diff_from_reference","NonPolioEV|pcent_match","NonPolioEV|classification","comments"]
 
+# settings that change the output of preprocessing and of the per barcode consensus,
+# part of the content keys used with --resume
+RESUME_PREPROCESSING_KEYS = [KEY_ANALYSIS_MODE,KEY_MIN_READ_LENGTH,KEY_MAX_READ_LENGTH,KEY_MIN_MAP_QUALITY,
+                            KEY_PRIMER_LENGTH,KEY_MIN_READS,KEY_MIN_PCENT,KEY_MAX_READS,KEY_COMPRESS_INTERMEDIATES]
+RESUME_CONSENSUS_KEYS = [KEY_ANALYSIS_MODE,KEY_MEDAKA_MODEL,KEY_COMPRESS_INTERMEDIATES]
+
 # file names
 OUTPUT_REPORT = "report.html"
 SAMPLE_COMPOSITION = "sample_composition.csv"
 PREPROCESSING_SUMMARY = "preprocessing_summary.csv"
 PREPROCESSING_CONFIG = "preprocessing_config.yaml"
+READ_MANIFEST = "read_manifest.npz"
+READ_SUMMARY = "read_summary.csv"
+RUN_TIMELINE = "run_timeline.json"
+RESUME_DIR = "resume"
+READS_KEY = "reads.key"
+CONSENSUS_KEY = "consensus.key"
+FILE_HASHES = "file_hashes.json"
 SAMPLE_SEQS = "vp1_sequences.fasta"
 REFERENCE_SEQUENCES_FILE_WG = "references.wg.fasta"
 REFERENCE_SEQUENCES_FILE_VP1 = "references.vp1.fasta"
@@ -1,5 +1,4 @@
 #!/usr/bin/env python3
-import pkg_resources
 from piranha.utils.log_colours import green,cyan
 import sys
 import os
@@ -8,6 +7,7 @@ from piranha.utils import misc
 
 
 def package_data_check(filename,directory,key,config):
+    import pkg_resources
     try:
         package_datafile = os.path.join(directory,filename)
         data = pkg_resources.resource_filename('piranha', package_datafile)
@@ -1,21 +1,16 @@
 #!/usr/bin/env python3
-import subprocess
 import os
 import sys
 from piranha.utils.log_colours import green,cyan
-import importlib
+from piranha.utils import tool_cache
+import importlib.util
 
 def which(dependency):
-    try:
-        subprocess.check_output(["which", dependency])
-        return True
-    except subprocess.CalledProcessError:
-        return False
+    return tool_cache.find_binary(dependency) is not None
 
 def check_module(module, missing):
-    try:
-        importlib.import_module(module)
-    except ImportError:
+    # found without importing it, the import happens when (and if) it's needed
+    if importlib.util.find_spec(module) is None:
         missing.append(module)
 
 def check_this_dependency(dependency,missing):
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import os
+import sys
+import pickle
+import hashlib
+import tempfile
+import functools
+import subprocess
+import collections
+import pkg_resources
+from Bio import SeqIO
+
+from piranha import __version__
+from piranha.utils.log_colours import green,cyan
+from piranha.utils.config import *
+from piranha.utils import misc
+from piranha.utils import tool_cache
+
+def hash_file(path):
+    file_hash = hashlib.sha256()
+    with open(path,"rb") as f:
+        for chunk in iter(lambda: f.read(1<<20), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+def get_minimap2_version():
+    return tool_cache.tool_output("minimap2",["--version"]).rstrip("\n")
+
+def is_writable_dir(directory):
+    try:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with tempfile.TemporaryFile(dir=directory):
+            pass
+    except:
+        return False
+    return True
+
+def get_cache_dir(config):
+    # defaults to the package data dir, falls back to the temp dir (no reuse across runs)
+    if not config[KEY_INDEX_CACHE]:
+        config[KEY_INDEX_CACHE] = os.path.join(pkg_resources.resource_filename('piranha', 'data'),VALUE_INDEX_CACHE_DIR)
+
+    if not is_writable_dir(config[KEY_INDEX_CACHE]):
+        print(cyan(f"Warning: cannot write to index cache {config[KEY_INDEX_CACHE]}, reference index will not be reused across runs."))
+        config[KEY_INDEX_CACHE] = config[KEY_TEMPDIR]
+
+    return config[KEY_INDEX_CACHE]
+
+def get_minimap2_index(reference,reference_hash,preset,cache_dir):
+    # keyed on reference content, preset and minimap2 version so any change triggers a rebuild
+    index_key = hashlib.sha256(f"{reference_hash}|{preset}|{get_minimap2_version()}".encode()).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(reference))[0]
+    index = os.path.join(cache_dir,f"{stem}.{preset}.{index_key}.mmi")
+
+    if not os.path.exists(index):
+        print(green("Building minimap2 index:") + f" {index}")
+        # build to a temp file and move into place so concurrent runs never see a partial index
+        fd,tmp_index = tempfile.mkstemp(dir=cache_dir,suffix=".mmi.tmp")
+        os.close(fd)
+        result = subprocess.run(["minimap2","-x",preset,"-d",tmp_index,reference],stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            os.remove(tmp_index)
+            sys.stderr.write(cyan(f"Error: failed to build minimap2 index for {reference}.\n") + result.stderr.decode('utf-8'))
+            sys.exit(-1)
+        os.replace(tmp_index,index)
+    else:
+        print(green("Using cached minimap2 index:") + f" {index}")
+
+    return index
+
+def get_display_name(description):
+    display_name = ""
+    for item in description.split(" "):
+        if item.startswith("display_name"):
+            display_name = item.split("=")[1]
+    return display_name
+
+CATALOGUE_KEYS = [KEY_DESCRIPTIONS,KEY_DISPLAY_NAMES,KEY_SEQUENCES,KEY_DUPLICATE_IDS]
+
+def parse_reference_catalogue(reference):
+    # everything the pipeline needs from the reference fasta, from a single parse
+    catalogue = {KEY_DESCRIPTIONS:{},KEY_DISPLAY_NAMES:{},KEY_SEQUENCES:{},KEY_DUPLICATE_IDS:[]}
+    seq_ids = collections.Counter()
+    for record in SeqIO.parse(reference,KEY_FASTA):
+        seq_ids[record.id]+=1
+        catalogue[KEY_DESCRIPTIONS][record.id] = record.description
+        catalogue[KEY_DISPLAY_NAMES][record.id] = get_display_name(str(record.description))
+        catalogue[KEY_SEQUENCES][record.id] = str(record.seq)
+
+    catalogue[KEY_DUPLICATE_IDS] = [seq for seq in seq_ids if seq_ids[seq]>1]
+    return catalogue
+
+def read_cached_catalogue(catalogue_file):
+    # a catalogue that can't be read back, or is missing fields, counts as not cached
+    if not os.path.exists(catalogue_file):
+        return None
+    try:
+        with open(catalogue_file,"rb") as f:
+            catalogue = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(catalogue,dict) or any(key not in catalogue for key in CATALOGUE_KEYS):
+        return None
+    return catalogue
+
+def get_reference_catalogue(reference,reference_hash,cache_dir):
+    # keyed on the piranha version too, as the catalogue's layout can change between versions
+    stem = os.path.splitext(os.path.basename(reference))[0]
+    catalogue_file = os.path.join(cache_dir,f"{stem}.{reference_hash[:16]}.{__version__}.catalogue.pkl")
+
+    if read_cached_catalogue(catalogue_file) is None:
+        catalogue = parse_reference_catalogue(reference)
+        fd,tmp_catalogue = tempfile.mkstemp(dir=cache_dir,suffix=".pkl.tmp")
+        with os.fdopen(fd,"wb") as fw:
+            pickle.dump(catalogue,fw,protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_catalogue,catalogue_file)
+
+    return catalogue_file
+
+@functools.lru_cache(maxsize=None)
+def load_reference_catalogue(catalogue_file):
+    with open(catalogue_file,"rb") as f:
+        return pickle.load(f)
+
+def check_duplicate_reference_ids(catalogue):
+    if catalogue[KEY_DUPLICATE_IDS]:
+        print_str = "\n - ".join(catalogue[KEY_DUPLICATE_IDS])
+        sys.stderr.write(cyan(f"\nReference fasta file contains duplicate sequence IDs:\n"))
+        sys.stderr.write(f" - ")
+        sys.stderr.write(f"{print_str}\n")
+        sys.stderr.write(cyan(f"Please remove duplicates from file and run again.\n"))
+        sys.exit(-1)
+
+def reference_index_parsing(index_cache,config):
+    misc.add_path_to_config(KEY_INDEX_CACHE,index_cache,config)
+    cache_dir = get_cache_dir(config)
+    reference_hash = hash_file(config[KEY_REFERENCE_SEQUENCES])
+
+    config[KEY_REFERENCE_CATALOGUE] = get_reference_catalogue(config[KEY_REFERENCE_SEQUENCES],reference_hash,cache_dir)
+    check_duplicate_reference_ids(load_reference_catalogue(config[KEY_REFERENCE_CATALOGUE]))
+
+    config[KEY_REFERENCE_INDEX] = get_minimap2_index(config[KEY_REFERENCE_SEQUENCES],reference_hash,VALUE_MINIMAP2_PRESET,cache_dir)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import os
+import sys
+
+from piranha.utils.log_colours import green,cyan
+from piranha.utils.config import *
+
+"""
+Cores and memory are handed out by snakemake: each rule declares the threads and
+mem_mb it needs, and the workflows are given the machine's budget, so that
+minimap2, medaka and the python steps for different barcodes share the cores
+without running more threads than there are cores to run them on.
+"""
+
+def read_first_line(path):
+    try:
+        with open(path,"r") as f:
+            return f.readline().strip()
+    except (OSError,IOError):
+        return ""
+
+def cgroup_cpu_limit():
+    # cgroup v2 gives "<quota> <period>" (or "max <period>"), v1 splits them into two files
+    fields = read_first_line("/sys/fs/cgroup/cpu.max").split()
+    if len(fields) == 2 and fields[0] != "max":
+        return int(fields[0])/int(fields[1])
+
+    quota = read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return int(quota)/int(period)
+    return None
+
+def detect_cores():
+    if hasattr(os,"sched_getaffinity"):
+        cores = len(os.sched_getaffinity(0))
+    else:
+        cores = os.cpu_count() or 1
+
+    cpu_limit = cgroup_cpu_limit()
+    if cpu_limit:
+        cores = min(cores,int(cpu_limit))
+    return max(1,cores)
+
+def cgroup_memory_limit():
+    for path in ["/sys/fs/cgroup/memory.max","/sys/fs/cgroup/memory/memory.limit_in_bytes"]:
+        limit = read_first_line(path)
+        # an unlimited v1 cgroup reports a number close to the maximum 64 bit integer
+        if limit.isdigit() and int(limit) < 2**60:
+            return int(limit)//(1024*1024)
+    return None
+
+def detect_memory():
+    memory = None
+    if os.path.exists("/proc/meminfo"):
+        with open("/proc/meminfo","r") as f:
+            for l in f:
+                if l.startswith("MemAvailable:"):
+                    memory = int(l.split()[1])//1024
+
+    memory_limit = cgroup_memory_limit()
+    if memory_limit and (not memory or memory_limit < memory):
+        memory = memory_limit
+    return memory
+
+def parse_budget(key,value,detect):
+    if str(value).lower() == VALUE_AUTO:
+        return detect()
+    try:
+        value = int(value)
+    except ValueError:
+        value = 0
+    if value < 1:
+        sys.stderr.write(cyan(f"Error: {key} must be a positive whole number or `{VALUE_AUTO}`.\n"))
+        sys.exit(-1)
+    return value
+
+def resources_to_config(max_memory,config):
+    # -t/--threads may still be `auto` from the defaults or the config file
+    config[KEY_THREADS] = parse_budget(KEY_THREADS,config[KEY_THREADS],detect_cores)
+
+    if max_memory:
+        config[KEY_MAX_MEMORY] = max_memory
+    # None when the memory can't be detected, jobs are then only held back by cores
+    config[KEY_MAX_MEMORY] = parse_budget(KEY_MAX_MEMORY,config[KEY_MAX_MEMORY],detect_memory)
+
+    print(green("Threads:") + f" {config[KEY_THREADS]}")
+    if config[KEY_MAX_MEMORY]:
+        print(green("Memory (MB):") + f" {config[KEY_MAX_MEMORY]}")
+
+def workflow_resources(config):
+    if config[KEY_MAX_MEMORY]:
+        return {"mem_mb":config[KEY_MAX_MEMORY]}
+    return {}
+
+def barcode_share(cores,barcodes):
+    # an even split of the cores across barcodes, so they run side by side,
+    # or all of them when there are fewer barcodes than cores
+    return max(1,cores//max(1,len(barcodes)))
+
+def job_memory(memory,config):
+    # a job asking for more than the whole budget would never be scheduled
+    if config.get(KEY_MAX_MEMORY):
+        return min(memory,config[KEY_MAX_MEMORY])
+    return memory
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import os
+import json
+
+from piranha import __version__
+from piranha.analysis.preprocessing import get_read_files
+from piranha.analysis.stool_functions import get_sample
+from piranha.utils.compressed_io import intermediate_ext
+from piranha.utils.reference_cache import hash_file
+from piranha.utils.log_colours import green
+from piranha.utils.config import *
+
+"""
+With --resume the workflows run without forceall, so snakemake only reruns jobs whose
+outputs are missing or older than their inputs. Each barcode gets a key file for preprocessing
+and one for consensus generation, holding the content hashes of its inputs and the settings
+that affect them. The key files are only rewritten when their content changes, so snakemake
+sees a new input (and reruns that barcode) only when something that matters has changed.
+Each reference of a barcode also gets a consensus key, so the nested consensus workflow
+reruns only the references whose reads have changed.
+"""
+
+def resume_key_file(tempdir,barcode,key_name):
+    return os.path.join(tempdir,RESUME_DIR,f"{barcode}.{key_name}")
+
+def reference_key_file(barcode_dir,reference):
+    # kept with the reference's reads, so the nested consensus workflow can find it
+    return os.path.join(barcode_dir,"reference_groups",f"{reference}.{CONSENSUS_KEY}")
+
+def load_file_hashes(hash_file_path):
+    if not os.path.exists(hash_file_path):
+        return {}
+    with open(hash_file_path,"r") as f:
+        return json.load(f)
+
+def hash_files(paths,file_hashes):
+    # content hashes, reused from the last run while a file's size and mtime are unchanged
+    hashes = []
+    for path in paths:
+        stat = os.stat(path)
+        cached = file_hashes.get(path)
+        if not cached or cached[0] != stat.st_size or cached[1] != stat.st_mtime:
+            cached = [stat.st_size,stat.st_mtime,hash_file(path)]
+            file_hashes[path] = cached
+        hashes.append(cached[2])
+    return hashes
+
+def make_key(hashes,config,setting_keys,extra):
+    settings = {key:config[key] for key in setting_keys}
+    settings.update(extra)
+    return json.dumps({"version":__version__,"files":hashes,"settings":settings},sort_keys=True,default=str,indent=1)
+
+def write_key_if_changed(key_file,key):
+    if os.path.exists(key_file):
+        with open(key_file,"r") as f:
+            if f.read() == key:
+                return False
+    with open(key_file,"w") as fw:
+        fw.write(key)
+    return True
+
+def report_reused(stage,changed,barcodes):
+    reused = [barcode for barcode in barcodes if barcode not in changed]
+    if reused:
+        print(green(f"Reusing {stage} for:") + f" {', '.join(reused)}")
+
+def write_preprocessing_keys(config):
+    resume_dir = os.path.join(config[KEY_TEMPDIR],RESUME_DIR)
+    if not os.path.exists(resume_dir):
+        os.mkdir(resume_dir)
+    hash_file_path = os.path.join(resume_dir,FILE_HASHES)
+    file_hashes = load_file_hashes(hash_file_path)
+
+    # the index file name is keyed on the reference content, preset and minimap2 version
+    extra = {KEY_REFERENCE_INDEX:os.path.basename(config[KEY_REFERENCE_INDEX])}
+
+    changed = []
+    for barcode in config[KEY_BARCODES]:
+        read_files = sorted(get_read_files(os.path.join(config[KEY_READDIR],barcode)))
+        key = make_key(hash_files(read_files,file_hashes),config,RESUME_PREPROCESSING_KEYS,extra)
+        if write_key_if_changed(resume_key_file(config[KEY_TEMPDIR],barcode,READS_KEY),key):
+            changed.append(barcode)
+
+    with open(hash_file_path,"w") as fw:
+        json.dump(file_hashes,fw)
+    report_reused("read processing",changed,config[KEY_BARCODES])
+
+def write_consensus_keys(barcode_config):
+    hash_file_path = os.path.join(barcode_config[KEY_TEMPDIR],RESUME_DIR,FILE_HASHES)
+    file_hashes = load_file_hashes(hash_file_path)
+    reads_ext = intermediate_ext(".fastq",barcode_config)
+
+    changed = []
+    for barcode in barcode_config[KEY_BARCODES]:
+        groups_dir = os.path.join(barcode_config[KEY_TEMPDIR],barcode,"reference_groups")
+        references = sorted(barcode_config[barcode])
+        hashes = []
+        for reference in references:
+            paths = [os.path.join(groups_dir,f"{reference}{reads_ext}"),os.path.join(groups_dir,f"{reference}.reference.fasta")]
+            reference_hashes = hash_files(paths,file_hashes)
+            # within the barcode, only references whose reads or reference changed are rerun
+            reference_key = make_key(reference_hashes,barcode_config,RESUME_CONSENSUS_KEYS,{KEY_REFERENCE:reference})
+            write_key_if_changed(reference_key_file(os.path.join(barcode_config[KEY_TEMPDIR],barcode),reference),reference_key)
+            hashes += reference_hashes
+
+        extra = {KEY_SAMPLE:get_sample(barcode_config[KEY_BARCODES_CSV],barcode),KEY_REFERENCE:references}
+        key = make_key(hashes,barcode_config,RESUME_CONSENSUS_KEYS,extra)
+        if write_key_if_changed(resume_key_file(barcode_config[KEY_TEMPDIR],barcode,CONSENSUS_KEY),key):
+            changed.append(barcode)
+
+    with open(hash_file_path,"w") as fw:
+        json.dump(file_hashes,fw)
+    report_reused("consensus sequences",changed,barcode_config[KEY_BARCODES])
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import json
+import time
+import queue
+import tempfile
+import threading
+import contextlib
+import http.server
+
+from piranha.utils import reference_cache
+from piranha.utils.log_colours import green,cyan,yellow
+from piranha.utils.config import *
+
+"""
+piranha serve keeps one process running that accepts runs over HTTP on a local port and works
+through them one at a time, each with the full thread budget. Runs go through the same code as
+the command line, but in this process, so the imports, dependency checks, medaka model list and
+reference catalogues loaded before or by earlier runs are reused. The minimap2 indexes of the
+default references are built before the first run arrives, in the index cache every run is
+pointed at unless it asks for another.
+
+POST /runs        {"readdir": ..., "barcodes_csv": ..., "outdir": ..., "options": [...]}
+GET  /runs        every run submitted, oldest first
+GET  /runs/<id>   one run, with the end of its log
+"""
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+
+@contextlib.contextmanager
+def redirect_output(log_handle):
+    # at the file descriptor level, snakemake runs `run:` jobs in child processes that
+    # write straight to the ones they inherit
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1),os.dup(2)]
+    os.dup2(log_handle.fileno(),1)
+    os.dup2(log_handle.fileno(),2)
+    try:
+        with contextlib.redirect_stdout(log_handle),contextlib.redirect_stderr(log_handle):
+            yield
+    finally:
+        log_handle.flush()
+        os.dup2(saved[0],1)
+        os.dup2(saved[1],2)
+        for fd in saved:
+            os.close(fd)
+
+class RunQueue():
+    def __init__(self,run_pipeline,log_dir,threads,index_cache):
+        self.run_pipeline = run_pipeline
+        self.log_dir = log_dir
+        self.threads = threads
+        self.index_cache = index_cache
+        self.runs = {}
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+
+    def submit(self,submission):
+        args = ["-i",submission[KEY_READDIR],"-b",submission[KEY_BARCODES_CSV],"-o",submission[KEY_OUTDIR]]
+        options = submission.get("options",[])
+        if "-t" not in options and "--threads" not in options:
+            args += ["-t",str(self.threads)]
+        if "--index-cache" not in options:
+            args += ["--index-cache",self.index_cache]
+        with self.lock:
+            run_id = str(len(self.runs) + 1)
+            self.runs[run_id] = {
+                "id":run_id,
+                "status":"queued",
+                KEY_OUTDIR:submission[KEY_OUTDIR],
+                "args":args + options,
+                "log":os.path.join(self.log_dir,f"run_{run_id}.log"),
+                "submitted":time.strftime("%Y-%m-%d %H:%M:%S"),
+                "started":None,
+                "finished":None
+            }
+        self.pending.put(run_id)
+        return self.describe(run_id)
+
+    def describe(self,run_id,log_lines=0):
+        with self.lock:
+            if run_id not in self.runs:
+                return None
+            run = dict(self.runs[run_id])
+            run["position"] = sum(1 for i in self.runs if self.runs[i]["status"] == "queued" and int(i) < int(run_id))
+        if log_lines and os.path.exists(run["log"]):
+            with open(run["log"],"r",errors="replace") as f:
+                run["log_tail"] = [ANSI_ESCAPE.sub("",l.rstrip("\n")) for l in f.readlines()[-log_lines:]]
+        return run
+
+    def describe_all(self):
+        return [self.describe(run_id) for run_id in sorted(self.runs,key=int)]
+
+    def set_status(self,run_id,**fields):
+        with self.lock:
+            self.runs[run_id].update(fields)
+
+    def work(self):
+        # one run at a time, snakemake's in-process api isn't safe to run twice at once
+        while True:
+            run_id = self.pending.get()
+            run = self.runs[run_id]
+            self.set_status(run_id,status="running",started=time.strftime("%Y-%m-%d %H:%M:%S"))
+            print(green(f"Run {run_id}:") + f" started, {run[KEY_OUTDIR]}")
+
+            with open(run["log"],"w") as log_handle:
+                with redirect_output(log_handle):
+                    try:
+                        returncode = self.run_pipeline(run["args"])
+                    except SystemExit as e:
+                        returncode = e.code if isinstance(e.code,int) else 1
+                    except Exception as e:
+                        print(cyan(f"Error: {e}"))
+                        returncode = 1
+
+            status = "finished" if returncode == 0 else "failed"
+            report = os.path.join(run[KEY_OUTDIR],OUTPUT_REPORT) if returncode == 0 else None
+            self.set_status(run_id,status=status,returncode=returncode,report=report,finished=time.strftime("%Y-%m-%d %H:%M:%S"))
+            print(green(f"Run {run_id}:") + f" {status}")
+
+def check_submission(submission):
+    if not isinstance(submission,dict):
+        return "Submission must be a json object."
+    for key in [KEY_READDIR,KEY_BARCODES_CSV,KEY_OUTDIR]:
+        if not submission.get(key):
+            return f"Submission is missing `{key}`."
+        # relative to what? the server and the client needn't share a working directory
+        if not os.path.isabs(submission[key]):
+            return f"`{key}` must be an absolute path."
+    if not isinstance(submission.get("options",[]),list):
+        return "`options` must be a list of piranha command line arguments."
+    return None
+
+def make_handler(run_queue):
+    class RunHandler(http.server.BaseHTTPRequestHandler):
+        def send_json(self,code,content):
+            body = json.dumps(content,indent=1).encode()
+            self.send_response(code)
+            self.send_header("Content-Type","application/json")
+            self.send_header("Content-Length",str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.rstrip("/")
+            if path == "/runs":
+                self.send_json(200,run_queue.describe_all())
+            elif path.startswith("/runs/"):
+                run = run_queue.describe(path.split("/")[2],VALUE_SERVE_LOG_LINES)
+                if run:
+                    self.send_json(200,run)
+                else:
+                    self.send_json(404,{"error":"No such run."})
+            else:
+                self.send_json(404,{"error":"Not found."})
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/runs":
+                self.send_json(404,{"error":"Not found."})
+                return
+            try:
+                submission = json.loads(self.rfile.read(int(self.headers.get("Content-Length",0))))
+            except ValueError:
+                self.send_json(400,{"error":"Submission must be json."})
+                return
+            error = check_submission(submission)
+            if error:
+                self.send_json(400,{"error":error})
+                return
+            self.send_json(202,run_queue.submit(submission))
+
+        def log_message(self,format,*args):
+            # stdout and stderr belong to the run in progress
+            pass
+
+    return RunHandler
+
+def warm_up(reference,index_cache):
+    # build (or load) the catalogue and index runs are likely to ask for, before the first one arrives
+    config = {KEY_REFERENCE_SEQUENCES:reference,KEY_INDEX_CACHE:False,KEY_TEMPDIR:tempfile.gettempdir()}
+    reference_cache.reference_index_parsing(index_cache,config)
+    return config[KEY_INDEX_CACHE]
+
+def serve(host,port,run_pipeline,log_dir,config):
+    run_queue = RunQueue(run_pipeline,log_dir,config[KEY_THREADS],config[KEY_INDEX_CACHE])
+    threading.Thread(target=run_queue.work,daemon=True).start()
+
+    server = http.server.ThreadingHTTPServer((host,port),make_handler(run_queue))
+    print(green("Accepting runs at:") + f" http://{host}:{port}/runs")
+    print(green("Run logs in:") + f" {log_dir}")
+    print(yellow("-----------------------"))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(cyan("\nStopping."))
+    finally:
+        server.server_close()
+    return 0
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import os
+import csv
+import glob
+import json
+import time
+import collections
+
+from piranha.utils.log_colours import green
+from piranha.utils.config import *
+
+"""
+Every rule has a snakemake `benchmark:` file, <directory>/benchmarks/<rule>[.<reference>].tsv,
+in the temp directory for rules run once per run and in the barcode's temp directory otherwise.
+Snakemake samples the job's processes (twice a second, every 30 seconds after the first 15)
+for the peak RSS, load and bytes read and written, and writes the file when the job ends,
+so the end of a job is the time its file was written and its start that less its running time.
+
+Python steps run inside a snakemake process that was running before the job started, so the
+CPU time is worked out from the load over the job rather than taken from snakemake's total for
+the process, and their memory and I/O are those of the whole process. Jobs shorter than half
+a second finish before their load is sampled.
+"""
+
+def benchmark_file(directory,rule,*wildcards):
+    return os.path.join(directory,VALUE_BENCHMARK_DIR,".".join((rule,) + wildcards) + ".tsv")
+
+def benchmark_value(value):
+    # "-" or "NA" when snakemake couldn't measure it
+    try:
+        return round(float(value),2)
+    except ValueError:
+        return None
+
+def read_benchmark(path,barcode):
+    rule,_,reference = os.path.basename(path)[:-len(".tsv")].partition(".")
+    with open(path,"r") as f:
+        reader = csv.DictReader(f,delimiter="\t")
+        row = next(reader,None)
+    if not row:
+        return None
+
+    seconds = benchmark_value(row["s"])
+    mean_load = benchmark_value(row["mean_load"])
+    end = os.path.getmtime(path)
+    return {
+        KEY_RULE:rule,
+        KEY_BARCODE:barcode,
+        KEY_REFERENCE:reference or None,
+        "start":round(end - seconds,2),
+        "end":round(end,2),
+        "seconds":seconds,
+        # mean_load is a percentage of one core
+        "cpu_time":round(mean_load*seconds/100,2) if mean_load is not None else None,
+        "max_rss_mb":benchmark_value(row["max_rss"]),
+        "io_in_mb":benchmark_value(row["io_in"]),
+        "io_out_mb":benchmark_value(row["io_out"])
+    }
+
+def collect_jobs(tempdir,since):
+    jobs = []
+    for path in glob.glob(os.path.join(tempdir,"*",VALUE_BENCHMARK_DIR,"*.tsv")) + glob.glob(os.path.join(tempdir,VALUE_BENCHMARK_DIR,"*.tsv")):
+        # with --resume, jobs that didn't need to run again keep their file from before
+        if os.path.getmtime(path) < since:
+            continue
+        benchmark_dir = os.path.dirname(os.path.dirname(path))
+        barcode = None if os.path.samefile(benchmark_dir,tempdir) else os.path.basename(benchmark_dir)
+        job = read_benchmark(path,barcode)
+        if job:
+            jobs.append(job)
+    return sorted(jobs,key=lambda job: job["start"])
+
+def summarise_rules(jobs):
+    # where the time went, one row per rule, most time first
+    rules = collections.defaultdict(lambda: {"jobs":0,"seconds":0,"cpu_time":0,"max_rss_mb":0})
+    for job in jobs:
+        summary = rules[job[KEY_RULE]]
+        summary["jobs"] += 1
+        summary["seconds"] += job["seconds"] or 0
+        summary["cpu_time"] += job["cpu_time"] or 0
+        summary["max_rss_mb"] = max(summary["max_rss_mb"],job["max_rss_mb"] or 0)
+
+    rule_table = []
+    for rule in rules:
+        summary = {KEY_RULE:rule}
+        summary.update({key:round(value,2) for key,value in rules[rule].items()})
+        rule_table.append(summary)
+    return sorted(rule_table,key=lambda row: row["seconds"],reverse=True)
+
+def write_run_timeline(config,since):
+    jobs = collect_jobs(config[KEY_TEMPDIR],since)
+    first_start = min([job["start"] for job in jobs],default=since)
+    for job in jobs:
+        # seconds into the run, for the report
+        job["offset_start"] = round(job["start"] - first_start,2)
+        job["offset_end"] = round(job["end"] - first_start,2)
+
+    timeline = {
+        "started":time.strftime("%Y-%m-%d %H:%M:%S",time.localtime(first_start)),
+        "wall_time":round(max([job["end"] for job in jobs],default=first_start) - first_start,2),
+        "rules":summarise_rules(jobs),
+        "jobs":jobs
+    }
+    timeline_file = os.path.join(config[KEY_OUTDIR],RUN_TIMELINE)
+    with open(timeline_file,"w") as fw:
+        json.dump(timeline,fw,indent=1)
+    print(green("Run timeline:") + f" {timeline_file}")
+    return timeline
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+from piranha import __version__
+from piranha.utils.config import *
+
+"""
+Finding the external tools and asking them about themselves costs seconds on every run
+(`medaka tools list_models` imports tensorflow), so what was found is kept in a small json
+file for each environment. An entry is trusted while the binary it came from is still there
+and unchanged, and --refresh-tool-cache throws the file away.
+"""
+
+_tool_cache = None
+
+def tool_cache_file():
+    # keyed on the conda env (or python prefix), PATH and piranha version
+    environment = os.environ.get("CONDA_PREFIX",sys.prefix)
+    key = hashlib.sha256(f"{environment}|{os.environ.get('PATH','')}|{__version__}".encode()).hexdigest()[:16]
+    cache_home = os.environ.get("XDG_CACHE_HOME",os.path.join(os.path.expanduser("~"),".cache"))
+    return os.path.join(cache_home,VALUE_TOOL_CACHE_DIR,f"tools.{key}.json")
+
+def load_tool_cache():
+    global _tool_cache
+    if _tool_cache is None:
+        try:
+            with open(tool_cache_file(),"r") as f:
+                _tool_cache = json.load(f)
+        except (OSError,ValueError):
+            _tool_cache = {}
+    return _tool_cache
+
+def save_tool_cache():
+    # not being able to write it only means looking again next time
+    cache_file = tool_cache_file()
+    try:
+        os.makedirs(os.path.dirname(cache_file),exist_ok=True)
+        fd,tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file),suffix=".json.tmp")
+        with os.fdopen(fd,"w") as fw:
+            json.dump(_tool_cache,fw,indent=1)
+        os.replace(tmp_file,cache_file)
+    except OSError:
+        pass
+
+def refresh_tool_cache():
+    global _tool_cache
+    _tool_cache = {}
+    if os.path.exists(tool_cache_file()):
+        os.remove(tool_cache_file())
+
+def binary_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [path,stat.st_size,stat.st_mtime]
+
+def find_binary(name):
+    binaries = load_tool_cache().setdefault("binaries",{})
+    cached = binaries.get(name)
+    if cached and binary_signature(cached[0]) == cached:
+        return cached[0]
+
+    path = shutil.which(name)
+    if not path:
+        # not cached, so installing it takes effect straight away
+        return None
+    binaries[name] = binary_signature(path)
+    save_tool_cache()
+    return path
+
+def tool_output(name,args):
+    # stdout of `name args`, rerun whenever the binary changes
+    path = find_binary(name)
+    if not path:
+        return ""
+    outputs = load_tool_cache().setdefault("outputs",{})
+    command = " ".join([name] + args)
+    cached = outputs.get(command)
+    if cached and cached["binary"] == binary_signature(path):
+        return cached["stdout"]
+
+    result = subprocess.run([path] + args,stdout=subprocess.PIPE,stderr=subprocess.DEVNULL)
+    stdout = result.stdout.decode('utf-8')
+    if result.returncode == 0:
+        outputs[command] = {"binary":binary_signature(path),"stdout":stdout}
+        save_tool_cache()
+    return stdout
@@ -17,6 +17,7 @@ setup(name='piranha',
             "piranha/scripts/piranha_wg.smk",
             "piranha/scripts/consensus.smk",
             "piranha/scripts/variation.smk",
+            "piranha/scripts/single_dag.smk",
             "piranha/scripts/snipit.smk"
             ],
       package_data={"piranha":["data/*"]},